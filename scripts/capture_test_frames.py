@@ -13,6 +13,10 @@ import argparse
 from pathlib import Path
 from datetime import datetime
 
+# Add the repository root to the path so the shared JPEG writer can be imported
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.jpeg_io import write_jpeg
+
 def parse_args():
     parser = argparse.ArgumentParser(description='Capture frames from public RTSP stream')
     parser.add_argument('--output-dir', type=str, default='./test_frames', 
@@ -36,20 +40,27 @@ def main():
     print(f"Connecting to RTSP stream: {rtsp_url}")
     print(f"Saving frames to: {output_dir.absolute()}")
     
+    # Low-latency RTSP options for OpenCV's FFmpeg backend
+    os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = "rtsp_transport;tcp|buffer_size;102400|max_delay;0"
+    
     # Open RTSP stream with OpenCV
     cap = cv2.VideoCapture(rtsp_url)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Only keep the newest frame
     if not cap.isOpened():
         print("Failed to open RTSP stream with OpenCV.")
         # Try with explicit FFMPEG backend
         print("Trying with FFMPEG backend...")
-        os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = "rtsp_transport;tcp"
         cap = cv2.VideoCapture(rtsp_url, cv2.CAP_FFMPEG)
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
         if not cap.isOpened():
             print("Failed to open RTSP stream with FFMPEG backend.")
             return 1
     
     print("Successfully connected to RTSP stream.")
     
+    # Filenames share one session timestamp and differ by frame counter
+    session = datetime.now().strftime("%Y%m%d_%H%M%S")
+    
     # Capture frames
     frames_captured = 0
     while frames_captured < args.frames:
@@ -59,10 +70,9 @@ def main():
             break
         
         # Save the frame as JPG
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-        filename = f"frame_{timestamp}.jpg"
+        filename = f"frame_{session}_{frames_captured:06d}.jpg"
         filepath = output_dir / filename
-        cv2.imwrite(str(filepath), frame)
+        write_jpeg(filepath, frame)
         
         frames_captured += 1
         print(f"Captured frame {frames_captured}/{args.frames}")
@@ -12,38 +12,15 @@ import glob
 import argparse
 from pathlib import Path
 
-def create_enhanced_usd_scene(images_dir, output_file):
-    """
-    Create an enhanced USD scene from a directory of image frames
-    
-    Args:
-        images_dir: Directory containing the image frames
-        output_file: Path to save the USD scene file
-    """
-    # Find all jpg images in the directory
-    images = sorted(glob.glob(os.path.join(images_dir, "*.jpg")))
-    if not images:
-        print(f"No images found in {images_dir}")
-        return False
-        
-    print(f"Found {len(images)} frames for USD scene")
-    
-    # Create parent directory for output file if it doesn't exist
-    output_dir = os.path.dirname(output_file)
-    if output_dir:
-        os.makedirs(output_dir, exist_ok=True)
-    
-    # Start building USD scene
-    with open(output_file, 'w') as f:
-        # Write USD header
-        f.write(f"""#usda 1.0
+# Scene header up to the opening of the material binding timeSamples
+_HEADER_TMPL = """#usda 1.0
 (
     defaultPrim = "Scene"
     upAxis = "Y"
     metersPerUnit = 1
     timeCodesPerSecond = 24
     startTimeCode = 0
-    endTimeCode = {len(images) - 1}
+    endTimeCode = {end}
 )
 
 def Xform "Scene" (
@@ -65,7 +42,7 @@ def Xform "Scene" (
         # Camera animation with rotation around Y axis
         float3 xformOp:rotateXYZ.timeSamples = {{
             0: (0, 0, 0),
-            {len(images) - 1}: (0, 360, 0),
+            {end}: (0, 360, 0),
         }}
     }}
     
@@ -82,31 +59,15 @@ def Xform "Scene" (
             
             # Material binding with timeSamples for each frame
             rel material:binding.timeSamples = {{
-""")
-
-        # Add material bindings for each frame
-        for i, image_path in enumerate(images):
-            f.write(f"                {i}: </Scene/Materials/FrameMaterial_{i}>,\n")
-            
-        f.write("""            }
-        }
-    }
-    
-    def Scope "Materials"
-    {
-""")
+"""
 
-        # Add material definitions for each frame
-        for i, image_path in enumerate(images):
-            image_name = os.path.basename(image_path)
-            rel_path = f"./test_frames/{image_name}"
-            
-            f.write(f"""        def Material "FrameMaterial_{i}"
-        {{
-            token outputs:surface.connect = </Scene/Materials/FrameMaterial_{i}/PBRShader.outputs:surface>
+# Per-frame material definition, %-formatted with the material index and texture path
+_MATERIAL_TMPL = """        def Material "FrameMaterial_%(i)d"
+        {
+            token outputs:surface.connect = </Scene/Materials/FrameMaterial_%(i)d/PBRShader.outputs:surface>
             
             def Shader "PBRShader"
-            {{
+            {
                 uniform token info:id = "UsdPreviewSurface"
                 color3f inputs:diffuseColor = (1, 1, 1)
                 float inputs:roughness = 0.4
@@ -114,23 +75,23 @@ def Xform "Scene" (
                 token outputs:surface
                 
                 # Connect texture to diffuseColor
-                color3f inputs:diffuseColor.connect = </Scene/Materials/FrameMaterial_{i}/TextureReader.outputs:rgb>
-            }}
+                color3f inputs:diffuseColor.connect = </Scene/Materials/FrameMaterial_%(i)d/TextureReader.outputs:rgb>
+            }
             
             def Shader "TextureReader"
-            {{
+            {
                 uniform token info:id = "UsdUVTexture"
-                asset inputs:file = @{rel_path}@
+                asset inputs:file = @%(rel_path)s@
                 float2 inputs:st.connect = </Scene/ImageSequence/ImagePlane.inputs:st>
                 token inputs:wrapS = "repeat"
                 token inputs:wrapT = "repeat"
                 float3 outputs:rgb
-            }}
-        }}
-""")
+            }
+        }
+"""
 
-        # Add 3D geometry
-        f.write(f"""    }}
+# Closes the Materials scope and adds the 3D geometry
+_TRAILER_TMPL = """    }}
     
     # Representation of the 3D geometry from synthetic frames
     def Xform "Geometry"
@@ -144,7 +105,7 @@ def Xform "Scene" (
             float3 xformOp:scale = (1, 1, 1)
             float3 xformOp:rotateXYZ.timeSamples = {{
                 0: (0, 0, 0),
-                {len(images) - 1}: (0, 360, 0),
+                {end}: (0, 360, 0),
             }}
             uniform token[] xformOpOrder = ["xformOp:translate", "xformOp:rotateXYZ", "xformOp:scale"]
             color3f[] primvars:displayColor = [(0, 1, 1)]
@@ -173,8 +134,62 @@ def Xform "Scene" (
         }}
     }}
 }}
+"""
+
+def create_enhanced_usd_scene(images_dir, output_file):
+    """
+    Create an enhanced USD scene from a directory of image frames
+    
+    Args:
+        images_dir: Directory containing the image frames
+        output_file: Path to save the USD scene file
+    """
+    # Find all jpg images in the directory
+    images = sorted(glob.glob(os.path.join(images_dir, "*.jpg")))
+    if not images:
+        print(f"No images found in {images_dir}")
+        return False
+        
+    print(f"Found {len(images)} frames for USD scene")
+    
+    # Create parent directory for output file if it doesn't exist
+    output_dir = os.path.dirname(output_file)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    
+    # Build the whole document in memory and write it with a single call
+    parts = []
+    
+    # USD header
+    parts.append(_HEADER_TMPL.format(end=len(images) - 1))
+
+    # Assign one material per distinct texture so repeated frames share it
+    rel_paths = [f"./test_frames/{os.path.basename(image_path)}" for image_path in images]
+    material_index = {}
+    for rel_path in rel_paths:
+        material_index.setdefault(rel_path, len(material_index))
+    
+    # Add material bindings for each frame
+    for i, rel_path in enumerate(rel_paths):
+        parts.append(f"                {i}: </Scene/Materials/FrameMaterial_{material_index[rel_path]}>,\n")
+        
+    parts.append("""            }
+        }
+    }
+    
+    def Scope "Materials"
+    {
 """)
 
+    # Add material definitions for each distinct texture
+    for rel_path, i in material_index.items():
+        parts.append(_MATERIAL_TMPL % {'i': i, 'rel_path': rel_path})
+
+    # Add 3D geometry
+    parts.append(_TRAILER_TMPL.format(end=len(images) - 1))
+
+    Path(output_file).write_text("".join(parts), encoding="utf-8", newline="\n")
+
     print(f"Successfully created enhanced USD scene at {output_file}")
     return True
 
@@ -14,6 +14,10 @@ import argparse
 from pathlib import Path
 from datetime import datetime
 
+# Add the repository root to the path so the shared JPEG writer can be imported
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.jpeg_io import write_jpeg
+
 def parse_args():
     parser = argparse.ArgumentParser(description='Generate synthetic test frames')
     parser.add_argument('--output-dir', type=str, default='./test_frames',
@@ -28,16 +32,100 @@ def parse_args():
                       help='Random seed')
     return parser.parse_args()
 
-def draw_3d_scene(img, frame_idx, total_frames, width, height):
+# JIT-compile the projection math when Numba is installed
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        """Fallback that leaves the decorated function as plain Python"""
+        def decorator(func):
+            return func
+        return decorator
+
+# Random generator for texture patches, reseeded from --seed in main()
+_RNG = np.random.default_rng()
+
+# Number of white texture patches drawn per frame
+TEXTURE_PATCHES = 10
+
+# Unit cube corners, scaled by the scene's base size
+CUBE_POINTS = np.array([
+    [-1, -1, -1],  # 0: bottom-back-left
+    [1, -1, -1],   # 1: bottom-back-right
+    [1, 1, -1],    # 2: bottom-front-right
+    [-1, 1, -1],   # 3: bottom-front-left
+    [-1, -1, 1],   # 4: top-back-left
+    [1, -1, 1],    # 5: top-back-right
+    [1, 1, 1],     # 6: top-front-right
+    [-1, 1, 1]     # 7: top-front-left
+])
+
+# Cube edges as open polylines through corner indices
+CUBE_PATHS = (
+    [0, 1, 2, 3, 0],                   # Bottom face
+    [4, 5, 6, 7, 4],                   # Top face
+    [0, 4], [1, 5], [2, 6], [3, 7]     # Connecting edges
+)
+
+# Pyramid edges as open polylines through apex (0) and base corner (1-4) indices
+PYRAMID_PATHS = (
+    [0, 1], [0, 2], [0, 3], [0, 4],    # Apex to base corners
+    [1, 2, 3, 4, 1]                    # Base
+)
+
+def make_background(width, height):
+    """Create the vertical background gradient shared by all frames"""
+    background = np.empty((height, width, 3), dtype=np.uint8)
+    background[:, :, 0] = (np.arange(height) * 255 // height)[:, None]
+    background[:, :, 1] = 255 - background[:, :, 0]
+    background[:, :, 2] = 128
+    return background
+
+@njit(cache=True)
+def _project_cube(camera_x, center_x, center_y, base_size):
+    """Project the cube corners to integer screen coordinates"""
+    points_3d = CUBE_POINTS * base_size
+    
+    # Apply camera position offset and push away from camera
+    x = points_3d[:, 0] - camera_x
+    z = points_3d[:, 2] + 500
+    
+    # Simple perspective projection
+    factor = 1000 / (1000 + z)
+    points_2d = np.empty((points_3d.shape[0], 2), dtype=np.int32)
+    points_2d[:, 0] = (center_x + x * factor).astype(np.int32)
+    points_2d[:, 1] = (center_y + points_3d[:, 1] * factor).astype(np.int32)
+    return points_2d
+
+@njit(cache=True)
+def _pyramid_coords(perspective_factor, center_x, center_y, base_size):
+    """Compute the pyramid apex followed by its four base corners"""
+    # Half extent of the base on screen, shared by all four corners
+    offset = base_size * perspective_factor
+    left = int(center_x - offset)
+    right = int(center_x + offset)
+    top = int(center_y - offset)
+    bottom = int(center_y + offset)
+    
+    coords = np.empty((5, 2), dtype=np.int32)
+    coords[0, 0] = int(center_x)
+    coords[0, 1] = int(center_y - base_size * 2 * perspective_factor)
+    coords[1, 0], coords[1, 1] = left, bottom
+    coords[2, 0], coords[2, 1] = right, bottom
+    coords[3, 0], coords[3, 1] = right, top
+    coords[4, 0], coords[4, 1] = left, top
+    return coords
+
+def draw_3d_scene(img, frame_idx, total_frames, width, height, background=None):
     """Draw a simple 3D scene with varying camera angle"""
     # Set up scene parameters
     center_x, center_y = width // 2, height // 2
     base_size = min(width, height) // 4
     
-    # Create background gradient
-    for y in range(height):
-        color = int(y * 255 / height)
-        cv2.line(img, (0, y), (width, y), (color, 255-color, 128), 1)
+    # Fill background gradient
+    if background is None:
+        background = make_background(width, height)
+    img[:] = background
     
     # Calculate camera position based on frame index (circular motion)
     angle = 2 * np.pi * frame_idx / total_frames
@@ -45,60 +133,13 @@ def draw_3d_scene(img, frame_idx, total_frames, width, height):
     camera_z = np.cos(angle) * 100
     perspective_factor = 1000 / (1000 + camera_z)
     
-    # Draw cube
-    points_3d = np.array([
-        [-base_size, -base_size, -base_size],  # 0: bottom-back-left
-        [base_size, -base_size, -base_size],   # 1: bottom-back-right
-        [base_size, base_size, -base_size],    # 2: bottom-front-right
-        [-base_size, base_size, -base_size],   # 3: bottom-front-left
-        [-base_size, -base_size, base_size],   # 4: top-back-left
-        [base_size, -base_size, base_size],    # 5: top-back-right
-        [base_size, base_size, base_size],     # 6: top-front-right
-        [-base_size, base_size, base_size]     # 7: top-front-left
-    ])
-    
-    # Project 3D points to 2D screen
-    points_2d = []
-    for point in points_3d:
-        x, y, z = point
-        # Apply camera position offset
-        x = x - camera_x
-        z = z + 500  # Push away from camera
-        
-        # Simple perspective projection
-        factor = 1000 / (1000 + z)
-        screen_x = int(center_x + x * factor)
-        screen_y = int(center_y + y * factor)
-        points_2d.append((screen_x, screen_y))
-    
     # Draw cube edges
-    edges = [
-        (0, 1), (1, 2), (2, 3), (3, 0),  # Bottom face
-        (4, 5), (5, 6), (6, 7), (7, 4),  # Top face
-        (0, 4), (1, 5), (2, 6), (3, 7)   # Connecting edges
-    ]
-    
-    for edge in edges:
-        start_point = points_2d[edge[0]]
-        end_point = points_2d[edge[1]]
-        cv2.line(img, start_point, end_point, (0, 255, 255), 2)
-    
-    # Draw a pyramid
-    pyramid_height = base_size * 2
-    pyramid_top = (int(center_x), int(center_y - pyramid_height * perspective_factor))
-    pyramid_base = [
-        (int(center_x - base_size * perspective_factor), int(center_y + base_size * perspective_factor)),
-        (int(center_x + base_size * perspective_factor), int(center_y + base_size * perspective_factor)),
-        (int(center_x + base_size * perspective_factor), int(center_y - base_size * perspective_factor)),
-        (int(center_x - base_size * perspective_factor), int(center_y - base_size * perspective_factor))
-    ]
+    points_2d = _project_cube(camera_x, center_x, center_y, base_size)
+    cv2.polylines(img, [points_2d[path] for path in CUBE_PATHS], False, (0, 255, 255), 2)
     
     # Draw pyramid edges
-    for point in pyramid_base:
-        cv2.line(img, pyramid_top, point, (255, 0, 0), 2)
-    
-    for i in range(4):
-        cv2.line(img, pyramid_base[i], pyramid_base[(i + 1) % 4], (255, 0, 0), 2)
+    coords = _pyramid_coords(perspective_factor, center_x, center_y, base_size)
+    cv2.polylines(img, [coords[path] for path in PYRAMID_PATHS], False, (255, 0, 0), 2)
     
     # Draw a sphere (circle from this view)
     sphere_x = center_x - 200 + camera_x * 0.5
@@ -107,11 +148,12 @@ def draw_3d_scene(img, frame_idx, total_frames, width, height):
     cv2.circle(img, (int(sphere_x), sphere_y), sphere_radius, (0, 0, 255), -1)
     
     # Add some texture patterns for better feature detection
-    for i in range(10):
-        x = np.random.randint(0, width)
-        y = np.random.randint(0, height)
-        size = np.random.randint(5, 30)
-        cv2.rectangle(img, (x, y), (x + size, y + size), (255, 255, 255), -1)
+    xs = _RNG.integers(0, width, TEXTURE_PATCHES)
+    ys = _RNG.integers(0, height, TEXTURE_PATCHES)
+    sizes = _RNG.integers(5, 30, TEXTURE_PATCHES)
+    for x, y, size in zip(xs, ys, sizes):
+        # Filled square including its end corner, like cv2.rectangle
+        img[y:y + size + 1, x:x + size + 1] = 255
     
     # Add frame information
     cv2.putText(img, f"Frame: {frame_idx+1}/{total_frames}", (10, 30),
@@ -120,10 +162,11 @@ def draw_3d_scene(img, frame_idx, total_frames, width, height):
     return img
 
 def main():
+    global _RNG
     args = parse_args()
     
     # Set random seed for reproducibility
-    np.random.seed(args.seed)
+    _RNG = np.random.default_rng(args.seed)
     
     # Create output directory
     output_dir = Path(args.output_dir)
@@ -132,19 +175,24 @@ def main():
     print(f"Generating {args.frames} synthetic test frames...")
     print(f"Saving frames to: {output_dir.absolute()}")
     
+    # The background gradient is identical for every frame
+    background = make_background(args.width, args.height)
+    
+    # Reuse one frame buffer; draw_3d_scene overwrites every pixel
+    img = np.empty((args.height, args.width, 3), dtype=np.uint8)
+    
+    # Filenames share one session timestamp and differ by frame index
+    session = datetime.now().strftime("%Y%m%d_%H%M%S")
+    
     # Generate frames
     for i in range(args.frames):
-        # Create blank image
-        img = np.zeros((args.height, args.width, 3), dtype=np.uint8)
-        
         # Draw 3D scene with varying camera angle
-        draw_3d_scene(img, i, args.frames, args.width, args.height)
+        draw_3d_scene(img, i, args.frames, args.width, args.height, background)
         
         # Save the frame as JPG
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-        filename = f"frame_{i:03d}_{timestamp}.jpg"
+        filename = f"frame_{i:03d}_{session}.jpg"
         filepath = output_dir / filename
-        cv2.imwrite(str(filepath), img)
+        write_jpeg(filepath, img)
         
         print(f"Generated frame {i+1}/{args.frames}")
     
@@ -71,7 +71,7 @@ echo "Saving images to: $IMAGES_DIR"
 echo "Using config: $CONFIG_FILE"
 echo ""
 
-if python3 src/capture.py --config "$CONFIG_FILE"; then
+if python3 -m src.capture --config "$CONFIG_FILE"; then
     echo "Frame capture completed successfully."
 else
     handle_error "Frame capture failed."
@@ -90,7 +90,7 @@ echo "Input images: $IMAGES_DIR"
 echo "Output directory: $COLMAP_OUT_DIR"
 echo ""
 
-if python3 src/photogrammetry.py --image-dir "$IMAGES_DIR" --output-dir "$COLMAP_OUT_DIR"; then
+if python3 -m src.photogrammetry --image-dir "$IMAGES_DIR" --output-dir "$COLMAP_OUT_DIR"; then
     echo "Photogrammetry completed successfully."
 else
     handle_error "Photogrammetry processing failed."
@@ -107,7 +107,7 @@ echo "Using point cloud: ${COLMAP_OUT_DIR}/dense/fused.ply"
 echo "Output USD file: $USD_OUTPUT"
 echo ""
 
-if python3 src/usd_builder.py --image-dir "$IMAGES_DIR" --output "$USD_OUTPUT" --point-cloud "${COLMAP_OUT_DIR}/dense/fused.ply"; then
+if python3 -m src.usd_builder --image-dir "$IMAGES_DIR" --output "$USD_OUTPUT" --point-cloud "${COLMAP_OUT_DIR}/dense/fused.ply"; then
     echo "USD scene generation completed successfully."
 else
     handle_error "USD scene generation failed."
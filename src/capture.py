@@ -8,16 +8,24 @@ and captures frames at regular intervals.
 
 import os
 import sys
+import copy
 import time
+import queue
 import logging
+import logging.handlers
 import yaml
 import cv2
 import numpy as np
 import subprocess
-from datetime import datetime
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from typing import Dict, List, Optional, Union, Any
 
+# Local imports
+from src.jpeg_io import write_jpeg
+
 # Try to import zeep for ONVIF
 try:
     from onvif import ONVIFCamera
@@ -27,37 +35,56 @@ except ImportError:
     HAS_ONVIF = False
     logging.warning("onvif-zeep package not found. ONVIF discovery disabled.")
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('camera_capture.log')
-    ]
-)
-
 logger = logging.getLogger('onvif_capture')
 
+# Low-latency options passed to OpenCV's FFmpeg backend for RTSP streams
+FFMPEG_CAPTURE_OPTIONS = "rtsp_transport;tcp|buffer_size;102400|max_delay;0"
+
+# Use libyaml's C parser when PyYAML was built with it
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# Parsed config files keyed by (absolute path, mtime_ns, size, inode)
+_CONFIG_CACHE: Dict[tuple, Any] = {}
+
+# Minimum source-to-target frame rate ratio at which ffmpeg skips non-reference frames
+SKIP_NONREF_RATIO = 10
+
 class CameraCapture:
     """Handles ONVIF camera discovery and frame capture"""
     
-    def __init__(self, config_path: str = 'config.yaml'):
+    def __init__(self, config_path: Union[str, Path, Dict] = 'config.yaml'):
         """
         Initialize the camera capture system
         
         Args:
-            config_path: Path to the YAML configuration file
+            config_path: Path to the YAML configuration file, or an already
+                parsed configuration dict
         """
-        self.config = self._load_config(config_path)
+        if isinstance(config_path, dict):
+            self.config = config_path
+        else:
+            self.config = self._load_config(config_path)
         self.cameras = self.config.get('cameras', [])
         self.settings = self.config.get('settings', {})
         self.capture_settings = self.settings.get('capture', {})
         self.output_dir = self._prepare_output_dir()
         self.retry_delay = 5  # seconds
         self.max_retries = 5
+        self.ffmpeg_timeout_margin = 30  # seconds
+        self.write_queue_size = 4  # frames buffered for the writer thread
+        self.ffmpeg_stderr_lines = 100  # ffmpeg output lines kept for error reports
+        
+        # ONVIF clients and discovered RTSP URIs keyed by (host, port, username)
+        self._onvif_cache: Dict[tuple, Any] = {}
+        self._rtsp_cache: Dict[tuple, str] = {}
+        
+        # Captures run in worker threads, which never see Ctrl-C; the main
+        # thread sets this event through stop() and workers check it
+        self._stop_event = threading.Event()
+        self._ffmpeg_processes = set()
+        self._ffmpeg_lock = threading.Lock()
         
-    def _load_config(self, config_path: str) -> Dict:
+    def _load_config(self, config_path: Union[str, Path]) -> Dict:
         """
         Load YAML configuration
         
@@ -68,8 +95,16 @@ class CameraCapture:
             Dict containing configuration values
         """
         try:
-            with open(config_path, 'r') as file:
-                return yaml.safe_load(file)
+            # Reuse the parsed config while the file is unchanged
+            st = os.stat(config_path)
+            key = (os.path.abspath(config_path), st.st_mtime_ns, st.st_size, st.st_ino)
+            config = _CONFIG_CACHE.get(key)
+            if config is None:
+                with open(config_path, 'rb') as file:
+                    config = yaml.load(file, Loader=_YAML_LOADER)
+                _CONFIG_CACHE[key] = config
+            # Callers may modify their config, so each gets its own copy
+            return copy.deepcopy(config)
         except Exception as e:
             logger.error(f"Failed to load config file: {e}")
             sys.exit(1)
@@ -88,6 +123,23 @@ class CameraCapture:
         logger.info(f"Saving frames to {path.absolute()}")
         return path
     
+    def _open_stream(self, rtsp_uri: str) -> cv2.VideoCapture:
+        """
+        Open an RTSP stream with the FFMPEG backend and a single-frame buffer
+        
+        Args:
+            rtsp_uri: RTSP URI to open
+            
+        Returns:
+            The opened cv2.VideoCapture
+        """
+        os.environ.setdefault("OPENCV_FFMPEG_CAPTURE_OPTIONS", FFMPEG_CAPTURE_OPTIONS)
+        cap = cv2.VideoCapture(rtsp_uri, cv2.CAP_FFMPEG)
+        
+        # Keep only the newest frame queued so grabs never return stale frames
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return cap
+    
     def get_rtsp_uri(self, camera: Dict) -> str:
         """
         Get RTSP stream URI from camera
@@ -109,15 +161,24 @@ class CameraCapture:
                        f"Missing ONVIF library or required parameters")
             return ""
         
+        # Reuse a URI discovered earlier for the same camera
+        cache_key = (camera['host'], camera['onvif_port'], camera['username'])
+        if cache_key in self._rtsp_cache:
+            logger.info(f"Using cached RTSP URI for camera '{camera.get('name', 'unnamed')}'")
+            return self._rtsp_cache[cache_key]
+        
         # Try to get RTSP URI using ONVIF
         try:
             logger.info(f"Discovering RTSP URI for camera '{camera.get('name', 'unnamed')}' via ONVIF")
-            mycam = ONVIFCamera(
-                camera['host'], 
-                camera['onvif_port'], 
-                camera['username'], 
-                camera['password']
-            )
+            mycam = self._onvif_cache.get(cache_key)
+            if mycam is None:
+                mycam = ONVIFCamera(
+                    camera['host'], 
+                    camera['onvif_port'], 
+                    camera['username'], 
+                    camera['password']
+                )
+                self._onvif_cache[cache_key] = mycam
             
             # Create media service
             media_service = mycam.create_media_service()
@@ -134,6 +195,7 @@ class CameraCapture:
                 # Return the URI
                 if hasattr(uri, 'Uri') and uri.Uri:
                     logger.info(f"Successfully discovered RTSP URI via ONVIF")
+                    self._rtsp_cache[cache_key] = uri.Uri
                     return uri.Uri
             
             logger.warning(f"No stream profiles found for camera '{camera.get('name', 'unnamed')}'")
@@ -167,7 +229,7 @@ class CameraCapture:
         fps = 1  # 1 frame per second
         
         # Open video capture with FFMPEG backend
-        cap = cv2.VideoCapture(rtsp_uri, cv2.CAP_FFMPEG)
+        cap = self._open_stream(rtsp_uri)
         
         if not cap.isOpened():
             logger.error(f"Failed to open video stream for camera '{camera_name}'")
@@ -175,6 +237,11 @@ class CameraCapture:
         
         logger.info(f"Successfully opened stream for camera '{camera_name}'")
         
+        # Log the stream codec; the gain from skipping retrieve() is codec-dependent
+        fourcc = int(cap.get(cv2.CAP_PROP_FOURCC) or 0)
+        codec = "".join(chr((fourcc >> (8 * i)) & 0xFF) for i in range(4)).strip('\x00')
+        logger.info(f"Stream codec for camera '{camera_name}': {codec or 'unknown'}")
+        
         # Calculate frame delay based on source FPS and our target FPS
         source_fps = cap.get(cv2.CAP_PROP_FPS) or 30  # Assume 30 if we can't detect
         frame_delay = 1.0 / fps  # in seconds
@@ -182,23 +249,31 @@ class CameraCapture:
         frames_captured = 0
         frame_count = 0
         retry_count = 0
-        last_frame_time = time.time()
+        
+        # Pace grabs against a fixed monotonic schedule so read latency doesn't accumulate
+        schedule_start = time.monotonic()
+        grabs_scheduled = 0
+        
+        # Hand frames to a writer thread so slow disks don't stall the stream
+        write_queue = queue.Queue(maxsize=self.write_queue_size)
+        writer = threading.Thread(target=self._jpeg_writer, args=(write_queue,), daemon=True)
+        writer.start()
         
         try:
-            while frames_captured < total_frames:
-                # Respect frame rate
-                current_time = time.time()
-                time_elapsed = current_time - last_frame_time
+            while frames_captured < total_frames and not self._stop_event.is_set():
+                # Respect frame rate, waking early if the capture is stopped
+                grabs_scheduled += 1
+                slack = schedule_start + grabs_scheduled * frame_delay - time.monotonic()
                 
-                if time_elapsed < frame_delay:
-                    time.sleep(frame_delay - time_elapsed)
+                if slack > 0 and self._stop_event.wait(slack):
+                    break
                 
-                # Capture frame
-                ret, frame = cap.read()
+                # Grab the next packet without decoding it
+                ret = cap.grab()
                 
                 if not ret:
                     retry_count += 1
-                    logger.warning(f"Failed to read frame {frame_count}. Retry {retry_count}/{self.max_retries}")
+                    logger.warning(f"Failed to grab frame {frame_count}. Retry {retry_count}/{self.max_retries}")
                     
                     if retry_count >= self.max_retries:
                         logger.error(f"Max retries reached. Stopping capture for camera '{camera_name}'")
@@ -206,43 +281,78 @@ class CameraCapture:
                     
                     # Try to reopen the stream
                     cap.release()
-                    time.sleep(self.retry_delay)
-                    cap = cv2.VideoCapture(rtsp_uri, cv2.CAP_FFMPEG)
+                    if self._stop_event.wait(self.retry_delay):
+                        break
+                    cap = self._open_stream(rtsp_uri)
                     
                     if not cap.isOpened():
                         logger.error(f"Failed to reopen stream for camera '{camera_name}'")
                         break
                     
+                    # Restart the schedule rather than bursting to catch up
+                    schedule_start = time.monotonic()
+                    grabs_scheduled = 0
                     continue
                 
                 # Reset retry counter on successful frame
                 retry_count = 0
                 frame_count += 1
                 
-                # Capture every Nth frame based on frame_interval
+                # Decode and save only every Nth frame based on frame_interval
                 if frame_count % frame_interval == 0:
-                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                    ret, frame = cap.retrieve()
+                    
+                    if not ret:
+                        logger.warning(f"Failed to decode frame {frame_count} for camera '{camera_name}'")
+                        continue
+                    
                     filename = f"{camera_name}_img_{frames_captured:06d}.jpg"
                     filepath = self.output_dir / filename
                     
-                    cv2.imwrite(str(filepath), frame)
+                    # Drop the new frame rather than block the reader when the writer lags
+                    try:
+                        write_queue.put_nowait((filepath, frame))
+                    except queue.Full:
+                        logger.warning(f"Write queue full, dropping frame {frame_count} for camera '{camera_name}'")
+                        continue
+                    
                     frames_captured += 1
                     
                     logger.info(f"Captured frame {frames_captured}/{total_frames} for camera '{camera_name}'")
                 
-                last_frame_time = time.time()
-                
-            logger.info(f"Completed capturing {frames_captured} frames for camera '{camera_name}'")
+            if self._stop_event.is_set():
+                logger.info(f"Capture stopped for camera '{camera_name}' after {frames_captured} frames")
+            else:
+                logger.info(f"Completed capturing {frames_captured} frames for camera '{camera_name}'")
             return frames_captured > 0
             
-        except KeyboardInterrupt:
-            logger.info("Capture interrupted by user")
-            return frames_captured > 0
         except Exception as e:
             logger.error(f"Error during OpenCV capture: {e}")
             return False
         finally:
             cap.release()
+            
+            # Let the writer flush queued frames before returning
+            write_queue.put(None)
+            writer.join()
+    
+    def _jpeg_writer(self, write_queue: queue.Queue):
+        """
+        Write queued frames to disk until a None sentinel is received
+        
+        Args:
+            write_queue: Queue of (filepath, frame) tuples
+        """
+        while True:
+            item = write_queue.get()
+            if item is None:
+                break
+            
+            filepath, frame = item
+            try:
+                write_jpeg(filepath, frame)
+            except Exception as e:
+                logger.error(f"Failed to write frame {filepath}: {e}")
     
     def capture_frames_ffmpeg(self, rtsp_uri: str, camera_name: str) -> bool:
         """
@@ -263,6 +373,8 @@ class CameraCapture:
         frame_interval = self.capture_settings.get('frame_interval', 5)  # frames
         total_frames = self.capture_settings.get('total_frames', 100)  # total frames to capture
         fps = 1  # 1 frame per second
+        source_fps = 30  # Assumed source rate, the stream isn't probed here
+        hwaccel = self.capture_settings.get('hwaccel', 'auto')  # ffmpeg decode acceleration
         
         # Prepare output filename pattern
         output_pattern = str(self.output_dir / f"{camera_name}_img_%06d.jpg")
@@ -270,31 +382,73 @@ class CameraCapture:
         # Build ffmpeg command
         cmd = [
             'ffmpeg',
+            '-fflags', 'nobuffer',     # Don't buffer input packets
+            '-flags', 'low_delay',     # Low-latency decoding
+            '-rtsp_transport', 'tcp',  # Use TCP for RTSP
+        ]
+        
+        # When most frames are dropped anyway, don't decode non-reference frames
+        if frame_interval * source_fps >= SKIP_NONREF_RATIO * fps:
+            cmd += ['-skip_frame', 'nonref']
+        
+        # Decode on the GPU when available; frames are downloaded for the fps filter
+        if hwaccel:
+            cmd += ['-hwaccel', str(hwaccel)]
+        
+        cmd += [
             '-i', rtsp_uri,            # Input URI
-            '-r', str(fps),            # Output frame rate
-            '-vf', f'select=not(mod(n\\,{frame_interval}))',  # Select every Nth frame
+            '-an', '-sn',              # Ignore audio and subtitle streams
+            '-vf', f'fps={fps}',       # Resample to the target frame rate
+            '-vsync', 'vfr',           # Don't duplicate frames to fill gaps
             '-frames:v', str(total_frames),  # Limit total frames
-            '-q:v', '1',               # Quality (1 = highest)
-            '-update', '1',            # Overwrite existing files
+            '-t', str((total_frames + 1) / fps),  # Stop reading once enough time has passed
+            '-q:v', '2',               # JPEG quality (2 = near highest)
             output_pattern             # Output pattern
         ]
         
+        # Expected capture duration plus a margin before a stalled stream is killed
+        timeout = total_frames / fps + self.ffmpeg_timeout_margin
+        
         logger.info(f"Starting ffmpeg capture for camera '{camera_name}'")
         
         try:
             # Execute ffmpeg command
             process = subprocess.Popen(
                 cmd, 
-                stdout=subprocess.PIPE, 
+                stdout=subprocess.DEVNULL, 
                 stderr=subprocess.PIPE,
-                universal_newlines=True
+                bufsize=1,
+                text=True
             )
             
-            # Monitor the process
-            stdout, stderr = process.communicate()
+            # Register the process so stop() can terminate it from the main thread
+            with self._ffmpeg_lock:
+                self._ffmpeg_processes.add(process)
+                if self._stop_event.is_set():
+                    process.terminate()
+            
+            # Kill ffmpeg if it hasn't finished within the timeout
+            watchdog = threading.Timer(timeout, process.kill)
+            watchdog.start()
+            
+            # Monitor the process by streaming its status output, keeping only the tail
+            stderr_tail = deque(maxlen=self.ffmpeg_stderr_lines)
+            try:
+                for line in process.stderr:
+                    stderr_tail.append(line)
+                process.wait()
+            finally:
+                watchdog.cancel()
+                with self._ffmpeg_lock:
+                    self._ffmpeg_processes.discard(process)
+            
+            if self._stop_event.is_set():
+                logger.info(f"ffmpeg capture stopped for camera '{camera_name}'")
+                return False
             
             if process.returncode != 0:
-                logger.error(f"ffmpeg failed with return code {process.returncode}: {stderr}")
+                stderr = "".join(stderr_tail)
+                logger.error(f"ffmpeg failed with return code {process.returncode}:\n{stderr}")
                 return False
             
             logger.info(f"Successfully captured frames using ffmpeg for camera '{camera_name}'")
@@ -307,8 +461,61 @@ class CameraCapture:
             logger.error(f"Error during ffmpeg capture: {e}")
             return False
     
+    def _capture_camera(self, rtsp_uri: str, camera_name: str) -> bool:
+        """
+        Capture frames from a single camera, falling back to ffmpeg if OpenCV fails
+        
+        Args:
+            rtsp_uri: RTSP URI to capture from
+            camera_name: Name of the camera for logging
+            
+        Returns:
+            True if any capture method succeeded, False otherwise
+        """
+        # Try OpenCV first
+        logger.info(f"Attempting to capture frames using OpenCV for camera '{camera_name}'")
+        opencv_success = self.capture_frames_opencv(rtsp_uri, camera_name)
+        
+        if opencv_success:
+            logger.info(f"Successfully captured frames using OpenCV for camera '{camera_name}'")
+            return True
+        
+        # A stopped capture doesn't fall back to ffmpeg
+        if self._stop_event.is_set():
+            return False
+        
+        # If OpenCV fails, try ffmpeg
+        logger.warning(f"OpenCV capture failed for camera '{camera_name}'. Trying ffmpeg...")
+        ffmpeg_success = self.capture_frames_ffmpeg(rtsp_uri, camera_name)
+        
+        if not ffmpeg_success:
+            logger.error(f"All capture methods failed for camera '{camera_name}'")
+            return False
+        
+        logger.info(f"Successfully captured frames using ffmpeg for camera '{camera_name}'")
+        return True
+    
+    def stop(self):
+        """
+        Stop all running captures
+        
+        Safe to call from any thread. OpenCV captures return after their
+        current frame and running ffmpeg processes are terminated.
+        """
+        self._stop_event.set()
+        with self._ffmpeg_lock:
+            for process in self._ffmpeg_processes:
+                process.terminate()
+    
     def capture_all_cameras(self):
-        """Capture frames from all configured cameras"""
+        """
+        Capture frames from all configured cameras concurrently
+        
+        Ctrl-C in the calling thread stops every camera's capture, waits for
+        the workers to finish and re-raises the KeyboardInterrupt.
+        """
+        self._stop_event.clear()
+        jobs = []
         for camera in self.cameras:
             camera_name = camera.get('name', 'unnamed')
             logger.info(f"Processing camera '{camera_name}'")
@@ -320,24 +527,46 @@ class CameraCapture:
                 logger.error(f"No RTSP URI available for camera '{camera_name}'. Skipping.")
                 continue
             
-            # Try OpenCV first
-            logger.info(f"Attempting to capture frames using OpenCV for camera '{camera_name}'")
-            opencv_success = self.capture_frames_opencv(rtsp_uri, camera_name)
+            jobs.append((rtsp_uri, camera_name))
+        
+        if not jobs:
+            return
+        
+        # Captures are dominated by network I/O, so one thread per camera scales well
+        max_workers = min(len(jobs), (os.cpu_count() or 1) * 2)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(self._capture_camera, rtsp_uri, camera_name): camera_name
+                for rtsp_uri, camera_name in jobs
+            }
             
-            # If OpenCV fails, try ffmpeg
-            if not opencv_success:
-                logger.warning(f"OpenCV capture failed for camera '{camera_name}'. Trying ffmpeg...")
-                ffmpeg_success = self.capture_frames_ffmpeg(rtsp_uri, camera_name)
-                
-                if not ffmpeg_success:
-                    logger.error(f"All capture methods failed for camera '{camera_name}'")
-                else:
-                    logger.info(f"Successfully captured frames using ffmpeg for camera '{camera_name}'")
-            else:
-                logger.info(f"Successfully captured frames using OpenCV for camera '{camera_name}'")
+            try:
+                for future in as_completed(futures):
+                    camera_name = futures[future]
+                    try:
+                        future.result()
+                    except Exception as e:
+                        logger.error(f"Capture failed for camera '{camera_name}': {e}")
+            except KeyboardInterrupt:
+                # Only this thread receives Ctrl-C; the executor then waits for the stopped workers
+                logger.info("Capture interrupted by user, stopping all cameras")
+                self.stop()
+                raise
 
 def main():
     """Main entry point"""
+    # Configure logging here rather than at import, so importing the module opens no log file
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.StreamHandler(),
+            logging.handlers.RotatingFileHandler('camera_capture.log', maxBytes=10 * 1024 * 1024, backupCount=3)
+        ],
+        # Replace handlers that imported modules may have installed
+        force=True
+    )
+    
     try:
         logger.info("Starting ONVIF camera capture")
         capture = CameraCapture('config.yaml')
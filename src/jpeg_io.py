@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+JPEG Writer
+
+Encodes frames as JPEG in memory and writes them with a single file
+descriptor. Shared by the capture module and the test frame scripts.
+"""
+
+import os
+from pathlib import Path
+from typing import Union
+
+import cv2
+import numpy as np
+
+# Try to import PyTurboJPEG for SIMD-accelerated JPEG encoding
+try:
+    from turbojpeg import TurboJPEG, TJSAMP_420
+    _TURBO_JPEG = TurboJPEG()
+    HAS_TURBOJPEG = True
+except (ImportError, OSError, RuntimeError):
+    # Missing package or libturbojpeg shared library, fall back to OpenCV
+    _TURBO_JPEG = None
+    HAS_TURBOJPEG = False
+
+# JPEG encoder settings; Huffman table optimization is skipped for speed
+JPEG_QUALITY = 90
+JPEG_PARAMS = [int(cv2.IMWRITE_JPEG_QUALITY), JPEG_QUALITY, int(cv2.IMWRITE_JPEG_OPTIMIZE), 0]
+
+def write_jpeg(filepath: Union[str, Path], frame: np.ndarray):
+    """
+    Encode a frame as JPEG in memory and write it with a single file descriptor
+    
+    Uses libjpeg-turbo through PyTurboJPEG when available, otherwise OpenCV.
+    
+    Args:
+        filepath: Destination file path
+        frame: BGR frame to encode
+    """
+    if HAS_TURBOJPEG:
+        encoded = _TURBO_JPEG.encode(frame, quality=JPEG_QUALITY, jpeg_subsample=TJSAMP_420)
+    else:
+        ok, encoded = cv2.imencode('.jpg', frame, JPEG_PARAMS)
+        if not ok:
+            raise ValueError(f"JPEG encoding failed for {filepath}")
+    
+    fd = os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        data = memoryview(encoded)
+        while data:
+            data = data[os.write(fd, data):]
+    finally:
+        os.close(fd)
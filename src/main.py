@@ -10,6 +10,7 @@ import os
 import sys
 import argparse
 import logging
+import logging.handlers
 from pathlib import Path
 
 # Local imports
@@ -17,16 +18,6 @@ from src.capture import CameraCapture
 from src.photogrammetry import ColmapWrapper
 from src.usd_builder import UsdSceneBuilder
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('onvif_to_usd.log')
-    ]
-)
-
 logger = logging.getLogger('onvif_to_usd')
 
 def parse_args():
@@ -90,6 +81,18 @@ def parse_args():
 
 def main():
     """Main entry point"""
+    # Configure logging here rather than at import, so importing the module opens no log file
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.StreamHandler(),
+            logging.handlers.RotatingFileHandler('onvif_to_usd.log', maxBytes=10 * 1024 * 1024, backupCount=3)
+        ],
+        # Replace handlers that imported modules may have installed
+        force=True
+    )
+    
     try:
         # Parse command line arguments
         args = parse_args()
@@ -11,23 +11,104 @@ import sys
 import subprocess
 import shutil
 import logging
+import logging.handlers
 import argparse
+import asyncio
+import atexit
+import math
+import random
+import re
+import sqlite3
+import struct
 import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
 from pathlib import Path
-from typing import List, Dict, Optional, Union, Tuple
+from typing import List, Dict, Optional, Union, Tuple, Callable
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('photogrammetry.log')
-    ]
-)
+import cv2
+
+# Try to import pycolmap to run COLMAP in-process
+try:
+    import pycolmap
+    HAS_PYCOLMAP = True
+except ImportError:
+    pycolmap = None
+    HAS_PYCOLMAP = False
 
 logger = logging.getLogger('photogrammetry')
 
+# Image file extensions picked up from the image directory
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# Vocabulary tree used for vocab tree matching and loop detection
+VOCAB_TREE_URL = "https://demuc.de/colmap/vocab_tree_flickr100K_words32K.bin"
+VOCAB_TREE_CACHE_DIR = Path.home() / ".cache" / "colmap"
+
+# Memory-backed filesystem for the COLMAP database when use_tmpfs is enabled
+TMPFS_DIR = Path("/dev/shm")
+
+# Supported values for the matcher option
+MATCHERS = ('auto', 'exhaustive', 'sequential', 'vocab_tree')
+
+# Mapper settings used in fast mode: earlier bundle adjustment termination,
+# and no per-point color extraction since the USD scene does not use it
+FAST_MAPPER_OPTIONS = {
+    'ba_global_function_tolerance': 1e-6,
+    'extract_colors': False,
+    'ba_local_max_num_iterations': 15,
+    'ba_global_max_refinements': 2
+}
+
+# JPEG start-of-frame markers, which carry the image size; DHT, JPG and DAC share the range
+_JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+def _read_image_size(path: Path) -> Optional[Tuple[int, int]]:
+    """
+    Read the size of a JPEG or PNG image from its header without decoding it
+    
+    Args:
+        path: Image file path
+        
+    Returns:
+        (width, height), or None if the header cannot be parsed
+    """
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(24)
+            if head[:8] == b'\x89PNG\r\n\x1a\n' and head[12:16] == b'IHDR':
+                return struct.unpack('>II', head[16:24])
+            if head[:2] != b'\xff\xd8':
+                return None
+            
+            # Walk the marker segments up to the start-of-frame
+            f.seek(2)
+            while True:
+                marker = f.read(2)
+                if len(marker) < 2 or marker[0] != 0xFF:
+                    return None
+                if marker[1] == 0xFF:
+                    # Fill byte before the marker code
+                    f.seek(-1, os.SEEK_CUR)
+                    continue
+                if marker[1] == 0x01 or 0xD0 <= marker[1] <= 0xD8:
+                    # Standalone markers have no length field
+                    continue
+                segment = f.read(2)
+                if len(segment) < 2:
+                    return None
+                length = struct.unpack('>H', segment)[0]
+                if marker[1] in _JPEG_SOF_MARKERS:
+                    frame = f.read(5)
+                    if len(frame) < 5:
+                        return None
+                    height, width = struct.unpack('>HH', frame[1:5])
+                    return (width, height) if width and height else None
+                f.seek(length - 2, os.SEEK_CUR)
+    except OSError:
+        return None
+
 class ColmapWrapper:
     """COLMAP photogrammetry pipeline wrapper"""
     
@@ -36,7 +117,18 @@ class ColmapWrapper:
         image_dir: str = './images',
         output_dir: str = './colmap_out',
         colmap_path: str = 'colmap',
-        gpu_index: int = 0
+        gpu_indices: Optional[List[int]] = None,
+        use_pycolmap: Optional[bool] = None,
+        matcher: str = 'auto',
+        vocab_tree_path: Optional[str] = None,
+        num_partitions: int = 1,
+        max_image_size: int = 3200,
+        max_num_features: int = 8192,
+        fast_mode: bool = True,
+        known_poses_dir: Optional[str] = None,
+        camera_intrinsics: Optional[List[Dict]] = None,
+        partition_overlap: float = 0.15,
+        use_tmpfs: bool = False
     ):
         """
         Initialize COLMAP wrapper
@@ -45,45 +137,337 @@ class ColmapWrapper:
             image_dir: Directory containing input images
             output_dir: Directory for COLMAP output
             colmap_path: Path to COLMAP executable
-            gpu_index: GPU index to use (0-based)
+            gpu_indices: GPU indices to use (0-based, default: all available GPUs)
+            use_pycolmap: Run steps in-process with pycolmap (default: when installed)
+            matcher: Feature matcher (auto, exhaustive, sequential, vocab_tree)
+            vocab_tree_path: Vocabulary tree file (default: downloaded to a cache dir)
+            num_partitions: Number of image partitions reconstructed concurrently
+                and merged (1 disables)
+            max_image_size: Longest image side used for feature extraction, in pixels
+            max_num_features: Maximum number of SIFT features per image
+            fast_mode: Use faster mapper settings instead of COLMAP defaults
+            known_poses_dir: COLMAP text model with known cameras and image poses;
+                points are triangulated from these instead of running the mapper
+            camera_intrinsics: Camera intrinsics used to write cameras.txt into
+                known_poses_dir when it has none, as dicts with model, width,
+                height and params keys
+            partition_overlap: Fraction of each partition shared with the previous one
+            use_tmpfs: Keep the database in /dev/shm while the pipeline runs and
+                copy it to the output directory at the end
         """
         self.image_dir = Path(image_dir)
         self.output_dir = Path(output_dir)
         self.colmap_path = colmap_path
-        self.gpu_index = gpu_index
+        self.gpu_indices = list(gpu_indices) if gpu_indices else None
+        
+        # COLMAP gpu_index value: comma-separated devices, -1 for all available GPUs
+        self.gpu_index = ",".join(map(str, self.gpu_indices)) if self.gpu_indices else "-1"
+        self.use_pycolmap = HAS_PYCOLMAP if use_pycolmap is None else use_pycolmap
+        
+        if self.use_pycolmap and not HAS_PYCOLMAP:
+            raise RuntimeError("use_pycolmap requested but pycolmap is not installed")
+        
+        if matcher not in MATCHERS:
+            raise ValueError(f"Unknown matcher '{matcher}', expected one of {MATCHERS}")
+        self.matcher = matcher
+        self.vocab_tree_path = Path(vocab_tree_path) if vocab_tree_path else None
+        
+        # Above this many images, auto mode stops matching all pairs
+        self.vocab_tree_threshold = 500  # images
+        self.max_num_matches = 32768  # matches per image pair
+        self._gpu_memory = None  # GB, queried on first use (0 if unknown)
+        
+        # Below this many images, the hierarchical mapper's clustering overhead dominates
+        self.hierarchical_min_images = 50  # images
+        self.leaf_max_num_images = 500  # images per hierarchical mapper cluster
+        
+        # Partitioned reconstruction matches and maps partitions separately, then merges
+        self.num_partitions = num_partitions
+        self.partition_overlap = partition_overlap
+        self.partition_seed = 0  # shuffle seed, fixed so reruns give the same partitions
+        self.fast_mode = fast_mode
+        
+        # All frames share one set of intrinsics, which GPU bundle adjustment relies on
+        self.single_camera = True
+        
+        # Fixed installed cameras can skip the mapper when their poses are known
+        self.known_poses_dir = Path(known_poses_dir) if known_poses_dir else None
+        self.camera_intrinsics = camera_intrinsics
+        
+        # SIFT cost grows with pixel count, so large captures are downscaled first
+        self.max_image_size = max_image_size
+        self.max_num_features = max_num_features
+        self.dense_max_image_size = 2000  # pixels, longest side of undistorted images
+        
+        # Amount of a failed command's log that is repeated in the error message
+        self.error_log_tail_bytes = 4096
         
         # Derived paths for COLMAP workspace
         self.database_path = self.output_dir / "database.db"
         self.sparse_dir = self.output_dir / "sparse"
         self.sparse_model_dir = self.sparse_dir / "0"
         self.dense_dir = self.output_dir / "dense"
+        self.scaled_image_dir = self.output_dir / "images_scaled"
+        self.output_database_path = self.database_path
+        
+        # Feature extraction and matching make many small database writes,
+        # which run at memory speed on tmpfs instead of waiting on the disk
+        if use_tmpfs and TMPFS_DIR.is_dir():
+            self.database_path = TMPFS_DIR / f"colmap_{os.getpid()}_{id(self):x}.db"
+            if self.output_database_path.exists():
+                shutil.copyfile(self.output_database_path, self.database_path)
+            atexit.register(self._release_tmpfs_database)
+            logger.info(f"Using tmpfs database {self.database_path}")
+        
+        # Images COLMAP reads; switches to the downscaled copies once they exist
+        self.colmap_image_dir = self.scaled_image_dir if self.scaled_image_dir.is_dir() else self.image_dir
+        
+        # Path arguments shared by every COLMAP command, converted once
+        self._db_str = os.fspath(self.database_path)
+        self._sparse_str = os.fspath(self.sparse_dir)
+        self._dense_str = os.fspath(self.dense_dir)
+        self._fused_str = os.fspath(self.dense_dir / "fused.ply")
+        
+        # Images added by the last incremental extraction, None after a full one
+        self._new_images = None
         
         # Create output directories
         self._create_directories()
         
         # Check if COLMAP is available
-        self._check_colmap_availability()
+        if self.use_pycolmap:
+            logger.info(f"Using pycolmap {pycolmap.__version__} in-process")
+        else:
+            self._check_colmap_availability()
+        
+        # Mapper options that move bundle adjustment onto the GPU, if supported
+        self._gpu_ba_options = self._detect_gpu_bundle_adjustment()
         
         logger.info(f"COLMAP wrapper initialized with image_dir={image_dir}, output_dir={output_dir}")
     
+    @property
+    def colmap_image_dir(self) -> Path:
+        """Directory of the images COLMAP reads"""
+        return self._colmap_image_dir
+    
+    @colmap_image_dir.setter
+    def colmap_image_dir(self, path: Path):
+        self._colmap_image_dir = Path(path)
+        self._image_str = os.fspath(path)
+    
+    def sync_database(self) -> bool:
+        """
+        Copy a tmpfs database back to the output directory
+        
+        Returns:
+            True if successful or nothing to copy, False otherwise
+        """
+        if self.database_path == self.output_database_path or not self.database_path.exists():
+            return True
+        
+        try:
+            # Copy next to the target first so an interrupted copy keeps the old database
+            partial_path = self.output_database_path.with_suffix('.db.part')
+            shutil.copyfile(self.database_path, partial_path)
+            partial_path.replace(self.output_database_path)
+            logger.info(f"Copied database to {self.output_database_path}")
+            return True
+        except OSError as e:
+            logger.error(f"Failed to copy database to {self.output_database_path}: {e}")
+            return False
+    
+    def _release_tmpfs_database(self):
+        """Copy the tmpfs database back and free its memory"""
+        if self.sync_database():
+            self.database_path.unlink(missing_ok=True)
+    
     def _create_directories(self):
         """Create necessary directories for COLMAP pipeline"""
         try:
-            self.output_dir.mkdir(parents=True, exist_ok=True)
-            self.sparse_dir.mkdir(parents=True, exist_ok=True)
-            self.dense_dir.mkdir(parents=True, exist_ok=True)
+            # The output directory is created as the parent of both
+            os.makedirs(self.sparse_dir, exist_ok=True)
+            os.makedirs(self.dense_dir, exist_ok=True)
             logger.info(f"Created output directories in {self.output_dir}")
         except Exception as e:
             logger.error(f"Failed to create directories: {e}")
             raise
     
+    def _list_images(self) -> List[str]:
+        """List image file names in the image directory"""
+        # A single directory sweep; DirEntry answers is_file() from the entry type without a stat
+        try:
+            with os.scandir(self.image_dir) as entries:
+                return sorted(
+                    entry.name for entry in entries
+                    if entry.name.lower().endswith(IMAGE_EXTENSIONS) and entry.is_file()
+                )
+        except (FileNotFoundError, NotADirectoryError):
+            return []
+    
+    def _select_matcher(self) -> str:
+        """
+        Pick the feature matcher for the current image set
+        
+        In auto mode small sets are matched exhaustively. Larger sets use
+        sequential matching when all frames come from a single camera
+        (named <camera>_img_<index> by the capture module), otherwise
+        vocabulary tree matching.
+        
+        Returns:
+            Name of the matcher to run
+        """
+        if self.matcher != 'auto':
+            return self.matcher
+        
+        images = self._list_images()
+        if len(images) <= self.vocab_tree_threshold:
+            return 'exhaustive'
+        
+        cameras = {name.rsplit('_img_', 1)[0] if '_img_' in name else None for name in images}
+        if len(cameras) == 1 and None not in cameras:
+            logger.info(f"{len(images)} frames from a single camera, using sequential matching")
+            return 'sequential'
+        
+        logger.info(f"{len(images)} images, using vocab tree matching")
+        return 'vocab_tree'
+    
+    def _get_vocab_tree(self) -> Optional[Path]:
+        """
+        Get the vocabulary tree file, downloading it on first use
+        
+        Returns:
+            Path to the vocabulary tree, or None if it is unavailable
+        """
+        if self.vocab_tree_path is not None:
+            return self.vocab_tree_path
+        
+        tree_path = VOCAB_TREE_CACHE_DIR / VOCAB_TREE_URL.rsplit('/', 1)[-1]
+        if not tree_path.exists():
+            logger.info(f"Downloading vocabulary tree from {VOCAB_TREE_URL}")
+            partial_path = tree_path.with_suffix('.part')
+            try:
+                VOCAB_TREE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+                urllib.request.urlretrieve(VOCAB_TREE_URL, partial_path)
+                partial_path.replace(tree_path)
+            except Exception as e:
+                logger.error(f"Failed to download vocabulary tree: {e}")
+                partial_path.unlink(missing_ok=True)
+                return None
+        
+        self.vocab_tree_path = tree_path
+        return tree_path
+    
+    def _scale_image(self, name: str) -> str:
+        """
+        Write a downscaled copy of one image if it exceeds max_image_size
+        
+        The size is read from the file header, so only images that are
+        actually scaled get decoded.
+        
+        Args:
+            name: Image file name in the image directory
+            
+        Returns:
+            'small' if the image needs no scaling, 'cached' if an up-to-date
+            copy exists, 'scaled' if one was written, 'unreadable' if the
+            image could not be read
+        """
+        src_path = self.image_dir / name
+        dst_path = self.scaled_image_dir / name
+        
+        img = None
+        size = _read_image_size(src_path)
+        if size is None:
+            # No JPEG or PNG header to read, so decode to learn the size
+            img = cv2.imread(str(src_path))
+            if img is None:
+                logger.warning(f"Skipping unreadable image {src_path}")
+                return 'unreadable'
+            size = (img.shape[1], img.shape[0])
+        
+        width, height = size
+        if max(width, height) <= self.max_image_size:
+            return 'small'
+        
+        if dst_path.exists() and dst_path.stat().st_mtime >= src_path.stat().st_mtime:
+            return 'cached'
+        
+        if img is None:
+            img = cv2.imread(str(src_path))
+            if img is None:
+                logger.warning(f"Skipping unreadable image {src_path}")
+                return 'unreadable'
+        
+        scale = self.max_image_size / max(height, width)
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        if not cv2.imwrite(str(dst_path), cv2.resize(img, size, interpolation=cv2.INTER_AREA)):
+            raise ValueError(f"Failed to write image {dst_path}")
+        return 'scaled'
+    
+    def _prepare_images(self) -> bool:
+        """
+        Downscale images larger than max_image_size in parallel
+        
+        Scaled copies are written once to scaled_image_dir, next to links to
+        the images that are already small enough, and COLMAP is pointed at
+        that directory. If no image needs scaling the originals are used.
+        Unreadable images are left out, as COLMAP would skip them.
+        
+        Returns:
+            True if successful, False otherwise
+        """
+        images = self._list_images()
+        
+        try:
+            self.scaled_image_dir.mkdir(parents=True, exist_ok=True)
+            with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+                results = dict(zip(images, executor.map(self._scale_image, images)))
+            results = {name: result for name, result in results.items() if result != 'unreadable'}
+            
+            if all(result == 'small' for result in results.values()):
+                shutil.rmtree(self.scaled_image_dir)
+                self.colmap_image_dir = self.image_dir
+                return True
+            
+            # Link the images that were small enough to keep the set complete
+            for name, result in results.items():
+                if result == 'small':
+                    src_path = self.image_dir / name
+                    dst_path = self.scaled_image_dir / name
+                    if dst_path.exists() and os.path.samefile(src_path, dst_path):
+                        continue
+                    dst_path.unlink(missing_ok=True)
+                    try:
+                        os.link(src_path, dst_path)
+                    except OSError:
+                        shutil.copy2(src_path, dst_path)
+            
+            # Drop copies of images that are no longer in the image directory
+            for path in self.scaled_image_dir.iterdir():
+                if path.name not in results:
+                    path.unlink()
+            
+            num_scaled = sum(result == 'scaled' for result in results.values())
+            num_cached = sum(result == 'cached' for result in results.values())
+            logger.info(
+                f"Using {num_scaled + num_cached} downscaled images in {self.scaled_image_dir} "
+                f"({num_scaled} scaled, {num_cached} cached)"
+            )
+            self.colmap_image_dir = self.scaled_image_dir
+            return True
+            
+        except Exception as e:
+            logger.error(f"Failed to prepare images: {e}")
+            return False
+    
     def _check_colmap_availability(self):
         """Check if COLMAP is available"""
         try:
             cmd = [self.colmap_path, "help"]
+            # Only stderr is reported, so the help text is discarded unread
             result = subprocess.run(
                 cmd, 
-                stdout=subprocess.PIPE, 
+                stdout=subprocess.DEVNULL, 
                 stderr=subprocess.PIPE,
                 text=True,
                 check=False
@@ -99,10 +483,63 @@ class ColmapWrapper:
             logger.error(f"COLMAP executable not found at {self.colmap_path}")
             raise
     
+    def _detect_gpu_bundle_adjustment(self) -> Dict[str, Union[int, str, bool]]:
+        """
+        Detect GPU bundle adjustment support in the COLMAP build
+        
+        Older COLMAP releases provide PBA (Mapper.ba_global_use_pba), newer
+        ones a CUDA solver (Mapper.ba_use_gpu). Both need shared intrinsics.
+        pycolmap takes the GPU index as a string, the command line as an int.
+        
+        Returns:
+            Mapper options enabling GPU bundle adjustment, empty if unsupported
+        """
+        gpu = self.gpu_indices[0] if self.gpu_indices else -1
+        
+        if self.use_pycolmap:
+            if not pycolmap.has_cuda:
+                return {}
+            return {'ba_use_gpu': True, 'ba_gpu_index': str(gpu), 'multiple_models': False}
+        
+        try:
+            result = subprocess.run(
+                [self.colmap_path, "mapper", "--help"],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                check=False
+            )
+        except OSError as e:
+            logger.warning(f"Could not query COLMAP mapper options: {e}")
+            return {}
+        
+        help_text = result.stdout or ""
+        if "Mapper.ba_global_use_pba" in help_text:
+            logger.info("COLMAP supports PBA GPU bundle adjustment")
+            return {'ba_global_use_pba': True, 'ba_global_pba_gpu_index': gpu, 'multiple_models': False}
+        if "Mapper.ba_use_gpu" in help_text:
+            logger.info("COLMAP supports GPU bundle adjustment")
+            return {'ba_use_gpu': True, 'ba_gpu_index': gpu, 'multiple_models': False}
+        return {}
+    
+    def _command_log_path(self, desc: str) -> Path:
+        """Get the file that receives a command's output"""
+        name = re.sub(r'[^a-z0-9]+', '_', desc.lower()).strip('_')
+        return self.output_dir / f"{name}.log"
+    
+    def _read_log_tail(self, log_path: Path) -> str:
+        """Read the end of a command log for error reporting"""
+        with open(log_path, 'rb') as f:
+            f.seek(max(0, log_path.stat().st_size - self.error_log_tail_bytes))
+            return f.read().decode(errors='replace')
+    
     def run_command(self, command: List[str], desc: str) -> bool:
         """
         Run a COLMAP command with error handling
         
+        COLMAP prints progress for every image, so its output goes straight
+        to a log file in the output directory rather than through pipes.
+        
         Args:
             command: Command list to run
             desc: Description of the command for logging
@@ -111,21 +548,68 @@ class ColmapWrapper:
             True if command succeeds, False otherwise
         """
         start_time = time.time()
-        logger.info(f"Starting {desc}")
+        log_path = self._command_log_path(desc)
+        logger.info(f"Starting {desc} (output in {log_path})")
         
         try:
-            result = subprocess.run(
-                command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                check=False
-            )
+            with open(log_path, 'wb') as log_file:
+                proc = subprocess.Popen(command, stdout=log_file, stderr=subprocess.STDOUT)
+                try:
+                    returncode = proc.wait()
+                except KeyboardInterrupt:
+                    proc.terminate()
+                    proc.wait()
+                    raise
             
             # Check return code
-            if result.returncode != 0:
-                logger.error(f"{desc} failed with return code {result.returncode}")
-                logger.error(f"Error output: {result.stderr}")
+            if returncode != 0:
+                logger.error(f"{desc} failed with return code {returncode}")
+                logger.error(f"Error output: {self._read_log_tail(log_path)}")
+                return False
+            
+            elapsed = time.time() - start_time
+            logger.info(f"{desc} completed successfully in {elapsed:.2f} seconds")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Exception while running {desc}: {e}")
+            return False
+    
+    async def run_command_async(
+        self,
+        command: List[str],
+        desc: str,
+        env: Optional[Dict[str, str]] = None
+    ) -> bool:
+        """
+        Run a COLMAP command as an asyncio subprocess with error handling
+        
+        Args:
+            command: Command list to run
+            desc: Description of the command for logging
+            env: Environment for the process (default: inherit)
+            
+        Returns:
+            True if command succeeds, False otherwise
+        """
+        start_time = time.time()
+        log_path = self._command_log_path(desc)
+        logger.info(f"Starting {desc} (output in {log_path})")
+        
+        try:
+            with open(log_path, 'wb') as log_file:
+                proc = await asyncio.create_subprocess_exec(
+                    *command,
+                    stdout=log_file,
+                    stderr=asyncio.subprocess.STDOUT,
+                    env=env
+                )
+                returncode = await proc.wait()
+            
+            # Check return code
+            if returncode != 0:
+                logger.error(f"{desc} failed with return code {returncode}")
+                logger.error(f"Error output: {self._read_log_tail(log_path)}")
                 return False
             
             elapsed = time.time() - start_time
@@ -136,38 +620,414 @@ class ColmapWrapper:
             logger.error(f"Exception while running {desc}: {e}")
             return False
     
+    def run_commands_concurrently(
+        self,
+        jobs: List[Tuple[List[str], str, Optional[Dict[str, str]]]]
+    ) -> bool:
+        """
+        Run independent COLMAP commands at the same time
+        
+        Args:
+            jobs: (command, description, environment) for each command
+            
+        Returns:
+            True if all commands succeed, False otherwise
+        """
+        async def run_all():
+            return await asyncio.gather(
+                *(self.run_command_async(command, desc, env) for command, desc, env in jobs)
+            )
+        
+        return all(asyncio.run(run_all()))
+    
+    def run_pycolmap(self, func: Callable, desc: str, **kwargs) -> bool:
+        """
+        Run a pycolmap function in-process with error handling
+        
+        Args:
+            func: pycolmap function to call
+            desc: Description of the step for logging
+            **kwargs: Arguments passed to the function
+            
+        Returns:
+            True if the call succeeds, False otherwise
+        """
+        start_time = time.time()
+        logger.info(f"Starting {desc} (pycolmap)")
+        
+        try:
+            func(**kwargs)
+            
+            elapsed = time.time() - start_time
+            logger.info(f"{desc} completed successfully in {elapsed:.2f} seconds")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Exception while running {desc}: {e}")
+            return False
+    
+    def _read_database_images(self) -> Dict[str, int]:
+        """
+        Read the images already registered in the COLMAP database
+        
+        Returns:
+            Dictionary mapping image names to camera ids
+        """
+        if not self.database_path.exists():
+            return {}
+        
+        try:
+            with closing(sqlite3.connect(self.database_path)) as conn:
+                return dict(conn.execute("SELECT name, camera_id FROM images"))
+        except sqlite3.Error as e:
+            logger.warning(f"Could not read images from {self.database_path}: {e}")
+            return {}
+    
+    def _image_file_states(self, names: List[str]) -> Dict[str, Tuple[int, int]]:
+        """
+        Stat image files to detect when one is replaced under the same name
+        
+        Args:
+            names: Image file names in the image directory
+            
+        Returns:
+            Dictionary mapping image names to (mtime_ns, size)
+        """
+        states = {}
+        for name in names:
+            try:
+                st = os.stat(self.image_dir / name)
+            except FileNotFoundError:
+                continue
+            states[name] = (st.st_mtime_ns, st.st_size)
+        return states
+    
+    def _read_image_file_states(self) -> Dict[str, Tuple[int, int]]:
+        """
+        Read the image file states recorded when features were extracted
+        
+        Returns:
+            Dictionary mapping image names to (mtime_ns, size), empty if none were recorded
+        """
+        if not self.database_path.exists():
+            return {}
+        
+        try:
+            with closing(sqlite3.connect(self.database_path)) as conn:
+                return {
+                    name: (mtime_ns, size)
+                    for name, mtime_ns, size in conn.execute("SELECT name, mtime_ns, size FROM image_files")
+                }
+        except sqlite3.Error:
+            # Databases written before file states were recorded have no table
+            return {}
+    
+    def _record_image_file_states(self, states: Dict[str, Tuple[int, int]]):
+        """
+        Record image file states next to the COLMAP tables, which COLMAP ignores
+        
+        Args:
+            states: Dictionary mapping image names to (mtime_ns, size)
+        """
+        try:
+            with closing(sqlite3.connect(self.database_path)) as conn, conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS image_files "
+                    "(name TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER)"
+                )
+                conn.executemany(
+                    "INSERT OR REPLACE INTO image_files (name, mtime_ns, size) VALUES (?, ?, ?)",
+                    [(name, mtime_ns, size) for name, (mtime_ns, size) in states.items()]
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Could not record image file states in {self.database_path}: {e}")
+    
     def feature_extraction(self) -> bool:
         """
         Run COLMAP feature extraction step
         
+        Images already in the database from a previous run keep their
+        features, and only newly captured images are extracted. Capture
+        restarts its frame counter every session, so an image replaced
+        under the same name (different mtime or size) invalidates the
+        database and all images are extracted again.
+        
         Returns:
             True if successful, False otherwise
         """
-        command = [
-            self.colmap_path, "feature_extractor",
-            "--database_path", str(self.database_path),
-            "--image_path", str(self.image_dir),
-            "--ImageReader.camera_model", "SIMPLE_RADIAL",
-            "--ImageReader.single_camera", "1",
-            "--SiftExtraction.use_gpu", "1",
-            "--SiftExtraction.gpu_index", str(self.gpu_index)
+        if not self._prepare_images():
+            return False
+        
+        images = self._list_images()
+        states = self._image_file_states(images)
+        existing = self._read_database_images()
+        
+        if existing:
+            recorded = self._read_image_file_states()
+            changed = [
+                name for name in existing
+                if name in recorded and states.get(name, recorded[name]) != recorded[name]
+            ]
+            if changed:
+                logger.info(f"{len(changed)} images changed since their features were extracted, re-extracting all images")
+                self.database_path.unlink()
+                existing = {}
+        
+        new_images = [name for name in images if name not in existing]
+        self._new_images = None
+        
+        if existing:
+            if not new_images:
+                logger.info(f"All {len(existing)} images already have features, skipping extraction")
+                return True
+            logger.info(f"Extracting features for {len(new_images)} new images")
+            self._new_images = new_images
+        
+        # New images join the existing camera so intrinsics stay shared
+        existing_camera_id = next(iter(existing.values())) if existing and self.single_camera else None
+        
+        if self.use_pycolmap:
+            reader_options = pycolmap.ImageReaderOptions()
+            reader_options.camera_model = "SIMPLE_RADIAL"
+            if existing_camera_id is not None:
+                reader_options.existing_camera_id = existing_camera_id
+            extraction_options = pycolmap.FeatureExtractionOptions()
+            extraction_options.use_gpu = True
+            extraction_options.gpu_index = self.gpu_index
+            extraction_options.max_image_size = self.max_image_size
+            extraction_options.sift.max_num_features = self.max_num_features
+            
+            success = self.run_pycolmap(
+                pycolmap.extract_features, "Feature extraction",
+                database_path=self.database_path,
+                image_path=self.colmap_image_dir,
+                image_names=self._new_images or [],
+                camera_mode=pycolmap.CameraMode.SINGLE if self.single_camera else pycolmap.CameraMode.AUTO,
+                reader_options=reader_options,
+                extraction_options=extraction_options
+            )
+        else:
+            command = [
+                self.colmap_path, "feature_extractor",
+                "--database_path", self._db_str,
+                "--image_path", self._image_str,
+                "--ImageReader.camera_model", "SIMPLE_RADIAL",
+                "--ImageReader.single_camera", "1" if self.single_camera else "0",
+                "--SiftExtraction.use_gpu", "1",
+                "--SiftExtraction.gpu_index", self.gpu_index,
+                "--SiftExtraction.max_image_size", str(self.max_image_size),
+                "--SiftExtraction.max_num_features", str(self.max_num_features)
+            ]
+            
+            if self._new_images:
+                image_list = self.output_dir / "new_images.txt"
+                image_list.write_text("\n".join(self._new_images) + "\n")
+                command += ["--image_list_path", str(image_list)]
+            if existing_camera_id is not None:
+                command += ["--ImageReader.existing_camera_id", str(existing_camera_id)]
+            
+            success = self.run_command(command, "Feature extraction")
+        
+        # States are taken before extraction, so a frame replaced meanwhile is caught next run
+        if success:
+            self._record_image_file_states({name: states[name] for name in new_images if name in states})
+        return success
+    
+    def _gpu_memory_gb(self) -> Optional[float]:
+        """
+        Query the memory of the smallest GPU used for matching
+        
+        Returns:
+            Total GPU memory in GB, or None if no NVIDIA GPU can be queried
+        """
+        if self._gpu_memory is not None:
+            return self._gpu_memory or None
+        
+        command = ["nvidia-smi", "--query-gpu=memory.total", "--format=csv,noheader,nounits"]
+        if self.gpu_indices:
+            command += ["-i", self.gpu_index]
+        
+        self._gpu_memory = 0.0
+        try:
+            result = subprocess.run(
+                command,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True,
+                check=False
+            )
+            if result.returncode == 0:
+                # nvidia-smi reports MiB, one line per GPU
+                sizes = [float(line) for line in result.stdout.split()]
+                if sizes:
+                    self._gpu_memory = min(sizes) / 1024
+        except (OSError, ValueError) as e:
+            logger.debug(f"Could not query GPU memory: {e}")
+        
+        return self._gpu_memory or None
+    
+    def _exhaustive_block_size(self) -> Optional[int]:
+        """
+        Size exhaustive matching blocks to the available GPU memory
+        
+        Larger blocks keep more descriptors resident on the GPU and cut
+        host-device transfers, smaller ones avoid running out of memory.
+        
+        Returns:
+            Block size in images, or None to keep the COLMAP default
+        """
+        memory_gb = self._gpu_memory_gb()
+        if memory_gb is None:
+            return None
+        return int(min(max(50, memory_gb * 6), 200))
+    
+    def _sift_matching_args(self, gpu_index: Optional[str] = None) -> List[str]:
+        """
+        Get the SIFT matching arguments shared by all COLMAP matchers
+        
+        Args:
+            gpu_index: COLMAP gpu_index value (default: the configured GPUs)
+        """
+        return [
+            "--SiftMatching.use_gpu", "1",
+            "--SiftMatching.gpu_index", gpu_index or self.gpu_index,
+            "--SiftMatching.max_num_matches", str(self.max_num_matches),
+            "--SiftMatching.num_threads", "-1",
+            # Guided matching roughly doubles matching work for little gain here
+            "--SiftMatching.guided_matching", "0"
         ]
+    
+    def _write_new_image_pairs(self) -> Path:
+        """
+        Write the image pairs that involve newly extracted images
+        
+        Returns:
+            Path to the pair list, one "name1 name2" pair per line
+        """
+        new_images = self._new_images
+        new_set = set(new_images)
+        old_images = [name for name in self._list_images() if name not in new_set]
         
-        return self.run_command(command, "Feature extraction")
+        pairs_path = self.output_dir / "new_image_pairs.txt"
+        with open(pairs_path, 'w') as f:
+            for i, name in enumerate(new_images):
+                f.writelines(f"{name} {other}\n" for other in old_images + new_images[i + 1:])
+        return pairs_path
     
     def feature_matching(self) -> bool:
         """
-        Run COLMAP exhaustive matcher step
+        Run COLMAP feature matching step
+        
+        Exhaustive matching compares every image pair, which grows
+        quadratically, so larger sets are matched sequentially or through a
+        vocabulary tree (see _select_matcher). After an incremental feature
+        extraction, exhaustive matching only covers pairs with a new image.
         
         Returns:
             True if successful, False otherwise
         """
+        matcher = self._select_matcher()
+        
+        vocab_tree = None
+        if matcher in ('sequential', 'vocab_tree'):
+            vocab_tree = self._get_vocab_tree()
+            if vocab_tree is None and matcher == 'vocab_tree':
+                logger.warning("No vocabulary tree available, falling back to exhaustive matching")
+                matcher = 'exhaustive'
+        
+        pair_list = None
+        if matcher == 'exhaustive' and self._new_images:
+            pair_list = self._write_new_image_pairs()
+        
+        if self.use_pycolmap:
+            matching_options = pycolmap.FeatureMatchingOptions()
+            matching_options.use_gpu = True
+            matching_options.gpu_index = self.gpu_index
+            matching_options.max_num_matches = self.max_num_matches
+            matching_options.guided_matching = False
+            
+            if pair_list is not None:
+                pairing_options = pycolmap.ImportedPairingOptions()
+                pairing_options.match_list_path = str(pair_list)
+                return self.run_pycolmap(
+                    pycolmap.match_image_pairs, "New image pair matching",
+                    database_path=self.database_path,
+                    matching_options=matching_options,
+                    pairing_options=pairing_options
+                )
+            
+            if matcher == 'vocab_tree':
+                pairing_options = pycolmap.VocabTreePairingOptions()
+                pairing_options.vocab_tree_path = str(vocab_tree)
+                return self.run_pycolmap(
+                    pycolmap.match_vocabtree, "Vocab tree matching",
+                    database_path=self.database_path,
+                    matching_options=matching_options,
+                    pairing_options=pairing_options
+                )
+            
+            if matcher == 'sequential':
+                pairing_options = pycolmap.SequentialPairingOptions()
+                pairing_options.loop_detection = vocab_tree is not None
+                if vocab_tree is not None:
+                    pairing_options.vocab_tree_path = str(vocab_tree)
+                return self.run_pycolmap(
+                    pycolmap.match_sequential, "Sequential matching",
+                    database_path=self.database_path,
+                    matching_options=matching_options,
+                    pairing_options=pairing_options
+                )
+            
+            pairing_options = pycolmap.ExhaustivePairingOptions()
+            block_size = self._exhaustive_block_size()
+            if block_size is not None:
+                pairing_options.block_size = block_size
+            
+            return self.run_pycolmap(
+                pycolmap.match_exhaustive, "Exhaustive matching",
+                database_path=self.database_path,
+                matching_options=matching_options,
+                pairing_options=pairing_options
+            )
+        
+        if pair_list is not None:
+            command = [
+                self.colmap_path, "matches_importer",
+                "--database_path", self._db_str,
+                "--match_list_path", str(pair_list),
+                "--match_type", "pairs",
+            ] + self._sift_matching_args()
+            return self.run_command(command, "New image pair matching")
+        
+        if matcher == 'vocab_tree':
+            command = [
+                self.colmap_path, "vocab_tree_matcher",
+                "--database_path", self._db_str,
+                "--VocabTreeMatching.vocab_tree_path", str(vocab_tree),
+            ] + self._sift_matching_args()
+            return self.run_command(command, "Vocab tree matching")
+        
+        if matcher == 'sequential':
+            command = [
+                self.colmap_path, "sequential_matcher",
+                "--database_path", self._db_str,
+            ] + self._sift_matching_args()
+            # Loop detection closes the camera path and needs the vocabulary tree
+            if vocab_tree is not None:
+                command += [
+                    "--SequentialMatching.loop_detection", "1",
+                    "--SequentialMatching.vocab_tree_path", str(vocab_tree)
+                ]
+            return self.run_command(command, "Sequential matching")
+        
         command = [
             self.colmap_path, "exhaustive_matcher",
-            "--database_path", str(self.database_path),
-            "--SiftMatching.use_gpu", "1",
-            "--SiftMatching.gpu_index", str(self.gpu_index)
-        ]
+            "--database_path", self._db_str,
+        ] + self._sift_matching_args()
+        
+        block_size = self._exhaustive_block_size()
+        if block_size is not None:
+            command += ["--ExhaustiveMatching.block_size", str(block_size)]
         
         return self.run_command(command, "Exhaustive matching")
     
@@ -175,17 +1035,313 @@ class ColmapWrapper:
         """
         Run COLMAP mapper step for sparse reconstruction
         
+        Image sets of hierarchical_min_images or more use hierarchical_mapper,
+        which partitions the scene into overlapping clusters, reconstructs
+        them in parallel and merges the results. Smaller sets use the
+        incremental mapper.
+        
         Returns:
             True if successful, False otherwise
         """
+        if self.known_poses_dir is not None:
+            return self.triangulate_known_poses()
+        
+        if self._partitioned():
+            return self.partitioned_reconstruction()
+        if self.num_partitions > 1:
+            logger.warning("Partitioned reconstruction needs the COLMAP executable, mapping all images at once")
+        
+        num_images = len(self._list_images())
+        hierarchical = num_images >= self.hierarchical_min_images
+        num_workers = os.cpu_count() or 1
+        
+        if self.use_pycolmap:
+            # Options are built inside the guarded call, so a setting the
+            # pycolmap build rejects fails the step instead of raising
+            if hierarchical:
+                def mapping(**kwargs):
+                    options = pycolmap.HierarchicalPipelineOptions()
+                    options.num_workers = num_workers
+                    options.clustering_options.leaf_max_num_images = self.leaf_max_num_images
+                    options.incremental_options = self._incremental_options()
+                    pycolmap.hierarchical_mapping(options=options, **kwargs)
+            else:
+                def mapping(**kwargs):
+                    pycolmap.incremental_mapping(options=self._incremental_options(), **kwargs)
+            
+            success = self.run_pycolmap(
+                mapping, "Sparse reconstruction",
+                database_path=self.database_path,
+                image_path=self.colmap_image_dir,
+                output_path=self.sparse_dir
+            )
+        else:
+            if hierarchical:
+                command = [
+                    self.colmap_path, "hierarchical_mapper",
+                    "--database_path", self._db_str,
+                    "--image_path", self._image_str,
+                    "--output_path", self._sparse_str,
+                    "--num_workers", str(num_workers),
+                    "--leaf_max_num_images", str(self.leaf_max_num_images)
+                ] + self._mapper_args()
+            else:
+                command = [
+                    self.colmap_path, "mapper",
+                    "--database_path", self._db_str,
+                    "--image_path", self._image_str,
+                    "--output_path", self._sparse_str
+                ] + self._mapper_args()
+            success = self.run_command(command, "Sparse reconstruction")
+        
+        if success:
+            self._select_sparse_model()
+        return success
+    
+    def _mapper_options(self, gpu_index: Optional[int] = None) -> Dict[str, Union[int, float, str, bool]]:
+        """
+        Get the mapper settings that override COLMAP defaults
+        
+        Args:
+            gpu_index: GPU for bundle adjustment (default: the first configured GPU)
+        """
+        options = {}
+        if self.fast_mode:
+            options.update(FAST_MAPPER_OPTIONS, num_threads=os.cpu_count() or 1)
+        
+        # GPU bundle adjustment only depends on build support and shared intrinsics
+        if self.single_camera:
+            options.update(self._gpu_ba_options)
+            if gpu_index is not None:
+                for key in ('ba_gpu_index', 'ba_global_pba_gpu_index'):
+                    if key in options:
+                        options[key] = gpu_index
+        return options
+    
+    def _mapper_args(self, gpu_index: Optional[int] = None) -> List[str]:
+        """Get the mapper settings as COLMAP command line arguments"""
+        args = []
+        for key, value in self._mapper_options(gpu_index).items():
+            args += [f"--Mapper.{key}", str(int(value)) if isinstance(value, bool) else str(value)]
+        return args
+    
+    def _incremental_options(self):
+        """Get the mapper settings as pycolmap incremental pipeline options"""
+        options = pycolmap.IncrementalPipelineOptions()
+        for key, value in self._mapper_options().items():
+            setattr(options, key, value)
+        return options
+    
+    def _write_cameras_file(self, cameras_path: Path):
+        """
+        Write a COLMAP cameras.txt from the configured camera intrinsics
+        
+        Args:
+            cameras_path: Output path; cameras are numbered from 1 in order
+        """
+        lines = ["# Camera list with one line of data per camera:",
+                 "#   CAMERA_ID, MODEL, WIDTH, HEIGHT, PARAMS[]"]
+        for camera_id, intrinsics in enumerate(self.camera_intrinsics, 1):
+            params = " ".join(str(param) for param in intrinsics['params'])
+            lines.append(
+                f"{camera_id} {intrinsics['model']} {intrinsics['width']} {intrinsics['height']} {params}"
+            )
+        cameras_path.write_text("\n".join(lines) + "\n")
+        logger.info(f"Wrote {len(self.camera_intrinsics)} cameras to {cameras_path}")
+    
+    def triangulate_known_poses(self) -> bool:
+        """
+        Triangulate points from known camera intrinsics and poses
+        
+        Replaces the mapper when the model in known_poses_dir already
+        provides cameras.txt and images.txt. Existing points are cleared
+        and rebuilt from the database matches.
+        
+        Returns:
+            True if successful, False otherwise
+        """
+        cameras_path = self.known_poses_dir / "cameras.txt"
+        if not cameras_path.exists() and self.camera_intrinsics:
+            self._write_cameras_file(cameras_path)
+        
+        # point_triangulator expects an (empty) points file and an existing output dir
+        points_path = self.known_poses_dir / "points3D.txt"
+        if not points_path.exists():
+            points_path.touch()
+        self.sparse_model_dir = self.sparse_dir / "0"
+        self.sparse_model_dir.mkdir(parents=True, exist_ok=True)
+        
+        if self.use_pycolmap:
+            def triangulate(**kwargs):
+                reconstruction = pycolmap.Reconstruction(str(self.known_poses_dir))
+                pycolmap.triangulate_points(reconstruction, **kwargs)
+            
+            return self.run_pycolmap(
+                triangulate, "Point triangulation",
+                database_path=self.database_path,
+                image_path=self.colmap_image_dir,
+                output_path=self.sparse_model_dir,
+                clear_points=True
+            )
+        
         command = [
-            self.colmap_path, "mapper",
-            "--database_path", str(self.database_path),
-            "--image_path", str(self.image_dir),
-            "--output_path", str(self.sparse_dir)
+            self.colmap_path, "point_triangulator",
+            "--database_path", self._db_str,
+            "--image_path", self._image_str,
+            "--input_path", str(self.known_poses_dir),
+            "--output_path", str(self.sparse_model_dir),
+            "--clear_points", "1"
         ]
         
-        return self.run_command(command, "Sparse reconstruction")
+        return self.run_command(command, "Point triangulation")
+    
+    def _partition_images(self, images: List[str]) -> List[List[str]]:
+        """
+        Split an image list into random, overlapping partitions
+        
+        Args:
+            images: Image names
+            
+        Returns:
+            Sorted image names for each partition
+        """
+        images = list(images)
+        random.Random(self.partition_seed).shuffle(images)
+        
+        num_partitions = max(1, min(self.num_partitions, len(images)))
+        size = math.ceil(len(images) / num_partitions)
+        overlap = int(size * self.partition_overlap)
+        
+        return [
+            sorted(images[max(0, start - overlap):start + size])
+            for start in range(0, len(images), size)
+        ]
+    
+    def _partitioned(self) -> bool:
+        """Check whether the sparse steps run per partition"""
+        return self.num_partitions > 1 and not self.use_pycolmap
+    
+    def partitioned_reconstruction(self) -> bool:
+        """
+        Match and map image partitions concurrently and merge the models
+        
+        Each partition gets a copy of the feature database, so image ids
+        agree across partitions and the concurrent matchers do not contend
+        for one SQLite file. Only pairs within a partition are matched,
+        which cuts matching from all pairs of the full set to all pairs of
+        each partition. Partitions share some images with the previous one
+        so that model_merger can align the sub-models. Processes are pinned
+        round-robin to the configured GPUs.
+        
+        Returns:
+            True if successful, False otherwise
+        """
+        partitions = self._partition_images(self._list_images())
+        partition_root = self.sparse_dir / "partitions"
+        
+        matching_jobs = []
+        mapping_jobs = []
+        for i, names in enumerate(partitions):
+            partition_dir = partition_root / str(i)
+            partition_dir.mkdir(parents=True, exist_ok=True)
+            image_list = partition_dir / "image_list.txt"
+            image_list.write_text("\n".join(names) + "\n")
+            pair_list = partition_dir / "image_pairs.txt"
+            with open(pair_list, 'w') as f:
+                for j, name in enumerate(names):
+                    f.writelines(f"{name} {other}\n" for other in names[j + 1:])
+            
+            database_path = partition_dir / "database.db"
+            shutil.copyfile(self.database_path, database_path)
+            
+            # A pinned process only sees its own GPU, which COLMAP selects with -1
+            env, gpu_index = None, None
+            if self.gpu_indices:
+                gpu = self.gpu_indices[i % len(self.gpu_indices)]
+                env = dict(os.environ, CUDA_VISIBLE_DEVICES=str(gpu))
+                gpu_index = -1
+            
+            command = [
+                self.colmap_path, "matches_importer",
+                "--database_path", str(database_path),
+                "--match_list_path", str(pair_list),
+                "--match_type", "pairs"
+            ] + self._sift_matching_args(None if gpu_index is None else str(gpu_index))
+            matching_jobs.append((command, f"Feature matching (partition {i + 1}/{len(partitions)})", env))
+            
+            command = [
+                self.colmap_path, "mapper",
+                "--database_path", str(database_path),
+                "--image_path", self._image_str,
+                "--output_path", str(partition_dir),
+                "--image_list_path", str(image_list)
+            ] + self._mapper_args(gpu_index)
+            mapping_jobs.append((command, f"Sparse reconstruction (partition {i + 1}/{len(partitions)})", env))
+        
+        if not self.run_commands_concurrently(matching_jobs):
+            return False
+        if not self.run_commands_concurrently(mapping_jobs):
+            return False
+        
+        models = [self._largest_model(partition_root / str(i))[0] for i in range(len(partitions))]
+        models = [model for model in models if model is not None]
+        if not models:
+            logger.error("Partitioned mapping produced no sparse models")
+            return False
+        
+        # Merge the partition models one at a time through their shared images
+        merged = models[0]
+        for i, model in enumerate(models[1:], 1):
+            output_dir = partition_root / f"merged_{i}"
+            output_dir.mkdir(parents=True, exist_ok=True)
+            command = [
+                self.colmap_path, "model_merger",
+                "--input_path1", str(merged),
+                "--input_path2", str(model),
+                "--output_path", str(output_dir)
+            ]
+            if not self.run_command(command, f"Model merging ({i}/{len(models) - 1})"):
+                return False
+            merged = output_dir
+        
+        self.sparse_model_dir = merged
+        logger.info(f"Using merged sparse model {merged}")
+        return True
+    
+    def _largest_model(self, parent_dir: Path) -> Tuple[Optional[Path], int]:
+        """
+        Find the sparse model with the most registered images
+        
+        Args:
+            parent_dir: Directory containing numbered model directories
+            
+        Returns:
+            Tuple of (model directory or None, registered image count)
+        """
+        best_dir, best_count = None, -1
+        for model_dir in sorted(parent_dir.iterdir()):
+            images_bin = model_dir / "images.bin"
+            if not images_bin.is_file():
+                continue
+            
+            # images.bin starts with the number of registered images as uint64
+            with open(images_bin, 'rb') as f:
+                header = f.read(8)
+            if len(header) < 8:
+                continue
+            count = struct.unpack('<Q', header)[0]
+            
+            if count > best_count:
+                best_dir, best_count = model_dir, count
+        
+        return best_dir, best_count
+    
+    def _select_sparse_model(self):
+        """Point sparse_model_dir at the sub-model with the most registered images"""
+        best_dir, best_count = self._largest_model(self.sparse_dir)
+        if best_dir is not None:
+            self.sparse_model_dir = best_dir
+            logger.info(f"Using sparse model {best_dir} with {best_count} registered images")
     
     def image_undistortion(self) -> bool:
         """
@@ -194,12 +1350,26 @@ class ColmapWrapper:
         Returns:
             True if successful, False otherwise
         """
+        if self.use_pycolmap:
+            undistort_options = pycolmap.UndistortCameraOptions()
+            undistort_options.max_image_size = self.dense_max_image_size
+            
+            return self.run_pycolmap(
+                pycolmap.undistort_images, "Image undistortion",
+                output_path=self.dense_dir,
+                input_path=self.sparse_model_dir,
+                image_path=self.colmap_image_dir,
+                output_type="COLMAP",
+                undistort_options=undistort_options
+            )
+        
         command = [
             self.colmap_path, "image_undistorter",
-            "--image_path", str(self.image_dir),
+            "--image_path", self._image_str,
             "--input_path", str(self.sparse_model_dir),
-            "--output_path", str(self.dense_dir),
-            "--output_type", "COLMAP"
+            "--output_path", self._dense_str,
+            "--output_type", "COLMAP",
+            "--max_image_size", str(self.dense_max_image_size)
         ]
         
         return self.run_command(command, "Image undistortion")
@@ -211,11 +1381,23 @@ class ColmapWrapper:
         Returns:
             True if successful, False otherwise
         """
+        # pycolmap only provides dense stereo when built with CUDA
+        if self.use_pycolmap and pycolmap.has_cuda:
+            options = pycolmap.PatchMatchOptions()
+            options.gpu_index = self.gpu_index
+            
+            return self.run_pycolmap(
+                pycolmap.patch_match_stereo, "Patch match stereo",
+                workspace_path=self.dense_dir,
+                workspace_format="COLMAP",
+                options=options
+            )
+        
         command = [
             self.colmap_path, "patch_match_stereo",
-            "--workspace_path", str(self.dense_dir),
+            "--workspace_path", self._dense_str,
             "--workspace_format", "COLMAP",
-            "--PatchMatchStereo.gpu_index", str(self.gpu_index)
+            "--PatchMatchStereo.gpu_index", self.gpu_index
         ]
         
         return self.run_command(command, "Patch match stereo")
@@ -231,12 +1413,22 @@ class ColmapWrapper:
         fused_dir = self.dense_dir / "fused"
         fused_dir.mkdir(parents=True, exist_ok=True)
         
+        if self.use_pycolmap:
+            return self.run_pycolmap(
+                pycolmap.stereo_fusion, "Stereo fusion",
+                output_path=self.dense_dir / "fused.ply",
+                workspace_path=self.dense_dir,
+                workspace_format="COLMAP",
+                input_type="geometric",
+                output_type="ply"
+            )
+        
         command = [
             self.colmap_path, "stereo_fusion",
-            "--workspace_path", str(self.dense_dir),
+            "--workspace_path", self._dense_str,
             "--workspace_format", "COLMAP",
             "--input_type", "geometric",
-            "--output_path", str(self.dense_dir / "fused.ply")
+            "--output_path", self._fused_str
         ]
         
         return self.run_command(command, "Stereo fusion")
@@ -257,21 +1449,30 @@ class ColmapWrapper:
             ("Stereo fusion", self.stereo_fusion)
         ]
         
+        # Partitioned reconstruction matches each partition itself
+        if self._partitioned():
+            steps = [step for step in steps if step[0] != "Feature matching"]
+        
         logger.info("Starting COLMAP photogrammetry pipeline")
         
         # Run each step
-        for step_name, step_func in steps:
-            if not step_func():
-                logger.error(f"Pipeline failed at {step_name}")
-                return False
+        try:
+            for step_name, step_func in steps:
+                if not step_func():
+                    logger.error(f"Pipeline failed at {step_name}")
+                    return False
+        finally:
+            self.sync_database()
         
         # Verify output exists
         output_ply = self.dense_dir / "fused.ply"
-        if not output_ply.exists():
+        try:
+            output_size = os.stat(output_ply).st_size
+        except FileNotFoundError:
             logger.error(f"Pipeline completed but output file {output_ply} not found")
             return False
         
-        logger.info(f"COLMAP pipeline completed successfully. Output: {output_ply}")
+        logger.info(f"COLMAP pipeline completed successfully. Output: {output_ply} ({output_size} bytes)")
         return True
 
 def parse_args():
@@ -301,15 +1502,62 @@ def parse_args():
     
     parser.add_argument(
         '--gpu', 
+        type=str, 
+        default=None,
+        help='Comma-separated GPU indices to use (default: all available GPUs)'
+    )
+    
+    parser.add_argument(
+        '--matcher', 
+        type=str, 
+        default='auto',
+        choices=MATCHERS,
+        help='Feature matcher to use (default: auto)'
+    )
+    
+    parser.add_argument(
+        '--vocab-tree', 
+        type=str, 
+        default=None,
+        help='Vocabulary tree file for vocab tree matching (default: download on first use)'
+    )
+    
+    parser.add_argument(
+        '--partitions', 
         type=int, 
-        default=0,
-        help='GPU index to use (default: 0)'
+        default=1,
+        help='Number of image partitions to reconstruct concurrently and merge (default: 1)'
+    )
+    
+    parser.add_argument(
+        '--known-poses', 
+        type=str, 
+        default=None,
+        help='COLMAP text model with known camera poses; triangulates instead of mapping'
+    )
+    
+    parser.add_argument(
+        '--tmpfs', 
+        action='store_true',
+        help='Keep the COLMAP database in /dev/shm while processing'
     )
     
     return parser.parse_args()
 
 def main():
     """Main entry point"""
+    # Configure logging here rather than at import, so importing the module opens no log file
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.StreamHandler(),
+            logging.handlers.RotatingFileHandler('photogrammetry.log', maxBytes=10 * 1024 * 1024, backupCount=3)
+        ],
+        # Replace handlers that imported modules may have installed
+        force=True
+    )
+    
     try:
         # Parse arguments
         args = parse_args()
@@ -319,7 +1567,12 @@ def main():
             image_dir=args.image_dir,
             output_dir=args.output_dir,
             colmap_path=args.colmap_path,
-            gpu_index=args.gpu
+            gpu_indices=[int(i) for i in args.gpu.split(',')] if args.gpu else None,
+            matcher=args.matcher,
+            vocab_tree_path=args.vocab_tree,
+            num_partitions=args.partitions,
+            known_poses_dir=args.known_poses,
+            use_tmpfs=args.tmpfs
         )
         
         # Run the pipeline
@@ -7,12 +7,19 @@ with the latest image from ./images/ as a texture.
 """
 
 import os
+import re
 import sys
 import logging
+import logging.handlers
 import glob
+import mmap
 import argparse
+import functools
+import importlib.util
+import string
+import numpy as np
 from pathlib import Path
-from typing import Optional, Tuple, Any
+from typing import List, Optional, Tuple, Any
 
 # Import USD modules
 try:
@@ -24,22 +31,392 @@ except ImportError:
     # We'll just use Any for type hints when pxr is not available
     Usd = UsdGeom = UsdShade = Sdf = Gf = Vt = None
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('usd_builder.log')
-    ]
-)
+# JIT-compile the placeholder frame emitter with Numba when installed; numba
+# itself is only imported once a long sequence needs it (see _jit_fill_frames)
+HAS_NUMBA = importlib.util.find_spec('numba') is not None
 
 logger = logging.getLogger('usd_builder')
 
+# Layer formats selectable with --format; USD picks the format from the file extension
+USD_FORMATS = ('usda', 'usdc')
+
+# Placeholder .usda text used when pxr is not available; fields are filled with str.format
+_PLACEHOLDER_HEADER = """#usda 1.0
+(
+    defaultPrim = "World"
+    upAxis = "Y"
+    timeCodesPerSecond = 24
+    startTimeCode = 0
+    endTimeCode = {last_frame}
+)
+
+def Xform "World"
+{{
+    # This is an enhanced placeholder USD file
+    # Point cloud reference would have been: {point_cloud}
+    # Total images available: {num_frames}
+    
+    def Camera "Camera"
+    {{
+        float3 xformOp:translate = (0, 1.5, 5)
+        uniform token[] xformOpOrder = ["xformOp:translate"]
+        float focalLength = 35
+        float horizontalAperture = 36
+        float verticalAperture = 24
+        
+        # Camera animation around Y axis
+        float3 xformOp:rotateXYZ.timeSamples = {{
+            0: (0, 0, 0),
+            {last_frame}: (0, 360, 0),
+        }}
+    }}
+    
+    def Scope "ImageSequence" 
+    {{
+        def Plane "ImagePlane"
+        {{
+            float3[] extent = [(-2, -2, 0), (2, 2, 0)]
+            int[] faceVertexIndices = [0, 1, 2, 0, 2, 3]
+            point3f[] points = [(-2, -2, 0), (2, -2, 0), (2, 2, 0), (-2, 2, 0)]
+            texCoord2f[] primvars:st = [(0, 0), (1, 0), (1, 1), (0, 1)] (
+                interpolation = "vertex"
+            )
+            
+            # Material binding with timeSamples for each frame
+            rel material:binding.timeSamples = {{"""
+
+# Per-frame material binding time sample
+_BINDING_TEMPLATE = "                {i}: </World/Materials/FrameMaterial_{i}>,\n"
+
+# Closes the image plane and opens the materials scope
+_MATERIALS_SCOPE = """            }
+        }
+    }
+    
+    def Scope "Materials"
+    {
+"""
+
+# Per-frame material reading the frame as a texture
+_MATERIAL_TEMPLATE = """        def Material "FrameMaterial_{i}"
+        {{
+            token outputs:surface.connect = </World/Materials/FrameMaterial_{i}/PBRShader.outputs:surface>
+            
+            def Shader "PBRShader"
+            {{
+                uniform token info:id = "UsdPreviewSurface"
+                color3f inputs:diffuseColor = (1, 1, 1)
+                float inputs:roughness = 0.4
+                float inputs:metallic = 0
+                token outputs:surface
+                
+                # Connect texture to diffuseColor
+                color3f inputs:diffuseColor.connect = </World/Materials/FrameMaterial_{i}/TextureReader.outputs:rgb>
+            }}
+            
+            def Shader "TextureReader"
+            {{
+                uniform token info:id = "UsdUVTexture"
+                asset inputs:file = @{rel_path}@
+                float2 inputs:st.connect = </World/ImageSequence/ImagePlane.inputs:st>
+                token inputs:wrapS = "repeat"
+                token inputs:wrapT = "repeat"
+                float3 outputs:rgb
+            }}
+        }}
+"""
+
+# Static geometry and point cloud representation closing the file
+_PLACEHOLDER_FOOTER = """    }}
+    
+    # Representation of the 3D geometry from synthetic frames
+    def Xform "Geometry"
+    {{
+        # A cube as seen in our synthetic frames
+        def Cube "Cube" (
+            kind = "component"
+        )
+        {{
+            float3 xformOp:translate = (0, 0, 0)
+            float3 xformOp:scale = (1, 1, 1)
+            float3 xformOp:rotateXYZ.timeSamples = {{
+                0: (0, 0, 0),
+                {last_frame}: (0, 360, 0),
+            }}
+            uniform token[] xformOpOrder = ["xformOp:translate", "xformOp:rotateXYZ", "xformOp:scale"]
+            color3f[] primvars:displayColor = [(0, 255, 255)]
+        }}
+        
+        # A pyramid 
+        def Cone "Pyramid" (
+            kind = "component"
+        )
+        {{
+            float3 xformOp:translate = (0, -2, 0)
+            float3 xformOp:scale = (1, 2, 1)
+            uniform token[] xformOpOrder = ["xformOp:translate", "xformOp:scale"]
+            color3f[] primvars:displayColor = [(255, 0, 0)]
+        }}
+        
+        # A sphere
+        def Sphere "Sphere" (
+            kind = "component"
+        )
+        {{
+            float3 xformOp:translate = (-2, 0.5, 0)
+            float3 xformOp:scale = (0.5, 0.5, 0.5)
+            uniform token[] xformOpOrder = ["xformOp:translate", "xformOp:scale"]
+            color3f[] primvars:displayColor = [(0, 0, 255)]
+        }}
+    }}
+    
+    # This would typically come from photogrammetry point cloud
+    def PointInstancer "SyntheticPointCloud" (
+        kind = "component"
+    )
+    {{
+        point3f[] positions = [
+            # Synthetic points representing what would come from photogrammetry
+            (0, 0, 0), (1, 0, 0), (0, 1, 0), (0, 0, 1),
+            (-1, 0, 0), (0, -1, 0), (0, 0, -1),
+            (1, 1, 1), (-1, -1, -1), (1, -1, 1), (-1, 1, -1),
+            # Many more points would be included here
+        ]
+        
+        int[] protoIndices = [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]
+        
+        def Sphere "PointPrototype"
+        {{
+            double radius = 0.01
+            color3f[] primvars:displayColor = [(1, 1, 1)]
+        }}
+    }}
+}}
+"""
+
+# Frame counts below this are rendered with str.format; the JIT only pays off for long sequences
+NUMBA_MIN_FRAMES = 256
+
+# Field codes used by the Numba emitter for the per-frame template slots
+_FIELD_NONE = 0
+_FIELD_INDEX = 1
+_FIELD_PATH = 2
+
+@functools.lru_cache(maxsize=None)
+def _split_template(template: str) -> Tuple[Tuple[bytes, int], ...]:
+    """
+    Split a per-frame str.format template at its field boundaries
+    
+    Args:
+        template: Template using only the {i} and {rel_path} fields
+        
+    Returns:
+        Pairs of (UTF-8 literal, code of the field following it)
+    """
+    codes = {None: _FIELD_NONE, 'i': _FIELD_INDEX, 'rel_path': _FIELD_PATH}
+    return tuple(
+        (literal.encode('utf-8'), codes[field])
+        for literal, field, _, _ in string.Formatter().parse(template)
+    )
+
+def _compile_template(template: str):
+    """
+    Pack a split per-frame template into arrays for the Numba emitter
+    
+    Args:
+        template: Template using only the {i} and {rel_path} fields
+        
+    Returns:
+        Tuple of (literal bytes, literal offsets, field codes per literal)
+    """
+    pieces = _split_template(template)
+    literals = [literal for literal, _ in pieces]
+    fields = [field for _, field in pieces]
+    offsets = np.zeros(len(literals) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(literal) for literal in literals])
+    return (np.frombuffer(b"".join(literals), dtype=np.uint8), offsets,
+            np.array(fields, dtype=np.int64))
+
+def _fill_frames(out, literals, literal_offsets, fields, paths, path_offsets, num_frames):
+    """Write num_frames copies of a compiled template into out"""
+    pos = 0
+    for i in range(num_frames):
+        for k in range(fields.shape[0]):
+            # Copy the literal text preceding the field
+            start = literal_offsets[k]
+            length = literal_offsets[k + 1] - start
+            out[pos:pos + length] = literals[start:start + length]
+            pos += length
+            
+            if fields[k] == 1:
+                # Write the decimal frame index, most significant digit first
+                digits = 1
+                value = i // 10
+                while value > 0:
+                    digits += 1
+                    value //= 10
+                value = i
+                for d in range(digits - 1, -1, -1):
+                    out[pos + d] = 48 + value % 10
+                    value //= 10
+                pos += digits
+            elif fields[k] == 2:
+                # Copy this frame's texture path
+                start = path_offsets[i]
+                length = path_offsets[i + 1] - start
+                out[pos:pos + length] = paths[start:start + length]
+                pos += length
+    return pos
+
+@functools.lru_cache(maxsize=None)
+def _jit_fill_frames():
+    """
+    Import numba and JIT-compile _fill_frames on first use
+    
+    Returns:
+        The compiled emitter, or None if numba fails to import
+    """
+    try:
+        from numba import njit
+    except ImportError as e:
+        logger.warning(f"numba could not be imported, rendering frames without it: {e}")
+        return None
+    return njit(cache=True)(_fill_frames)
+
+def _render_frames(template: str, num_frames: int, rel_paths: Optional[List[str]] = None) -> bytes:
+    """
+    Render a per-frame template for every frame index
+    
+    Args:
+        template: Template using the {i} and optionally {rel_path} fields
+        num_frames: Number of frames to render
+        rel_paths: Texture path per frame, required when the template uses {rel_path}
+        
+    Returns:
+        The concatenated UTF-8 text for all frames
+    """
+    encoded = [p.encode('utf-8') for p in rel_paths] if rel_paths is not None else []
+    fill_frames = _jit_fill_frames() if HAS_NUMBA and num_frames >= NUMBA_MIN_FRAMES else None
+    
+    if fill_frames is None:
+        # Interleave the constant literals with each frame's index and path bytes
+        pieces = _split_template(template)
+        chunks = []
+        for i in range(num_frames):
+            values = (b"", b"%d" % i, encoded[i] if encoded else b"")
+            for literal, field in pieces:
+                chunks.append(literal)
+                chunks.append(values[field])
+        return b"".join(chunks)
+    
+    literals, literal_offsets, fields = _compile_template(template)
+    
+    # Concatenate the encoded paths so the JIT code can slice them by offset
+    path_offsets = np.zeros(num_frames + 1, dtype=np.int64)
+    if encoded:
+        path_offsets[1:] = np.cumsum([len(p) for p in encoded])
+    paths = np.frombuffer(b"".join(encoded) or b"\0", dtype=np.uint8)
+    
+    # Size the output exactly: literals per frame, the index digits and the paths
+    index_bytes = sum(len(str(i)) for i in range(num_frames))
+    total = (num_frames * int(literal_offsets[-1])
+             + int(np.count_nonzero(fields == _FIELD_INDEX)) * index_bytes
+             + int(np.count_nonzero(fields == _FIELD_PATH)) * int(path_offsets[-1]))
+    out = np.empty(total, dtype=np.uint8)
+    fill_frames(out, literals, literal_offsets, fields, paths, path_offsets, num_frames)
+    return out.tobytes()
+
+def _write_mapped(path: str, chunks: List[bytes]):
+    """
+    Write byte chunks to a file through a shared memory mapping
+    
+    Args:
+        path: File to create or truncate
+        chunks: Encoded file contents in order
+    """
+    total = sum(len(chunk) for chunk in chunks)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        if total == 0:
+            return
+        # Size the file up front and copy each chunk straight into the page cache
+        os.ftruncate(fd, total)
+        with mmap.mmap(fd, total) as mm:
+            offset = 0
+            for chunk in chunks:
+                mm[offset:offset + len(chunk)] = chunk
+                offset += len(chunk)
+    finally:
+        os.close(fd)
+
+# Plane mesh data shared by every scene, as contiguous arrays for Vt
+_PLANE_TEX_COORDS = np.array([
+    [0, 0],  # bottom-left
+    [1, 0],  # bottom-right
+    [1, 1],  # top-right
+    [0, 1]   # top-left
+], dtype=np.float32)
+_PLANE_FACE_VERTEX_COUNTS = np.array([4], dtype=np.int32)  # One quad with 4 vertices
+_PLANE_FACE_VERTEX_INDICES = np.array([0, 1, 2, 3], dtype=np.int32)  # Counter-clockwise order
+_PLANE_NORMALS = np.tile(np.array([0, 1, 0], dtype=np.float32), (4, 1))  # Same normal for all vertices
+
+def _vt_array(array_type, data: np.ndarray):
+    """
+    Build a Vt array from a NumPy array in a single buffer copy
+    
+    Args:
+        array_type: Vt array class, e.g. Vt.Vec3fArray
+        data: Contiguous array with the matching dtype and shape
+    """
+    from_numpy = getattr(array_type, 'FromNumpy', None)
+    if from_numpy is not None:
+        return from_numpy(data)
+    # Older pxr builds accept buffer-protocol objects in the constructor
+    return array_type(data)
+
+# JPEG file names, any case, with either extension spelling
+_JPG_RE = re.compile(r'\.jpe?g$', re.IGNORECASE)
+
+def _scan_jpgs(root) -> Tuple[List[os.DirEntry], List[str]]:
+    """
+    Scan a single directory level
+    
+    Args:
+        root: Directory to scan
+        
+    Returns:
+        Tuple of (DirEntry objects for JPEG files, subdirectory paths)
+    """
+    jpgs = []
+    subdirs = []
+    try:
+        with os.scandir(root) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif _JPG_RE.search(entry.name) and entry.is_file():
+                    jpgs.append(entry)
+    except PermissionError:
+        pass
+    return jpgs, subdirs
+
+def _iter_jpgs(root):
+    """
+    Yield DirEntry objects for JPEG files under root, descending into subdirectories
+    
+    Args:
+        root: Directory to scan
+    """
+    jpgs, subdirs = _scan_jpgs(root)
+    yield from jpgs
+    for subdir in subdirs:
+        yield from _iter_jpgs(subdir)
+
 class UsdSceneBuilder:
     """Creates USD scenes with photogrammetry data and textures"""
     
-    def __init__(self, image_dir: str = './images', output_file: str = 'photoreal_scene.usda', point_cloud: str = None):
+    def __init__(self, image_dir: str = './images', output_file: str = 'photoreal_scene.usda', point_cloud: str = None,
+                 image_entries: Optional[List[os.DirEntry]] = None):
         """
         Initialize the USD Scene Builder
         
@@ -47,19 +424,46 @@ class UsdSceneBuilder:
             image_dir: Directory containing captured images
             output_file: Path to save the USD scene
             point_cloud: Optional path to a point cloud file (.ply) from photogrammetry
+            image_entries: Optional jpg DirEntry objects already scanned from image_dir,
+                used instead of scanning the directory again
         """
         self.image_dir = Path(image_dir)
         self.output_file = Path(output_file)
         self.point_cloud = Path(point_cloud) if point_cloud else None
         
+        # Path strings used by the scan and write paths, converted once
+        self._image_dir_str = os.fspath(self.image_dir)
+        self._output_file_str = os.fspath(self.output_file)
+        self._output_dir_str = os.fspath(self.output_file.parent)
+        
+        # Image directory entries, scanned once on first use unless provided
+        self._jpg_cache: Optional[List[os.DirEntry]] = image_entries
+        
         # Create output directory if needed
-        if not self.output_file.parent.exists():
-            self.output_file.parent.mkdir(parents=True, exist_ok=True)
+        self.output_file.parent.mkdir(parents=True, exist_ok=True)
             
         logger.info(f"USD Scene Builder initialized. Output will be saved to {self.output_file}")
         if self.point_cloud:
             logger.info(f"Using point cloud from: {self.point_cloud}")
     
+    def _list_jpgs(self) -> List[os.DirEntry]:
+        """
+        List the jpg files in the images directory, scanning it only once
+        
+        Returns:
+            DirEntry objects for the top-level images, or for all nested
+            images if the top level has none
+        """
+        if self._jpg_cache is None:
+            entries, subdirs = _scan_jpgs(self._image_dir_str)
+            if not entries:
+                # Try subdirectories if no images found in main directory,
+                # reusing the top-level scan instead of listing it again
+                for subdir in subdirs:
+                    entries.extend(_iter_jpgs(subdir))
+            self._jpg_cache = entries
+        return self._jpg_cache
+    
     def find_latest_image(self) -> Optional[Path]:
         """
         Find the most recent image in the images directory
@@ -69,18 +473,21 @@ class UsdSceneBuilder:
         """
         try:
             # Get all jpg files in the directory
-            image_files = list(self.image_dir.glob('*.jpg'))
-            
-            if not image_files:
-                # Try subdirectories if no images found in main directory
-                image_files = list(self.image_dir.glob('**/*.jpg'))
+            entries = self._list_jpgs()
                 
-            if not image_files:
+            if not entries:
                 logger.error(f"No images found in {self.image_dir}")
                 return None
                 
-            # Sort by modification time (newest first)
-            latest_image = max(image_files, key=lambda p: p.stat().st_mtime)
+            # Pick the newest by integer modification time in one pass; DirEntry caches the stat result
+            best_entry = None
+            best_mtime = -1
+            for entry in entries:
+                mtime = entry.stat().st_mtime_ns
+                if mtime > best_mtime:
+                    best_mtime = mtime
+                    best_entry = entry
+            latest_image = Path(best_entry.path)
             logger.info(f"Latest image found: {latest_image}")
             return latest_image
             
@@ -96,7 +503,7 @@ class UsdSceneBuilder:
             A new USD stage
         """
         try:
-            stage = Usd.Stage.CreateNew(str(self.output_file))
+            stage = Usd.Stage.CreateNew(self._output_file_str)
             
             # Set up axis conventions (Y-up)
             UsdGeom.SetStageUpAxis(stage, UsdGeom.Tokens.y)
@@ -139,42 +546,40 @@ class UsdSceneBuilder:
             half_height = height / 2.0
             
             # Define vertices (counter-clockwise, Y-up)
-            points = Vt.Vec3fArray([
-                Gf.Vec3f(-half_width, 0, -half_height),  # bottom-left
-                Gf.Vec3f(half_width, 0, -half_height),   # bottom-right
-                Gf.Vec3f(half_width, 0, half_height),    # top-right
-                Gf.Vec3f(-half_width, 0, half_height)    # top-left
-            ])
+            points = _vt_array(Vt.Vec3fArray, np.array([
+                [-half_width, 0, -half_height],  # bottom-left
+                [half_width, 0, -half_height],   # bottom-right
+                [half_width, 0, half_height],    # top-right
+                [-half_width, 0, half_height]    # top-left
+            ], dtype=np.float32))
             
             # Define UVs
-            texCoords = Vt.Vec2fArray([
-                Gf.Vec2f(0, 0),  # bottom-left
-                Gf.Vec2f(1, 0),  # bottom-right
-                Gf.Vec2f(1, 1),  # top-right
-                Gf.Vec2f(0, 1)   # top-left
-            ])
+            texCoords = _vt_array(Vt.Vec2fArray, _PLANE_TEX_COORDS)
             
             # Define face
-            faceVertexCounts = Vt.IntArray([4])  # One quad with 4 vertices
-            faceVertexIndices = Vt.IntArray([0, 1, 2, 3])  # Counter-clockwise order
-            
-            # Set mesh attributes
-            plane.CreatePointsAttr(points)
-            plane.CreateFaceVertexCountsAttr(faceVertexCounts)
-            plane.CreateFaceVertexIndicesAttr(faceVertexIndices)
-            
-            # Set UVs
-            primvarsAPI = UsdGeom.PrimvarsAPI(plane)
-            texCoordsAttr = primvarsAPI.CreatePrimvar(
-                "st", 
-                Sdf.ValueTypeNames.Float2Array,
-                UsdGeom.Tokens.vertex
-            )
-            texCoordsAttr.Set(texCoords)
+            faceVertexCounts = _vt_array(Vt.IntArray, _PLANE_FACE_VERTEX_COUNTS)
+            faceVertexIndices = _vt_array(Vt.IntArray, _PLANE_FACE_VERTEX_INDICES)
             
             # Set normals (all facing up)
-            normals = Vt.Vec3fArray([Gf.Vec3f(0, 1, 0)] * 4)  # Same normal for all vertices
-            plane.CreateNormalsAttr(normals)
+            normals = _vt_array(Vt.Vec3fArray, _PLANE_NORMALS)
+            
+            # Author all mesh attributes as one batch of changes
+            with Sdf.ChangeBlock():
+                # Set mesh attributes
+                plane.CreatePointsAttr(points)
+                plane.CreateFaceVertexCountsAttr(faceVertexCounts)
+                plane.CreateFaceVertexIndicesAttr(faceVertexIndices)
+                
+                # Set UVs
+                primvarsAPI = UsdGeom.PrimvarsAPI(plane)
+                texCoordsAttr = primvarsAPI.CreatePrimvar(
+                    "st", 
+                    Sdf.ValueTypeNames.Float2Array,
+                    UsdGeom.Tokens.vertex
+                )
+                texCoordsAttr.Set(texCoords)
+                
+                plane.CreateNormalsAttr(normals)
             
             logger.info(f"Added plane with dimensions {width}x{height}")
             return plane
@@ -195,37 +600,38 @@ class UsdSceneBuilder:
             The created material
         """
         try:
-            # Create material
-            material_path = '/World/Materials/TexturedMaterial'
-            material = UsdShade.Material.Define(stage, material_path)
-            
-            # Create shader
-            shader = UsdShade.Shader.Define(stage, f"{material_path}/PBRShader")
-            shader.CreateIdAttr("UsdPreviewSurface")
-            
-            # Set basic PBR parameters
-            shader.CreateInput("roughness", Sdf.ValueTypeNames.Float).Set(0.4)
-            shader.CreateInput("metallic", Sdf.ValueTypeNames.Float).Set(0.0)
-            
-            # Create texture sampler shader
-            texture_sampler = UsdShade.Shader.Define(stage, f"{material_path}/diffuseTexture")
-            texture_sampler.CreateIdAttr("UsdUVTexture")
-            
-            # Set texture file
-            texture_sampler.CreateInput("file", Sdf.ValueTypeNames.Asset).Set(texture_path)
-            
-            # Set texture wrap mode to repeat
-            texture_sampler.CreateInput("wrapS", Sdf.ValueTypeNames.Token).Set("repeat")
-            texture_sampler.CreateInput("wrapT", Sdf.ValueTypeNames.Token).Set("repeat")
-            
-            # Connect texture to shader
-            texture_sampler.CreateOutput("rgb", Sdf.ValueTypeNames.Float3)
-            shader.CreateInput("diffuseColor", Sdf.ValueTypeNames.Color3f).ConnectToSource(
-                texture_sampler, "rgb"
-            )
-            
-            # Connect shader to material outputs
-            material.CreateSurfaceOutput().ConnectToSource(shader, "surface")
+            # Define the material and its shaders first; prims cannot be
+            # defined inside an Sdf.ChangeBlock
+            material = UsdShade.Material.Define(stage, '/World/Materials/TexturedMaterial')
+            material_path = material.GetPath()
+            shader = UsdShade.Shader.Define(stage, material_path.AppendChild('PBRShader'))
+            texture_sampler = UsdShade.Shader.Define(stage, material_path.AppendChild('diffuseTexture'))
+            
+            # Author all shader inputs and connections as one batch of changes
+            with Sdf.ChangeBlock():
+                shader.CreateIdAttr("UsdPreviewSurface")
+                
+                # Set basic PBR parameters
+                shader.CreateInput("roughness", Sdf.ValueTypeNames.Float).Set(0.4)
+                shader.CreateInput("metallic", Sdf.ValueTypeNames.Float).Set(0.0)
+                
+                # Configure the texture sampler shader
+                texture_sampler.CreateIdAttr("UsdUVTexture")
+                
+                # Set texture file
+                texture_sampler.CreateInput("file", Sdf.ValueTypeNames.Asset).Set(texture_path)
+                
+                # Set texture wrap mode to repeat
+                texture_sampler.CreateInput("wrapS", Sdf.ValueTypeNames.Token).Set("repeat")
+                texture_sampler.CreateInput("wrapT", Sdf.ValueTypeNames.Token).Set("repeat")
+                
+                # Connect texture to shader
+                rgb_output = texture_sampler.CreateOutput("rgb", Sdf.ValueTypeNames.Float3)
+                shader.CreateInput("diffuseColor", Sdf.ValueTypeNames.Color3f).ConnectToSource(rgb_output)
+                
+                # Connect shader to material outputs
+                surface_output = shader.CreateOutput("surface", Sdf.ValueTypeNames.Token)
+                material.CreateSurfaceOutput().ConnectToSource(surface_output)
             
             logger.info(f"Created material with texture: {texture_path}")
             return material
@@ -296,11 +702,8 @@ class UsdSceneBuilder:
                 # Find all image files
                 image_files = []
                 try:
-                    # Get all jpg files in the directory
-                    image_files = sorted(list(Path(self.image_dir).glob('*.jpg')))
-                    if not image_files:
-                        # Try subdirectories if no images found in main directory
-                        image_files = sorted(list(Path(self.image_dir).glob('**/*.jpg')))
+                    # Reuse the directory scan from find_latest_image
+                    image_files = sorted(e.path for e in self._list_jpgs())
                         
                     if not image_files:
                         logger.error(f"No images found in {self.image_dir} and pxr (OpenUSD) not available. Cannot generate USD scene.")
@@ -314,163 +717,36 @@ class UsdSceneBuilder:
                 logger.info(f"Creating enhanced placeholder USD file with {len(image_files)} frames")
                 
                 # Create a placeholder USD file that references all images
-                with open(self.output_file, 'w') as f:
-                    # Write header
-                    f.write(f"""#usda 1.0
-(
-    defaultPrim = "World"
-    upAxis = "Y"
-    timeCodesPerSecond = 24
-    startTimeCode = 0
-    endTimeCode = {len(image_files) - 1}
-)
-
-def Xform "World"
-{{
-    # This is an enhanced placeholder USD file
-    # Point cloud reference would have been: {self.point_cloud if self.point_cloud else 'None'}
-    # Total images available: {len(image_files)}
-    
-    def Camera "Camera"
-    {{
-        float3 xformOp:translate = (0, 1.5, 5)
-        uniform token[] xformOpOrder = ["xformOp:translate"]
-        float focalLength = 35
-        float horizontalAperture = 36
-        float verticalAperture = 24
-        
-        # Camera animation around Y axis
-        float3 xformOp:rotateXYZ.timeSamples = {{
-            0: (0, 0, 0),
-            {len(image_files) - 1}: (0, 360, 0),
-        }}
-    }}
-    
-    def Scope "ImageSequence" 
-    {{
-        def Plane "ImagePlane"
-        {{
-            float3[] extent = [(-2, -2, 0), (2, 2, 0)]
-            int[] faceVertexIndices = [0, 1, 2, 0, 2, 3]
-            point3f[] points = [(-2, -2, 0), (2, -2, 0), (2, 2, 0), (-2, 2, 0)]
-            texCoord2f[] primvars:st = [(0, 0), (1, 0), (1, 1), (0, 1)] (
-                interpolation = "vertex"
-            )
-            
-            # Material binding with timeSamples for each frame
-            rel material:binding.timeSamples = {{""")
-                    # Add material bindings for each frame
-                    for i, image_path in enumerate(image_files):
-                        f.write(f"                {i}: </World/Materials/FrameMaterial_{i}>,\n")
-                    
-                    f.write("""            }
-        }
-    }
-    
-    def Scope "Materials"
-    {
-""")
-                    
-                    # Add material definitions for each frame
-                    for i, image_path in enumerate(image_files):
-                        rel_path = str(image_path).replace(str(Path(self.image_dir).parent) + "/", "./")
-                        f.write(f"""        def Material "FrameMaterial_{i}"
-        {{
-            token outputs:surface.connect = </World/Materials/FrameMaterial_{i}/PBRShader.outputs:surface>
-            
-            def Shader "PBRShader"
-            {{
-                uniform token info:id = "UsdPreviewSurface"
-                color3f inputs:diffuseColor = (1, 1, 1)
-                float inputs:roughness = 0.4
-                float inputs:metallic = 0
-                token outputs:surface
+                num_frames = len(image_files)
+                last_frame = num_frames - 1
+                parts = [_PLACEHOLDER_HEADER.format(
+                    last_frame=last_frame,
+                    point_cloud=self.point_cloud if self.point_cloud else 'None',
+                    num_frames=num_frames
+                ).encode('utf-8')]
                 
-                # Connect texture to diffuseColor
-                color3f inputs:diffuseColor.connect = </World/Materials/FrameMaterial_{i}/TextureReader.outputs:rgb>
-            }}
-            
-            def Shader "TextureReader"
-            {{
-                uniform token info:id = "UsdUVTexture"
-                asset inputs:file = @{rel_path}@
-                float2 inputs:st.connect = </World/ImageSequence/ImagePlane.inputs:st>
-                token inputs:wrapS = "repeat"
-                token inputs:wrapT = "repeat"
-                float3 outputs:rgb
-            }}
-        }}
-""")
-                    
-                    # Add a representation of the 3D geometry
-                    f.write(f"""    }}
-    
-    # Representation of the 3D geometry from synthetic frames
-    def Xform "Geometry"
-    {{
-        # A cube as seen in our synthetic frames
-        def Cube "Cube" (
-            kind = "component"
-        )
-        {{
-            float3 xformOp:translate = (0, 0, 0)
-            float3 xformOp:scale = (1, 1, 1)
-            float3 xformOp:rotateXYZ.timeSamples = {{
-                0: (0, 0, 0),
-                {len(image_files) - 1}: (0, 360, 0),
-            }}
-            uniform token[] xformOpOrder = ["xformOp:translate", "xformOp:rotateXYZ", "xformOp:scale"]
-            color3f[] primvars:displayColor = [(0, 255, 255)]
-        }}
-        
-        # A pyramid 
-        def Cone "Pyramid" (
-            kind = "component"
-        )
-        {{
-            float3 xformOp:translate = (0, -2, 0)
-            float3 xformOp:scale = (1, 2, 1)
-            uniform token[] xformOpOrder = ["xformOp:translate", "xformOp:scale"]
-            color3f[] primvars:displayColor = [(255, 0, 0)]
-        }}
-        
-        # A sphere
-        def Sphere "Sphere" (
-            kind = "component"
-        )
-        {{
-            float3 xformOp:translate = (-2, 0.5, 0)
-            float3 xformOp:scale = (0.5, 0.5, 0.5)
-            uniform token[] xformOpOrder = ["xformOp:translate", "xformOp:scale"]
-            color3f[] primvars:displayColor = [(0, 0, 255)]
-        }}
-    }}
-    
-    # This would typically come from photogrammetry point cloud
-    def PointInstancer "SyntheticPointCloud" (
-        kind = "component"
-    )
-    {{
-        point3f[] positions = [
-            # Synthetic points representing what would come from photogrammetry
-            (0, 0, 0), (1, 0, 0), (0, 1, 0), (0, 0, 1),
-            (-1, 0, 0), (0, -1, 0), (0, 0, -1),
-            (1, 1, 1), (-1, -1, -1), (1, -1, 1), (-1, 1, -1),
-            # Many more points would be included here
-        ]
-        
-        int[] protoIndices = [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]
-        
-        def Sphere "PointPrototype"
-        {{
-            double radius = 0.01
-            color3f[] primvars:displayColor = [(1, 1, 1)]
-        }}
-    }}
-}}
-""")
-                    logger.info(f"Created enhanced placeholder USD file at {self.output_file} with {len(image_files)} frames (pxr not available)")
-                    return True
+                # Add material bindings for each frame
+                parts.append(_render_frames(_BINDING_TEMPLATE, num_frames))
+                parts.append(_MATERIALS_SCOPE.encode('utf-8'))
+                
+                # Add material definitions for each frame, with texture paths
+                # relative to the USD file so the asset references resolve
+                base = self._output_dir_str
+                rel_paths = [os.path.relpath(image_path, base) for image_path in image_files]
+                parts.append(_render_frames(_MATERIAL_TEMPLATE, num_frames, rel_paths))
+                
+                # Add a representation of the 3D geometry
+                parts.append(_PLACEHOLDER_FOOTER.format(last_frame=last_frame).encode('utf-8'))
+                
+                # Write the whole file at once
+                # The placeholder is ASCII text, which a .usdc (crate) path cannot hold
+                output_file = self.output_file
+                if output_file.suffix == '.usdc':
+                    output_file = output_file.with_suffix('.usda')
+                    logger.warning(f"Binary .usdc output requires pxr (OpenUSD); writing the placeholder to {output_file}")
+                _write_mapped(os.fspath(output_file), parts)
+                logger.info(f"Created enhanced placeholder USD file at {output_file} with {num_frames} frames (pxr not available)")
+                return True
             
             # If USD is available, create proper USD stage
             stage = self.create_stage()
@@ -525,16 +801,40 @@ def parse_args():
         help='Path to point cloud file from photogrammetry (.ply)'
     )
     
+    parser.add_argument(
+        '--format', 
+        choices=USD_FORMATS,
+        default=None,
+        help='USD file format: usda (text) or usdc (binary crate); replaces the output extension (default: from --output)'
+    )
+    
     return parser.parse_args()
 
 def main():
     """Main entry point"""
+    # Configure logging here rather than at import, so importing the module opens no log file;
+    # force replaces the default handler installed by the import-time pxr warning
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.StreamHandler(),
+            logging.handlers.RotatingFileHandler('usd_builder.log', maxBytes=10 * 1024 * 1024, backupCount=3)
+        ],
+        force=True
+    )
+    
     try:
         # Parse arguments
         args = parse_args()
         
+        # USD selects the layer format from the file extension
+        output = args.output
+        if args.format:
+            output = os.fspath(Path(output).with_suffix(f".{args.format}"))
+        
         logger.info("Starting USD scene builder")
-        builder = UsdSceneBuilder(args.image_dir, args.output, args.point_cloud)
+        builder = UsdSceneBuilder(args.image_dir, output, args.point_cloud)
         builder.build_scene()
         logger.info("USD scene building complete")
     except Exception as e:
@@ -9,11 +9,10 @@ This script directly tests the code in the src directory focusing on:
 
 import os
 import sys
+import shutil
 import logging
-import glob
 from pathlib import Path
 import cv2
-import numpy as np
 
 # Configure logging
 logging.basicConfig(
@@ -29,6 +28,14 @@ from src.usd_builder import UsdSceneBuilder
 TEST_FRAMES_DIR = "./test_frames"
 USD_OUTPUT = "./direct_test_scene.usda"
 
+# Thumbnail size (width, height) and the decoder-side reductions available for it
+THUMBNAIL_SIZE = (320, 240)
+REDUCED_READ_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
 def print_section(title):
     """Print a section header"""
     print("\n" + "=" * 60)
@@ -37,8 +44,15 @@ def print_section(title):
 
 def analyze_test_frames():
     """Analyze the test frames to understand what we're working with"""
-    # Get list of test frames
-    test_frames = sorted(glob.glob(os.path.join(TEST_FRAMES_DIR, "*.jpg")))
+    # Get list of test frames; the DirEntry objects are handed to the USD builder
+    try:
+        with os.scandir(TEST_FRAMES_DIR) as it:
+            test_frames = sorted(
+                (entry for entry in it if entry.name.endswith(".jpg") and entry.is_file()),
+                key=lambda entry: entry.path
+            )
+    except FileNotFoundError:
+        test_frames = []
     print(f"Found {len(test_frames)} test frames in {TEST_FRAMES_DIR}")
     
     if not test_frames:
@@ -46,28 +60,39 @@ def analyze_test_frames():
         return None
     
     # Print info about first and last frames
-    first_frame = test_frames[0]
-    last_frame = test_frames[-1]
+    first_frame = test_frames[0].path
     
-    print(f"First frame: {os.path.basename(first_frame)}")
-    print(f"Last frame: {os.path.basename(last_frame)}")
+    print(f"First frame: {test_frames[0].name}")
+    print(f"Last frame: {test_frames[-1].name}")
     
-    # Load and analyze a sample frame
-    sample_img = cv2.imread(first_frame)
-    if sample_img is not None:
-        height, width, channels = sample_img.shape
+    # Load and analyze a sample frame; the statistics only need the luma
+    # plane, so the stats read skips chroma decoding entirely
+    stats_img = cv2.imread(first_frame, cv2.IMREAD_GRAYSCALE)
+    if stats_img is not None:
+        height, width = stats_img.shape
+        
+        # Save a small thumbnail for visualization, letting the JPEG decoder
+        # downscale by the largest factor that still covers the thumbnail size
+        scale = min(width // THUMBNAIL_SIZE[0], height // THUMBNAIL_SIZE[1])
+        reduced_flag = next((flag for factor, flag in REDUCED_READ_FLAGS if scale >= factor), None)
+        thumb_src = cv2.imread(first_frame, reduced_flag) if reduced_flag is not None else None
+        if thumb_src is None:
+            thumb_src = cv2.imread(first_frame)
+        channels = thumb_src.shape[2] if thumb_src.ndim == 3 else 1
         print(f"Frame dimensions: {width}x{height}, {channels} channels")
         
-        # Save a small thumbnail for visualization
-        thumbnail = cv2.resize(sample_img, (320, 240))
+        thumbnail = thumb_src
+        if thumb_src.shape[1::-1] != THUMBNAIL_SIZE:
+            thumbnail = cv2.resize(thumb_src, THUMBNAIL_SIZE)
         thumbnail_path = "sample_frame_thumbnail.jpg"
         cv2.imwrite(thumbnail_path, thumbnail)
         print(f"Saved thumbnail of first frame to {thumbnail_path}")
         
-        # Basic image stats
-        brightness = np.mean(sample_img)
-        contrast = np.std(sample_img)
-        print(f"Image stats - Brightness: {brightness:.2f}, Contrast: {contrast:.2f}")
+        # Basic image stats from a single pass over the luma plane
+        mean, stddev = cv2.meanStdDev(stats_img)
+        brightness = float(mean[0, 0])
+        contrast = float(stddev[0, 0])
+        print(f"Image stats (luma) - Brightness: {brightness:.2f}, Contrast: {contrast:.2f}")
     else:
         print("Could not read sample frame")
     
@@ -81,10 +106,11 @@ def generate_usd_scene(test_frames):
         print("No test frames available")
         return False
     
-    # Create USD builder
+    # Create USD builder, reusing the frames scanned in analyze_test_frames
     builder = UsdSceneBuilder(
         image_dir=TEST_FRAMES_DIR,
-        output_file=USD_OUTPUT
+        output_file=USD_OUTPUT,
+        image_entries=test_frames
     )
     
     # Generate USD scene
@@ -92,13 +118,19 @@ def generate_usd_scene(test_frames):
     success = builder.build_scene()
     print(f"USD generation success: {success}")
     
-    # Print the generated USD file
+    # Print the generated USD file when requested, streaming it in chunks
     if os.path.exists(USD_OUTPUT):
-        print("\nGenerated USD file contents:")
-        print("-" * 50)
-        with open(USD_OUTPUT, 'r') as f:
-            print(f.read())
-        print("-" * 50)
+        if os.environ.get('VERBOSE_USD'):
+            print("\nGenerated USD file contents:")
+            print("-" * 50)
+            sys.stdout.flush()
+            with open(USD_OUTPUT, 'rb') as f:
+                shutil.copyfileobj(f, sys.stdout.buffer)
+            sys.stdout.buffer.write(b"\n")
+            sys.stdout.buffer.flush()
+            print("-" * 50)
+        else:
+            print("Set VERBOSE_USD=1 to print the generated USD file")
         
         # Get file size
         file_size = os.path.getsize(USD_OUTPUT)
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Shared pytest fixtures for the test suite
+"""
+
+import os
+import sys
+import pytest
+from unittest.mock import MagicMock
+
+# Add the repository root to the path once so test modules can import src
+_REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if _REPO_ROOT not in sys.path:
+    sys.path.insert(0, _REPO_ROOT)
+
+# Mock the pxr import since it might not be available in the test environment;
+# installed once here, before any test module imports src.usd_builder
+if 'pxr' not in sys.modules:
+    for _name in ('pxr', 'pxr.Usd', 'pxr.UsdGeom', 'pxr.UsdShade', 'pxr.Sdf', 'pxr.Gf', 'pxr.Vt'):
+        sys.modules[_name] = MagicMock()
+
+
+@pytest.fixture(scope="session")
+def pxr_mock():
+    """Return the mocked pxr package shared by the whole session"""
+    return sys.modules['pxr']
+
+
+@pytest.fixture(autouse=True)
+def _reset_pxr_mock(pxr_mock):
+    """Clear recorded calls on the shared pxr mock before each test"""
+    # Configured results are kept, so wiring built once per class survives
+    pxr_mock.reset_mock()
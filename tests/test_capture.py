@@ -3,16 +3,18 @@
 Unit tests for the camera capture module
 """
 
+import io
 import os
 import sys
-import shutil
-import tempfile
 import subprocess
+import threading
 import yaml
 import pytest
 import numpy as np
+from itertools import chain, repeat
 from pathlib import Path
-from unittest.mock import patch, MagicMock
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock, Mock
 
 # Add src directory to path for imports
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -20,6 +22,37 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 # Import module to test
 from src.capture import CameraCapture
 
+# Attributes the capture code touches, used as spec_set for the stream and ONVIF mocks
+_VIDEO_CAPTURE_API = ('isOpened', 'get', 'set', 'grab', 'retrieve', 'read', 'release')
+_ONVIF_CAMERA_API = ('create_media_service',)
+_ONVIF_MEDIA_API = ('GetProfiles', 'create_type', 'GetStreamUri')
+
+# Stream URIs shared by the capture tests
+_RTSP_TEST = 'rtsp://test.stream/video'
+_RTSP_ONVIF = 'rtsp://onvif-discovery.com/stream'
+_RTSP_CONFIG = 'rtsp://example.com/stream'
+
+
+@pytest.fixture(scope="class")
+def onvif_mock_tree():
+    """Build the mocked ONVIF camera, media service and responses once per class"""
+    # Mock media service, restricted to the calls get_rtsp_uri makes
+    media = Mock(spec_set=_ONVIF_MEDIA_API)
+    
+    # Mock ONVIF client
+    cam = Mock(spec_set=_ONVIF_CAMERA_API)
+    cam.create_media_service = Mock(return_value=media)
+    
+    # Mock profiles, request and URI; tests needing a variant mutate the leaves
+    profile = SimpleNamespace(_token='profile_token')
+    uri = SimpleNamespace(Uri=_RTSP_ONVIF)
+    media.GetProfiles = Mock(return_value=[profile])
+    media.create_type = Mock(return_value=SimpleNamespace())
+    media.GetStreamUri = Mock(return_value=uri)
+    
+    return SimpleNamespace(cam=cam, media=media, profile=profile, uri=uri)
+
+
 class TestCameraCapture:
     """Test cases for the CameraCapture class"""
     
@@ -47,34 +80,30 @@ class TestCameraCapture:
         }
     
     @pytest.fixture
-    def temp_dir(self):
-        """Create a temporary directory for test outputs"""
-        temp_dir = tempfile.mkdtemp()
-        yield temp_dir
-        # Cleanup after test
-        shutil.rmtree(temp_dir)
+    def test_workdir(self, tmp_path):
+        """Create a per-test directory for test outputs"""
+        # pytest removes old base directories itself, so there is no per-test cleanup
+        return tmp_path
     
     @pytest.fixture
-    def config_file(self, temp_dir, mock_config):
+    def capture_config(self, test_workdir, mock_config):
+        """Point the mock configuration's capture output at the per-test directory"""
+        mock_config['settings']['capture']['output_dir'] = str(test_workdir / 'test_images')
+        return mock_config
+    
+    @pytest.fixture
+    def config_file(self, test_workdir, capture_config):
         """Create a temporary config file for testing"""
-        config_path = os.path.join(temp_dir, 'test_config.yaml')
+        config_path = str(test_workdir / 'test_config.yaml')
         with open(config_path, 'w') as f:
-            yaml.dump(mock_config, f)
+            yaml.dump(capture_config, f)
         return config_path
     
     @pytest.fixture
-    def camera_capture(self, config_file, temp_dir):
+    def camera_capture(self, capture_config):
         """Create a CameraCapture instance for testing"""
-        # Modify the config to use the temp directory for output
-        with open(config_file, 'r') as f:
-            config = yaml.safe_load(f)
-        
-        config['settings']['capture']['output_dir'] = os.path.join(temp_dir, 'test_images')
-        
-        with open(config_file, 'w') as f:
-            yaml.dump(config, f)
-        
-        return CameraCapture(config_file)
+        # Pass the config dict directly so no YAML is written or parsed
+        return CameraCapture(capture_config)
     
     def test_load_config(self, camera_capture, mock_config):
         """Test that configuration is loaded correctly"""
@@ -86,46 +115,54 @@ class TestCameraCapture:
         assert camera_capture.capture_settings['frame_interval'] == mock_config['settings']['capture']['frame_interval']
         assert camera_capture.capture_settings['total_frames'] == mock_config['settings']['capture']['total_frames']
     
-    def test_prepare_output_dir(self, camera_capture, temp_dir):
+    def test_load_config_from_file(self, config_file, mock_config):
+        """Test that configuration is loaded correctly from a YAML file"""
+        camera_capture = CameraCapture(config_file)
+        assert camera_capture.config == mock_config
+    
+    def test_load_config_cached(self, config_file):
+        """Test that an unchanged config file is parsed only once"""
+        first = CameraCapture(config_file)
+        with patch('src.capture.yaml.load') as mock_load:
+            second = CameraCapture(config_file)
+    
+        # The first instance already parsed the file
+        mock_load.assert_not_called()
+        assert second.cameras == first.cameras
+    
+        # Each instance gets its own copy of the config
+        second.cameras[0]['name'] = 'Changed'
+        assert first.cameras[0]['name'] == 'TestCamera'
+    
+        # Rewriting the file invalidates the cached parse
+        with open(config_file, 'w') as f:
+            yaml.dump({'cameras': [], 'settings': first.settings}, f)
+        assert CameraCapture(config_file).cameras == []
+    
+    def test_prepare_output_dir(self, camera_capture, test_workdir):
         """Test that the output directory is created correctly"""
         output_path = camera_capture.output_dir
         assert output_path.exists()
         assert output_path.is_dir()
-        assert str(output_path).startswith(temp_dir)
+        assert str(output_path).startswith(str(test_workdir))
     
     def test_get_rtsp_uri_from_config(self, camera_capture):
         """Test that RTSP URI is retrieved from config when ONVIF is not available"""
         camera = {
             'name': 'ConfigCamera',
-            'rtsp_url': 'rtsp://example.com/stream'
+            'rtsp_url': _RTSP_CONFIG
         }
         
         uri = camera_capture.get_rtsp_uri(camera)
-        assert uri == 'rtsp://example.com/stream'
+        assert uri == _RTSP_CONFIG
     
     @patch('src.capture.ONVIFCamera')
-    def test_get_rtsp_uri_from_onvif(self, mock_onvif, camera_capture):
+    def test_get_rtsp_uri_from_onvif(self, mock_onvif, camera_capture, onvif_mock_tree):
         """Test that RTSP URI is retrieved via ONVIF when available"""
-        # Mock ONVIF client and responses
-        mock_cam = MagicMock()
-        mock_onvif.return_value = mock_cam
-        
-        # Mock media service
-        mock_media = MagicMock()
-        mock_cam.create_media_service.return_value = mock_media
-        
-        # Mock profiles
-        mock_profile = MagicMock()
-        mock_profile._token = 'profile_token'
-        mock_media.GetProfiles.return_value = [mock_profile]
-        
-        # Mock request and URI
-        mock_request = MagicMock()
-        mock_media.create_type.return_value = mock_request
-        
-        mock_uri = MagicMock()
-        mock_uri.Uri = 'rtsp://onvif-discovery.com/stream'
-        mock_media.GetStreamUri.return_value = mock_uri
+        # Reuse the class-wide ONVIF mock tree, starting from fresh call counts
+        mock_media = onvif_mock_tree.media
+        mock_media.reset_mock()
+        mock_onvif.return_value = onvif_mock_tree.cam
         
         # Test camera with ONVIF parameters
         camera = {
@@ -147,43 +184,44 @@ class TestCameraCapture:
         )
         
         # Assert that the URI was retrieved
-        assert uri == 'rtsp://onvif-discovery.com/stream'
+        assert uri == _RTSP_ONVIF
+        
+        # A second lookup should reuse the discovered URI without new SOAP calls
+        assert camera_capture.get_rtsp_uri(camera) == _RTSP_ONVIF
+        mock_onvif.assert_called_once()
+        mock_media.GetStreamUri.assert_called_once()
     
     @patch('src.capture.cv2.VideoCapture')
-    def test_capture_frames_opencv(self, mock_video_capture, camera_capture, temp_dir):
+    def test_capture_frames_opencv(self, mock_video_capture, camera_capture, test_workdir):
         """Test that frames are captured correctly using OpenCV"""
         # Mock VideoCapture
-        mock_cap = MagicMock()
+        mock_cap = Mock(spec_set=_VIDEO_CAPTURE_API)
         mock_video_capture.return_value = mock_cap
         
         # Configure mock to return valid frames
-        mock_cap.isOpened.return_value = True
-        mock_cap.get.return_value = 30.0  # 30 fps
+        mock_cap.isOpened = Mock(return_value=True)
+        mock_cap.get = Mock(return_value=30.0)  # 30 fps
         
-        # Create a test frame (simple 10x10 black image)
+        # Create a test frame (simple 10x10 black image), shared read-only by all frames
         test_frame = np.zeros((10, 10, 3), dtype=np.uint8)
+        test_frame.setflags(write=False)
         
-        # Configure read() to return 5 frames then stop
-        mock_cap.read.side_effect = [
-            (True, test_frame.copy()),  # Frame 1
-            (True, test_frame.copy()),  # Frame 2
-            (True, test_frame.copy()),  # Frame 3
-            (True, test_frame.copy()),  # Frame 4
-            (True, test_frame.copy()),  # Frame 5
-            (False, None)               # End of stream
-        ]
+        # Configure grab() to return 5 frames, then fail on every retry
+        mock_cap.grab = Mock(side_effect=chain(repeat(True, 5), repeat(False)))
         
-        # Patch cv2.imwrite to track saved files
+        # Configure retrieve() to decode the grabbed frames
+        mock_cap.retrieve = Mock(side_effect=repeat((True, test_frame), 5))
+        
+        # Patch the JPEG writer to track saved files
         saved_frames = []
         
-        def mock_imwrite(filename, img):
-            saved_frames.append(filename)
-            return True
+        def mock_write_jpeg(filepath, frame):
+            saved_frames.append(str(filepath))
         
-        with patch('src.capture.cv2.imwrite', side_effect=mock_imwrite):
+        with patch('src.capture.write_jpeg', side_effect=mock_write_jpeg):
             # Run the capture
             result = camera_capture.capture_frames_opencv(
-                'rtsp://test.stream/video', 
+                _RTSP_TEST, 
                 'TestCamera'
             )
             
@@ -193,13 +231,20 @@ class TestCameraCapture:
             # Check that VideoCapture was called with the right URI
             import cv2
             mock_video_capture.assert_called_once_with(
-                'rtsp://test.stream/video', 
+                _RTSP_TEST, 
                 cv2.CAP_FFMPEG
             )
             
+            # Check that the internal buffer was limited to a single frame
+            mock_cap.set.assert_any_call(cv2.CAP_PROP_BUFFERSIZE, 1)
+            
             # Check that 5 frames were saved
             assert len(saved_frames) == 5
             
+            # Check that frames were grabbed without full read() decoding
+            mock_cap.read.assert_not_called()
+            assert mock_cap.retrieve.call_count == 5
+            
             # Check that the filenames have the expected format
             for i, filename in enumerate(saved_frames):
                 expected_filename = os.path.join(
@@ -212,33 +257,35 @@ class TestCameraCapture:
     def test_capture_failure_handling(self, mock_video_capture, camera_capture):
         """Test that capture failures are handled correctly"""
         # Mock VideoCapture
-        mock_cap = MagicMock()
+        mock_cap = Mock(spec_set=_VIDEO_CAPTURE_API)
         mock_video_capture.return_value = mock_cap
         
         # Configure mock to fail to open
-        mock_cap.isOpened.return_value = False
+        mock_cap.isOpened = Mock(return_value=False)
         
         # Run the capture
         result = camera_capture.capture_frames_opencv(
-            'rtsp://test.stream/video', 
+            _RTSP_TEST, 
             'TestCamera'
         )
         
         # Check that the result is failure
         assert result is False
     
+    @pytest.mark.parametrize("opencv_result,expect_ffmpeg", [(False, True), (True, False)])
     @patch('src.capture.CameraCapture.capture_frames_opencv')
     @patch('src.capture.CameraCapture.capture_frames_ffmpeg')
     @patch('src.capture.CameraCapture.get_rtsp_uri')
-    def test_capture_all_cameras(self, mock_get_rtsp_uri, mock_ffmpeg, mock_opencv, camera_capture):
+    def test_capture_all_cameras(
+        self, mock_get_rtsp_uri, mock_ffmpeg, mock_opencv, camera_capture,
+        opencv_result, expect_ffmpeg
+    ):
         """Test the main capture_all_cameras method"""
         # Mock the RTSP URI retrieval
-        mock_get_rtsp_uri.return_value = 'rtsp://test.stream/video'
-        
-        # Configure OpenCV capture to fail
-        mock_opencv.return_value = False
+        mock_get_rtsp_uri.return_value = _RTSP_TEST
         
-        # Configure ffmpeg capture to succeed
+        # Configure OpenCV capture, with ffmpeg succeeding as the fallback
+        mock_opencv.return_value = opencv_result
         mock_ffmpeg.return_value = True
         
         # Run capture on all cameras
@@ -248,27 +295,119 @@ class TestCameraCapture:
         mock_get_rtsp_uri.assert_called_once()
         
         # Check that OpenCV capture was attempted first
-        mock_opencv.assert_called_once_with('rtsp://test.stream/video', 'TestCamera')
+        mock_opencv.assert_called_once_with(_RTSP_TEST, 'TestCamera')
         
-        # Check that ffmpeg was called as a fallback
-        mock_ffmpeg.assert_called_once_with('rtsp://test.stream/video', 'TestCamera')
+        # Check that ffmpeg is only called as a fallback when OpenCV fails
+        if expect_ffmpeg:
+            mock_ffmpeg.assert_called_once_with(_RTSP_TEST, 'TestCamera')
+        else:
+            mock_ffmpeg.assert_not_called()
+    
+    @patch('subprocess.Popen')
+    def test_capture_frames_ffmpeg_failure(self, mock_popen, camera_capture):
+        """Test that only the tail of ffmpeg's output is kept on failure"""
+        mock_process = MagicMock()
+        mock_popen.return_value = mock_process
+        
+        # Configure the process to fail after a lot of status output
+        mock_process.returncode = 1
+        lines = "".join(f"frame={i}\n" for i in range(500)) + "Connection refused\n"
+        mock_process.stderr = io.StringIO(lines)
+        
+        with patch('src.capture.logger') as mock_logger:
+            result = camera_capture.capture_frames_ffmpeg(
+                _RTSP_TEST, 
+                'TestCamera'
+            )
         
-        # Now test successful OpenCV capture
-        mock_opencv.reset_mock()
-        mock_ffmpeg.reset_mock()
+        # Check that the failure is reported with only the last lines
+        assert result is False
+        message = mock_logger.error.call_args[0][0]
+        assert "Connection refused" in message
+        assert "frame=0\n" not in message
+        assert message.count("frame=") == camera_capture.ffmpeg_stderr_lines - 1
+    
+    @patch('src.capture.CameraCapture.capture_frames_opencv')
+    @patch('src.capture.CameraCapture.get_rtsp_uri')
+    def test_capture_all_cameras_multiple(self, mock_get_rtsp_uri, mock_opencv, camera_capture):
+        """Test that every camera with an RTSP URI is captured"""
+        camera_capture.cameras = [
+            {'name': 'CameraA'},
+            {'name': 'CameraB'},
+            {'name': 'CameraC'}
+        ]
         
-        # Configure OpenCV capture to succeed
+        # CameraB has no RTSP URI and should be skipped
+        uris = {'CameraA': 'rtsp://a/stream', 'CameraB': '', 'CameraC': 'rtsp://c/stream'}
+        mock_get_rtsp_uri.side_effect = lambda camera: uris[camera['name']]
         mock_opencv.return_value = True
         
-        # Run capture again
         camera_capture.capture_all_cameras()
         
-        # Check that OpenCV capture was attempted
-        mock_opencv.assert_called_once_with('rtsp://test.stream/video', 'TestCamera')
+        # Check that both reachable cameras were captured
+        assert mock_opencv.call_count == 2
+        captured = {call.args for call in mock_opencv.call_args_list}
+        assert captured == {('rtsp://a/stream', 'CameraA'), ('rtsp://c/stream', 'CameraC')}
+    
+    @patch('src.capture.CameraCapture.capture_frames_ffmpeg')
+    @patch('src.capture.CameraCapture.capture_frames_opencv')
+    @patch('src.capture.CameraCapture.get_rtsp_uri')
+    def test_capture_all_cameras_interrupt(self, mock_get_rtsp_uri, mock_opencv, mock_ffmpeg, camera_capture):
+        """Test that Ctrl-C in the main thread stops the worker captures"""
+        mock_get_rtsp_uri.return_value = _RTSP_TEST
+        
+        # The worker runs until it is stopped, then reports no frames
+        stopped = []
         
-        # Check that ffmpeg was NOT called
+        def capture_until_stopped(rtsp_uri, camera_name):
+            stopped.append(camera_capture._stop_event.wait(5))
+            return False
+        
+        mock_opencv.side_effect = capture_until_stopped
+        
+        # Ctrl-C arrives while the main thread waits for the workers
+        with patch('src.capture.as_completed', side_effect=KeyboardInterrupt):
+            with pytest.raises(KeyboardInterrupt):
+                camera_capture.capture_all_cameras()
+        
+        # The worker saw the stop request and did not fall back to ffmpeg
+        assert stopped == [True]
         mock_ffmpeg.assert_not_called()
     
+    @patch('subprocess.Popen')
+    def test_stop_terminates_ffmpeg(self, mock_popen, camera_capture):
+        """Test that stop() terminates a running ffmpeg capture from another thread"""
+        mock_process = MagicMock()
+        mock_popen.return_value = mock_process
+        mock_process.returncode = 0
+        
+        # ffmpeg keeps streaming status output until it is terminated
+        started = threading.Event()
+        terminated = threading.Event()
+        mock_process.terminate.side_effect = terminated.set
+        
+        def stderr_lines():
+            yield "frame=    1 fps=1.0\n"
+            started.set()
+            terminated.wait(5)
+        
+        mock_process.stderr = stderr_lines()
+        
+        results = []
+        worker = threading.Thread(
+            target=lambda: results.append(camera_capture.capture_frames_ffmpeg(_RTSP_TEST, 'TestCamera'))
+        )
+        worker.start()
+        assert started.wait(5)
+        camera_capture.stop()
+        worker.join(5)
+        
+        # The process was terminated and the capture reported as stopped
+        assert not worker.is_alive()
+        mock_process.terminate.assert_called_once()
+        assert results == [False]
+        assert not camera_capture._ffmpeg_processes
+    
     @patch('subprocess.Popen')
     def test_capture_frames_ffmpeg(self, mock_popen, camera_capture):
         """Test the ffmpeg fallback capture method"""
@@ -278,11 +417,11 @@ class TestCameraCapture:
         
         # Configure the process to succeed
         mock_process.returncode = 0
-        mock_process.communicate.return_value = ('stdout', 'stderr')
+        mock_process.stderr = io.StringIO("frame=    1 fps=1.0\nframe=    2 fps=1.0\n")
         
         # Run the ffmpeg capture
         result = camera_capture.capture_frames_ffmpeg(
-            'rtsp://test.stream/video', 
+            _RTSP_TEST, 
             'TestCamera'
         )
         
@@ -298,11 +437,22 @@ class TestCameraCapture:
         
         # Check that the input URI is correct
         input_index = args[0].index('-i')
-        assert args[0][input_index + 1] == 'rtsp://test.stream/video'
+        assert args[0][input_index + 1] == _RTSP_TEST
+        
+        # Check that sub-sampling uses the fps filter rather than select
+        vf_index = args[0].index('-vf')
+        assert args[0][vf_index + 1] == 'fps=1'
+        assert '-update' not in args[0]
+        
+        # Check that hardware decoding is requested before the input
+        hwaccel_index = args[0].index('-hwaccel')
+        assert args[0][hwaccel_index + 1] == 'auto'
+        assert hwaccel_index < input_index
         
-        # Check that stdout/stderr were captured
-        assert kwargs['stdout'] == subprocess.PIPE
+        # Check that stderr was captured and stdout discarded
+        assert kwargs['stdout'] == subprocess.DEVNULL
         assert kwargs['stderr'] == subprocess.PIPE
+        mock_process.wait.assert_called_once()
 
 
 if __name__ == '__main__':
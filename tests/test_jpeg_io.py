@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the JPEG writer module
+"""
+
+import cv2
+import numpy as np
+from unittest.mock import patch, MagicMock
+
+# conftest.py puts the repository root on the path
+from src.jpeg_io import write_jpeg
+
+
+def test_write_jpeg(tmp_path):
+    """Test that frames are encoded and written as decodable JPEG files"""
+    frame = np.full((16, 16, 3), 128, dtype=np.uint8)
+    filepath = tmp_path / "TestCamera_img_000000.jpg"
+    
+    write_jpeg(filepath, frame)
+    
+    decoded = cv2.imread(str(filepath))
+    assert decoded is not None
+    assert decoded.shape == frame.shape
+
+
+def test_write_jpeg_turbojpeg(tmp_path):
+    """Test that PyTurboJPEG is used for encoding when available"""
+    frame = np.zeros((16, 16, 3), dtype=np.uint8)
+    filepath = tmp_path / "TestCamera_img_000000.jpg"
+    
+    mock_turbo = MagicMock()
+    mock_turbo.encode.return_value = b'\xff\xd8turbo\xff\xd9'
+    
+    with patch('src.jpeg_io.HAS_TURBOJPEG', True), \
+         patch('src.jpeg_io._TURBO_JPEG', mock_turbo), \
+         patch('src.jpeg_io.TJSAMP_420', 2, create=True):
+        write_jpeg(filepath, frame)
+    
+    mock_turbo.encode.assert_called_once()
+    assert filepath.read_bytes() == b'\xff\xd8turbo\xff\xd9'
+
+
+def test_write_jpeg_truncates_existing_file(tmp_path):
+    """Test that rewriting a frame replaces the old contents instead of leaving a tail"""
+    filepath = tmp_path / "TestCamera_img_000000.jpg"
+    filepath.write_bytes(b'\x00' * 100000)
+    
+    write_jpeg(filepath, np.zeros((16, 16, 3), dtype=np.uint8))
+    
+    assert cv2.imread(str(filepath)) is not None
+    assert filepath.read_bytes().endswith(b'\xff\xd9')
@@ -4,14 +4,16 @@ Unit tests for the photogrammetry module
 """
 
 import os
+import re
 import sys
+import logging
 import shutil
-import tempfile
-import unittest
+import time
 import subprocess
 import pytest
 import numpy as np
 from pathlib import Path
+from types import SimpleNamespace
 from unittest.mock import patch, MagicMock, Mock, call
 
 # Add src directory to path for imports
@@ -21,23 +23,64 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 from src.photogrammetry import ColmapWrapper
 
 
-class TestColmapWrapper(unittest.TestCase):
+# ColmapWrapper steps run by run_pipeline, in order
+PIPELINE_STEPS = (
+    'feature_extraction', 'feature_matching', 'sparse_reconstruction',
+    'image_undistortion', 'stereo_matching', 'stereo_fusion'
+)
+
+
+def _command_matcher(subcommand, *options):
+    """Compile a matcher for a mocked COLMAP command line, capturing options in any order"""
+    lookaheads = "".join(rf"(?=.* --{option} (?P<{option}>\S+))" for option in options)
+    return re.compile(rf"^mock_colmap {subcommand}(?= |$){lookaheads}").match
+
+
+# Command matchers for the COLMAP steps, compiled once at import
+_MATCH_FEATURE_EXTRACTOR = _command_matcher("feature_extractor", "database_path", "image_path")
+_MATCH_EXHAUSTIVE_MATCHER = _command_matcher("exhaustive_matcher", "database_path")
+_MATCH_MAPPER = _command_matcher("mapper", "database_path", "image_path", "output_path")
+_MATCH_IMAGE_UNDISTORTER = _command_matcher("image_undistorter", "image_path", "input_path", "output_path")
+_MATCH_PATCH_MATCH_STEREO = _command_matcher("patch_match_stereo", "workspace_path")
+_MATCH_STEREO_FUSION = _command_matcher("stereo_fusion", "workspace_path", "output_path")
+
+# Encode one blank test image up front; the wrapper is mocked, so pixels are never inspected
+try:
+    import cv2
+    _TEST_JPEG_BYTES = cv2.imencode('.jpg', np.zeros((100, 100, 3), dtype=np.uint8))[1].tobytes()
+except ImportError:
+    # If cv2 is not available, write placeholder bytes
+    _TEST_JPEG_BYTES = b'\x00' * 100
+
+
+def create_test_images(image_dir):
+    """Create test images for photogrammetry"""
+    for i in range(5):
+        (image_dir / f"image_{i:06d}.jpg").write_bytes(_TEST_JPEG_BYTES)
+
+
+@pytest.fixture(scope="session")
+def image_template(tmp_path_factory):
+    """Write the test images once per session"""
+    template_dir = tmp_path_factory.mktemp("images_template")
+    create_test_images(template_dir)
+    return template_dir
+
+
+class TestColmapWrapper:
     """Test cases for the COLMAP wrapper module"""
     
-    def setUp(self):
+    @pytest.fixture(autouse=True)
+    def _setup(self, image_template, tmp_path):
         """Set up test environment before each test"""
-        # Create temporary directories for testing
-        self.test_dir = Path(tempfile.mkdtemp())
+        self.test_dir = tmp_path
         self.image_dir = self.test_dir / "images"
         self.output_dir = self.test_dir / "colmap_out"
         
-        # Create the directories
-        self.image_dir.mkdir(parents=True, exist_ok=True)
+        # Hardlink the test images from the session template instead of re-encoding them
+        shutil.copytree(image_template, self.image_dir, copy_function=os.link)
         self.output_dir.mkdir(parents=True, exist_ok=True)
         
-        # Create test images
-        self.create_test_images()
-        
         # Path for COLMAP database and output
         self.database_path = self.output_dir / "database.db"
         self.sparse_dir = self.output_dir / "sparse"
@@ -49,32 +92,10 @@ class TestColmapWrapper(unittest.TestCase):
             self.colmap_wrapper = ColmapWrapper(
                 image_dir=str(self.image_dir),
                 output_dir=str(self.output_dir),
-                colmap_path="mock_colmap"
+                colmap_path="mock_colmap",
+                use_pycolmap=False
             )
     
-    def tearDown(self):
-        """Clean up after each test"""
-        # Remove temporary directory
-        shutil.rmtree(self.test_dir, ignore_errors=True)
-    
-    def create_test_images(self):
-        """Create test images for photogrammetry"""
-        for i in range(5):
-            image_path = self.image_dir / f"image_{i:06d}.jpg"
-            try:
-                import cv2
-                img = np.zeros((100, 100, 3), dtype=np.uint8)
-                # Add some variation to the images
-                cv2.putText(
-                    img, f"Frame {i}", (10, 50), 
-                    cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2
-                )
-                cv2.imwrite(str(image_path), img)
-            except ImportError:
-                # If cv2 is not available, create empty files
-                with open(image_path, 'wb') as f:
-                    f.write(b'\x00' * 100)
-    
     def test_initialization(self):
         """Test that the COLMAP wrapper initializes correctly"""
         # Check that directories are set correctly
@@ -87,6 +108,43 @@ class TestColmapWrapper(unittest.TestCase):
         assert self.colmap_wrapper.sparse_dir == self.sparse_dir
         assert self.colmap_wrapper.dense_dir == self.dense_dir
     
+    @pytest.mark.skipif(not os.path.isdir("/dev/shm"), reason="requires /dev/shm")
+    def test_tmpfs_database(self):
+        """Test that the database lives on tmpfs and is copied back to the output directory"""
+        # Start from a database left by a previous run
+        self.database_path.write_bytes(b"previous run")
+        
+        with patch('subprocess.run') as mock_run:
+            mock_run.return_value = MagicMock(returncode=0)
+            colmap_wrapper = ColmapWrapper(
+                image_dir=str(self.image_dir),
+                output_dir=str(self.output_dir),
+                colmap_path="mock_colmap",
+                use_pycolmap=False,
+                use_tmpfs=True
+            )
+        
+        try:
+            # Check that the previous database was copied to tmpfs
+            tmpfs_path = colmap_wrapper.database_path
+            assert tmpfs_path.parent == Path("/dev/shm")
+            assert tmpfs_path.read_bytes() == b"previous run"
+            
+            # Check that commands use the tmpfs database
+            with patch('src.photogrammetry.ColmapWrapper.run_command', return_value=True) as mock_run_command:
+                colmap_wrapper.feature_matching()
+            command, desc = mock_run_command.call_args[0]
+            assert command[3] == str(tmpfs_path)
+            
+            # Check that syncing copies the database back
+            tmpfs_path.write_bytes(b"this run")
+            assert colmap_wrapper.sync_database() is True
+            assert self.database_path.read_bytes() == b"this run"
+        finally:
+            colmap_wrapper._release_tmpfs_database()
+        
+        assert not tmpfs_path.exists()
+    
     def test_create_directories(self):
         """Test that output directories are created"""
         # Check that the directories exist
@@ -104,13 +162,14 @@ class TestColmapWrapper(unittest.TestCase):
         colmap_wrapper = ColmapWrapper(
             image_dir=str(self.image_dir),
             output_dir=str(self.output_dir),
-            colmap_path="mock_colmap"
+            colmap_path="mock_colmap",
+            use_pycolmap=False
         )
         
         # Check that the command was run correctly
         mock_run.assert_any_call(
             ["mock_colmap", "help"],
-            stdout=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
             stderr=subprocess.PIPE,
             text=True,
             check=False
@@ -125,48 +184,35 @@ class TestColmapWrapper(unittest.TestCase):
             colmap_wrapper = ColmapWrapper(
                 image_dir=str(self.image_dir),
                 output_dir=str(self.output_dir),
-                colmap_path="invalid_colmap"
+                colmap_path="invalid_colmap",
+                use_pycolmap=False
             )
     
-    @patch('subprocess.run')
-    def test_run_command(self, mock_run):
+    def test_run_command(self, caplog):
         """Test running a COLMAP command"""
-        # Configure the mock to succeed
-        mock_run.return_value = MagicMock(returncode=0)
-        
-        # Run a test command
+        # Run a test command that prints progress
         result = self.colmap_wrapper.run_command(
-            ["mock_colmap", "test_command"],
+            [sys.executable, "-c", "print('Processed file [1/5]')"],
             "Test command"
         )
         
-        # Check that the command was run
-        mock_run.assert_called_once_with(
-            ["mock_colmap", "test_command"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            check=False
-        )
+        # Check that the output went to the command log
+        log_path = self.output_dir / "test_command.log"
+        assert log_path.read_bytes().strip() == b"Processed file [1/5]"
         
         # Check that the result is success
         assert result is True
         
-        # Now test with a failing command
-        mock_run.reset_mock()
-        mock_run.return_value = MagicMock(returncode=1, stderr="Command failed")
-        
         # Run a test command that fails
-        result = self.colmap_wrapper.run_command(
-            ["mock_colmap", "failing_command"],
-            "Failing command"
-        )
-        
-        # Check that the command was run
-        mock_run.assert_called_once()
+        with caplog.at_level(logging.ERROR, logger='photogrammetry'):
+            result = self.colmap_wrapper.run_command(
+                [sys.executable, "-c", "import sys; sys.exit('Command failed')"],
+                "Failing command"
+            )
         
-        # Check that the result is failure
+        # Check that the result is failure and the error output is reported
         assert result is False
+        assert any("Command failed" in message for message in caplog.messages)
     
     @patch('src.photogrammetry.ColmapWrapper.run_command')
     def test_feature_extraction(self, mock_run_command):
@@ -183,14 +229,192 @@ class TestColmapWrapper(unittest.TestCase):
         command, desc = args
         
         # Check command format
-        assert command[0] == "mock_colmap"
-        assert command[1] == "feature_extractor"
-        assert command[3] == str(self.database_path)
-        assert command[5] == str(self.image_dir)
+        match = _MATCH_FEATURE_EXTRACTOR(" ".join(command))
+        assert match is not None
+        assert match["database_path"] == str(self.database_path)
+        assert match["image_path"] == str(self.image_dir)
         
         # Check that the result is success
         assert result is True
     
+    @patch('src.photogrammetry.ColmapWrapper.run_command')
+    def test_command_paths_converted_once(self, mock_run_command):
+        """Test that commands reuse the path strings converted in __init__"""
+        mock_run_command.return_value = True
+        wrapper = self.colmap_wrapper
+        
+        wrapper.feature_extraction()
+        command, desc = mock_run_command.call_args[0]
+        assert command[command.index("--database_path") + 1] is wrapper._db_str
+        assert command[command.index("--image_path") + 1] is wrapper._image_str
+        
+        wrapper.stereo_fusion()
+        command, desc = mock_run_command.call_args[0]
+        assert command[command.index("--workspace_path") + 1] is wrapper._dense_str
+        assert command[command.index("--output_path") + 1] is wrapper._fused_str
+    
+    @patch('src.photogrammetry.ColmapWrapper.run_command')
+    def test_incremental_feature_extraction(self, mock_run_command):
+        """Test that only images missing from the database are extracted and matched"""
+        import sqlite3
+        mock_run_command.return_value = True
+        
+        # Register the first three images as extracted by a previous run
+        conn = sqlite3.connect(self.database_path)
+        conn.execute("CREATE TABLE images (image_id INTEGER PRIMARY KEY, name TEXT, camera_id INTEGER)")
+        conn.executemany(
+            "INSERT INTO images (name, camera_id) VALUES (?, 7)",
+            [(f"image_{i:06d}.jpg",) for i in range(3)]
+        )
+        conn.commit()
+        conn.close()
+        
+        result = self.colmap_wrapper.feature_extraction()
+        assert result is True
+        
+        # Check that the new images are listed and join the existing camera
+        command, desc = mock_run_command.call_args[0]
+        image_list = Path(command[command.index("--image_list_path") + 1])
+        assert image_list.read_text().split() == ["image_000003.jpg", "image_000004.jpg"]
+        assert command[command.index("--ImageReader.existing_camera_id") + 1] == "7"
+        
+        # Check that matching is limited to pairs with a new image
+        self.colmap_wrapper.feature_matching()
+        command, desc = mock_run_command.call_args[0]
+        assert command[1] == "matches_importer"
+        pairs = Path(command[command.index("--match_list_path") + 1]).read_text().splitlines()
+        assert len(pairs) == 7
+        assert "image_000003.jpg image_000004.jpg" in pairs
+        assert not any(pair.startswith("image_000000.jpg image_000001.jpg") for pair in pairs)
+        
+        # Check that extraction is skipped once every image is in the database
+        conn = sqlite3.connect(self.database_path)
+        conn.executemany(
+            "INSERT INTO images (name, camera_id) VALUES (?, 7)",
+            [("image_000003.jpg",), ("image_000004.jpg",)]
+        )
+        conn.commit()
+        conn.close()
+        mock_run_command.reset_mock()
+        assert self.colmap_wrapper.feature_extraction() is True
+        mock_run_command.assert_not_called()
+    
+    @patch('src.photogrammetry.ColmapWrapper.run_command')
+    def test_recaptured_image_reextracts(self, mock_run_command):
+        """Test that an image replaced under the same name invalidates the database"""
+        import sqlite3
+        mock_run_command.return_value = True
+        images = self.colmap_wrapper._list_images()
+        
+        # Register every image with the file state seen at extraction
+        conn = sqlite3.connect(self.database_path)
+        conn.execute("CREATE TABLE images (image_id INTEGER PRIMARY KEY, name TEXT, camera_id INTEGER)")
+        conn.executemany("INSERT INTO images (name, camera_id) VALUES (?, 1)", [(name,) for name in images])
+        conn.commit()
+        conn.close()
+        self.colmap_wrapper._record_image_file_states(self.colmap_wrapper._image_file_states(images))
+        
+        assert self.colmap_wrapper.feature_extraction() is True
+        mock_run_command.assert_not_called()
+        
+        # A new capture session overwrites a frame under the same name; the
+        # test images are hardlinks, so replace the file instead of writing through it
+        recaptured = self.image_dir / images[1]
+        recaptured.unlink()
+        recaptured.write_bytes(_TEST_JPEG_BYTES + b"\x00")
+        
+        assert self.colmap_wrapper.feature_extraction() is True
+        command, desc = mock_run_command.call_args[0]
+        assert "--image_list_path" not in command
+        assert "--ImageReader.existing_camera_id" not in command
+        assert self.colmap_wrapper._new_images is None
+        
+        # The new states are recorded for the next run
+        assert self.colmap_wrapper._read_image_file_states() == self.colmap_wrapper._image_file_states(images)
+
+    @patch('src.photogrammetry.ColmapWrapper.run_command')
+    def test_feature_extraction_downscales_large_images(self, mock_run_command):
+        """Test that images above max_image_size are downscaled before extraction"""
+        import cv2
+        mock_run_command.return_value = True
+        cv2.imwrite(str(self.image_dir / "image_large.jpg"), np.zeros((300, 400, 3), dtype=np.uint8))
+        self.colmap_wrapper.max_image_size = 200
+        
+        result = self.colmap_wrapper.feature_extraction()
+        assert result is True
+        
+        # Check that COLMAP reads the scaled image set
+        scaled_dir = self.output_dir / "images_scaled"
+        command, desc = mock_run_command.call_args[0]
+        assert _MATCH_FEATURE_EXTRACTOR(" ".join(command))["image_path"] == str(scaled_dir)
+        assert command[command.index("--SiftExtraction.max_image_size") + 1] == "200"
+        assert command[command.index("--SiftExtraction.max_num_features") + 1] == "8192"
+        
+        # Check that only the large image was resized and the others are kept as-is
+        assert sorted(p.name for p in scaled_dir.iterdir()) == self.colmap_wrapper._list_images()
+        assert cv2.imread(str(scaled_dir / "image_large.jpg")).shape == (150, 200, 3)
+        assert os.path.samefile(scaled_dir / "image_000000.jpg", self.image_dir / "image_000000.jpg")
+        
+        # Check that later steps use the same images
+        self.colmap_wrapper.sparse_reconstruction()
+        command, desc = mock_run_command.call_args[0]
+        assert _MATCH_MAPPER(" ".join(command))["image_path"] == str(scaled_dir)
+    
+    @patch('src.photogrammetry.ColmapWrapper.run_command')
+    def test_prepare_images_reuses_and_skips(self, mock_run_command, caplog):
+        """Test that reruns decode no images, count cached copies, and skip unreadable images"""
+        import cv2
+        mock_run_command.return_value = True
+        cv2.imwrite(str(self.image_dir / "image_large.jpg"), np.zeros((300, 400, 3), dtype=np.uint8))
+        (self.image_dir / "image_empty.jpg").write_bytes(b"")
+        self.colmap_wrapper.max_image_size = 200
+        
+        # The unreadable image is skipped instead of failing the step
+        with caplog.at_level(logging.INFO, logger='photogrammetry'):
+            assert self.colmap_wrapper.feature_extraction() is True
+        assert "(1 scaled, 0 cached)" in caplog.text
+        assert "Skipping unreadable image" in caplog.text
+        scaled_dir = self.output_dir / "images_scaled"
+        assert not (scaled_dir / "image_empty.jpg").exists()
+        
+        # A rerun reads sizes from the headers and decodes nothing
+        caplog.clear()
+        with patch('src.photogrammetry.cv2.imread', return_value=None) as mock_imread, \
+                caplog.at_level(logging.INFO, logger='photogrammetry'):
+            assert self.colmap_wrapper.feature_extraction() is True
+        
+        # Only the zero-byte file, which has no header, falls back to decoding
+        mock_imread.assert_called_once_with(str(self.image_dir / "image_empty.jpg"))
+        assert "(0 scaled, 1 cached)" in caplog.text
+    
+    @patch('src.photogrammetry.ColmapWrapper.run_command')
+    def test_multi_gpu_arguments(self, mock_run_command):
+        """Test that GPU indices are passed to COLMAP as one comma-separated token"""
+        mock_run_command.return_value = True
+        
+        # Default uses all available GPUs
+        self.colmap_wrapper.feature_extraction()
+        command, desc = mock_run_command.call_args[0]
+        assert command[command.index("--SiftExtraction.gpu_index") + 1] == "-1"
+        
+        with patch('subprocess.run') as mock_run:
+            mock_run.return_value = MagicMock(returncode=0)
+            colmap_wrapper = ColmapWrapper(
+                image_dir=str(self.image_dir),
+                output_dir=str(self.output_dir),
+                colmap_path="mock_colmap",
+                gpu_indices=[0, 1, 2],
+                use_pycolmap=False
+            )
+        
+        colmap_wrapper.feature_extraction()
+        command, desc = mock_run_command.call_args[0]
+        assert command[command.index("--SiftExtraction.gpu_index") + 1] == "0,1,2"
+        
+        colmap_wrapper.stereo_matching()
+        command, desc = mock_run_command.call_args[0]
+        assert command[command.index("--PatchMatchStereo.gpu_index") + 1] == "0,1,2"
+    
     @patch('src.photogrammetry.ColmapWrapper.run_command')
     def test_feature_matching(self, mock_run_command):
         """Test running COLMAP feature matching"""
@@ -206,13 +430,81 @@ class TestColmapWrapper(unittest.TestCase):
         command, desc = args
         
         # Check command format
-        assert command[0] == "mock_colmap"
-        assert command[1] == "exhaustive_matcher"
-        assert command[3] == str(self.database_path)
+        match = _MATCH_EXHAUSTIVE_MATCHER(" ".join(command))
+        assert match is not None
+        assert match["database_path"] == str(self.database_path)
         
         # Check that the result is success
         assert result is True
     
+    @patch('src.photogrammetry.ColmapWrapper.run_command')
+    def test_feature_matching_block_size(self, mock_run_command):
+        """Test that the exhaustive matching block size follows GPU memory"""
+        mock_run_command.return_value = True
+        
+        # A 24 GB GPU gets the largest block size
+        with patch('subprocess.run') as mock_run:
+            mock_run.return_value = MagicMock(returncode=0, stdout="24576\n")
+            self.colmap_wrapper.feature_matching()
+        command, desc = mock_run_command.call_args[0]
+        assert command[command.index("--ExhaustiveMatching.block_size") + 1] == "144"
+        assert command[command.index("--SiftMatching.guided_matching") + 1] == "0"
+        
+        # The GPU is only queried once
+        self.colmap_wrapper.feature_matching()
+        command, desc = mock_run_command.call_args[0]
+        assert command[command.index("--ExhaustiveMatching.block_size") + 1] == "144"
+        
+        # Without a GPU to query the COLMAP default is kept
+        self.colmap_wrapper._gpu_memory = None
+        with patch('subprocess.run', side_effect=FileNotFoundError("nvidia-smi")):
+            self.colmap_wrapper.feature_matching()
+        command, desc = mock_run_command.call_args[0]
+        assert "--ExhaustiveMatching.block_size" not in command
+    
+    @patch('src.photogrammetry.ColmapWrapper.run_command')
+    def test_feature_matching_large_sets(self, mock_run_command):
+        """Test matcher selection for image sets above the exhaustive threshold"""
+        mock_run_command.return_value = True
+        vocab_tree = self.test_dir / "vocab_tree.bin"
+        vocab_tree.write_bytes(b"tree")
+        self.colmap_wrapper.vocab_tree_path = vocab_tree
+        self.colmap_wrapper.vocab_tree_threshold = 3
+        
+        # Frames from several cameras use the vocabulary tree
+        result = self.colmap_wrapper.feature_matching()
+        command, desc = mock_run_command.call_args[0]
+        assert command[1] == "vocab_tree_matcher"
+        assert command[command.index("--VocabTreeMatching.vocab_tree_path") + 1] == str(vocab_tree)
+        assert result is True
+        
+        # Frames from a single camera are matched sequentially with loop detection
+        for image_path in self.image_dir.iterdir():
+            image_path.rename(self.image_dir / f"cam1_img_{image_path.name}")
+        mock_run_command.reset_mock()
+        self.colmap_wrapper.feature_matching()
+        command, desc = mock_run_command.call_args[0]
+        assert command[1] == "sequential_matcher"
+        assert command[command.index("--SequentialMatching.loop_detection") + 1] == "1"
+        
+        # An explicit matcher overrides auto selection
+        self.colmap_wrapper.matcher = "exhaustive"
+        mock_run_command.reset_mock()
+        self.colmap_wrapper.feature_matching()
+        command, desc = mock_run_command.call_args[0]
+        assert command[1] == "exhaustive_matcher"
+    
+    def test_invalid_matcher(self):
+        """Test that an unknown matcher is rejected"""
+        with pytest.raises(ValueError):
+            ColmapWrapper(
+                image_dir=str(self.image_dir),
+                output_dir=str(self.output_dir),
+                colmap_path="mock_colmap",
+                use_pycolmap=False,
+                matcher="invalid"
+            )
+    
     @patch('src.photogrammetry.ColmapWrapper.run_command')
     def test_sparse_reconstruction(self, mock_run_command):
         """Test running COLMAP mapper for sparse reconstruction"""
@@ -228,14 +520,215 @@ class TestColmapWrapper(unittest.TestCase):
         command, desc = args
         
         # Check command format
-        assert command[0] == "mock_colmap"
-        assert command[1] == "mapper"
-        assert command[3] == str(self.database_path)
-        assert command[5] == str(self.image_dir)
-        assert command[7] == str(self.sparse_dir)
+        match = _MATCH_MAPPER(" ".join(command))
+        assert match is not None
+        assert match["database_path"] == str(self.database_path)
+        assert match["image_path"] == str(self.image_dir)
+        assert match["output_path"] == str(self.sparse_dir)
+        
+        # Check that fast mode tightens bundle adjustment and skips colors
+        assert command[command.index("--Mapper.ba_global_function_tolerance") + 1] == "1e-06"
+        assert command[command.index("--Mapper.extract_colors") + 1] == "0"
         
         # Check that the result is success
         assert result is True
+        
+        # Without fast mode COLMAP defaults are used
+        self.colmap_wrapper.fast_mode = False
+        self.colmap_wrapper.sparse_reconstruction()
+        command, desc = mock_run_command.call_args[0]
+        assert not any(arg.startswith("--Mapper.") for arg in command)
+    
+    @patch('src.photogrammetry.ColmapWrapper.run_command')
+    def test_known_poses_triangulation(self, mock_run_command):
+        """Test that known camera poses replace the mapper with point triangulation"""
+        mock_run_command.return_value = True
+        known_dir = self.test_dir / "known_poses"
+        known_dir.mkdir()
+        (known_dir / "images.txt").write_text("")
+        
+        self.colmap_wrapper.known_poses_dir = known_dir
+        self.colmap_wrapper.camera_intrinsics = [
+            {'model': 'SIMPLE_RADIAL', 'width': 100, 'height': 100, 'params': [120.0, 50, 50, 0.01]}
+        ]
+        result = self.colmap_wrapper.sparse_reconstruction()
+        
+        # Check command format
+        command, desc = mock_run_command.call_args[0]
+        assert command[1] == "point_triangulator"
+        assert command[command.index("--input_path") + 1] == str(known_dir)
+        assert command[command.index("--output_path") + 1] == str(self.colmap_wrapper.sparse_model_dir)
+        assert command[command.index("--clear_points") + 1] == "1"
+        assert self.colmap_wrapper.sparse_model_dir.is_dir()
+        
+        # Check that cameras.txt was written from the intrinsics
+        cameras = (known_dir / "cameras.txt").read_text().splitlines()
+        assert cameras[-1] == "1 SIMPLE_RADIAL 100 100 120.0 50 50 0.01"
+        assert (known_dir / "points3D.txt").exists()
+        assert result is True
+    
+    @patch('src.photogrammetry.ColmapWrapper.run_command')
+    def test_gpu_bundle_adjustment(self, mock_run_command):
+        """Test that GPU bundle adjustment is enabled when COLMAP supports PBA"""
+        mock_run_command.return_value = True
+        
+        with patch('subprocess.run') as mock_run:
+            mock_run.return_value = MagicMock(
+                returncode=0, stdout="  --Mapper.ba_global_use_pba arg (=0)\n"
+            )
+            colmap_wrapper = ColmapWrapper(
+                image_dir=str(self.image_dir),
+                output_dir=str(self.output_dir),
+                colmap_path="mock_colmap",
+                gpu_indices=[1],
+                use_pycolmap=False
+            )
+        
+        colmap_wrapper.sparse_reconstruction()
+        command, desc = mock_run_command.call_args[0]
+        assert command[command.index("--Mapper.ba_global_use_pba") + 1] == "1"
+        assert command[command.index("--Mapper.ba_global_pba_gpu_index") + 1] == "1"
+        assert command[command.index("--Mapper.multiple_models") + 1] == "0"
+        
+        # GPU bundle adjustment stays on without the fast mapper settings
+        colmap_wrapper.fast_mode = False
+        colmap_wrapper.sparse_reconstruction()
+        command, desc = mock_run_command.call_args[0]
+        assert command[command.index("--Mapper.ba_global_use_pba") + 1] == "1"
+        assert command[command.index("--Mapper.ba_global_pba_gpu_index") + 1] == "1"
+        assert "--Mapper.extract_colors" not in command
+        colmap_wrapper.fast_mode = True
+        
+        # PBA needs shared intrinsics
+        colmap_wrapper.single_camera = False
+        colmap_wrapper.sparse_reconstruction()
+        command, desc = mock_run_command.call_args[0]
+        assert "--Mapper.ba_global_use_pba" not in command
+        
+        # The default mock COLMAP build has no GPU bundle adjustment
+        self.colmap_wrapper.sparse_reconstruction()
+        command, desc = mock_run_command.call_args[0]
+        assert "--Mapper.ba_global_use_pba" not in command
+    
+    def test_pycolmap_gpu_bundle_adjustment(self):
+        """Test that a CUDA pycolmap build gets options it accepts"""
+        pycolmap = pytest.importorskip("pycolmap")
+        
+        with patch.object(pycolmap, 'has_cuda', True), \
+                patch('src.photogrammetry.HAS_PYCOLMAP', True):
+            colmap_wrapper = ColmapWrapper(
+                image_dir=str(self.image_dir),
+                output_dir=str(self.output_dir),
+                gpu_indices=[1],
+                use_pycolmap=True
+            )
+        
+        # The real options class rejects a non-string GPU index
+        with patch.object(pycolmap, 'incremental_mapping') as mock_mapping:
+            assert colmap_wrapper.sparse_reconstruction() is True
+        options = mock_mapping.call_args[1]['options']
+        assert options.ba_use_gpu is True
+        assert options.ba_gpu_index == "1"
+        assert options.multiple_models is False
+        
+        # Options the build rejects fail the step instead of raising
+        with patch.object(colmap_wrapper, '_incremental_options', side_effect=TypeError("bad option")):
+            assert colmap_wrapper.sparse_reconstruction() is False
+
+    @patch('src.photogrammetry.ColmapWrapper.run_command')
+    def test_hierarchical_sparse_reconstruction(self, mock_run_command):
+        """Test hierarchical mapping and selection of the largest sub-model"""
+        mock_run_command.return_value = True
+        self.colmap_wrapper.hierarchical_min_images = 5
+        
+        # Create sub-models with different numbers of registered images
+        for model, num_images in (("0", 2), ("1", 4), ("2", 3)):
+            model_dir = self.sparse_dir / model
+            model_dir.mkdir(parents=True, exist_ok=True)
+            (model_dir / "images.bin").write_bytes(num_images.to_bytes(8, 'little'))
+        
+        result = self.colmap_wrapper.sparse_reconstruction()
+        
+        # Check command format
+        command, desc = mock_run_command.call_args[0]
+        assert command[1] == "hierarchical_mapper"
+        assert command[7] == str(self.sparse_dir)
+        assert command[command.index("--leaf_max_num_images") + 1] == "500"
+        
+        # Check that the largest sub-model is used for undistortion
+        assert self.colmap_wrapper.sparse_model_dir == self.sparse_dir / "1"
+        assert result is True
+    
+    def test_run_commands_concurrently(self):
+        """Test running independent commands as concurrent subprocesses"""
+        # Both commands sleep, so running them one after another would take twice as long
+        sleep_command = [sys.executable, "-c", "import time; time.sleep(0.5)"]
+        start_time = time.time()
+        result = self.colmap_wrapper.run_commands_concurrently([
+            (sleep_command, "First command", None),
+            (sleep_command, "Second command", dict(os.environ, TEST_VAR="1"))
+        ])
+        assert result is True
+        assert time.time() - start_time < 1.0
+        
+        # A failing command fails the whole batch
+        result = self.colmap_wrapper.run_commands_concurrently([
+            (sleep_command, "Passing command", None),
+            ([sys.executable, "-c", "raise SystemExit(1)"], "Failing command", None)
+        ])
+        assert result is False
+    
+    @patch('src.photogrammetry.ColmapWrapper.run_command')
+    @patch('src.photogrammetry.ColmapWrapper.run_commands_concurrently')
+    def test_partitioned_reconstruction(self, mock_run_concurrently, mock_run_command):
+        """Test concurrent matching and mapping of overlapping partitions followed by merging"""
+        mock_run_command.return_value = True
+        self.database_path.write_bytes(b"features")
+        
+        def run_jobs(jobs):
+            # Each mapper writes a single sub-model
+            for command, desc, env in jobs:
+                if command[1] == "mapper":
+                    model_dir = Path(command[command.index("--output_path") + 1]) / "0"
+                    model_dir.mkdir(parents=True, exist_ok=True)
+                    (model_dir / "images.bin").write_bytes((3).to_bytes(8, 'little'))
+            return True
+        mock_run_concurrently.side_effect = run_jobs
+        
+        self.colmap_wrapper.num_partitions = 2
+        self.colmap_wrapper.partition_overlap = 0.5
+        self.colmap_wrapper.gpu_indices = [0, 1]
+        result = self.colmap_wrapper.sparse_reconstruction()
+        
+        # Check that matching and then mapping ran once per partition on its own GPU
+        matching_jobs, mapping_jobs = [call_args[0][0] for call_args in mock_run_concurrently.call_args_list]
+        assert [command[1] for command, _, _ in matching_jobs] == ["matches_importer"] * 2
+        assert [command[1] for command, _, _ in mapping_jobs] == ["mapper"] * 2
+        assert [env["CUDA_VISIBLE_DEVICES"] for _, _, env in mapping_jobs] == ["0", "1"]
+        
+        # Check that each partition works on its own copy of the database
+        databases = [Path(command[command.index("--database_path") + 1]) for command, _, _ in mapping_jobs]
+        assert len(set(databases)) == 2
+        assert all(database.read_bytes() == b"features" for database in databases)
+        
+        # Check that the partitions cover all images and share one image
+        image_lists = [
+            set(Path(command[command.index("--image_list_path") + 1]).read_text().split())
+            for command, _, _ in mapping_jobs
+        ]
+        assert image_lists[0] | image_lists[1] == set(self.colmap_wrapper._list_images())
+        assert len(image_lists[0] & image_lists[1]) == 1
+        
+        # Check that only pairs within a partition are matched
+        pairs = Path(matching_jobs[0][0][matching_jobs[0][0].index("--match_list_path") + 1]).read_text().splitlines()
+        assert len(pairs) == 3
+        assert all(set(pair.split()) <= image_lists[0] for pair in pairs)
+        
+        # Check that the partition models were merged
+        command, desc = mock_run_command.call_args[0]
+        assert command[1] == "model_merger"
+        assert self.colmap_wrapper.sparse_model_dir == Path(command[command.index("--output_path") + 1])
+        assert result is True
     
     @patch('src.photogrammetry.ColmapWrapper.run_command')
     def test_image_undistortion(self, mock_run_command):
@@ -252,11 +745,11 @@ class TestColmapWrapper(unittest.TestCase):
         command, desc = args
         
         # Check command format
-        assert command[0] == "mock_colmap"
-        assert command[1] == "image_undistorter"
-        assert command[3] == str(self.image_dir)
-        assert command[5] == str(self.colmap_wrapper.sparse_model_dir)
-        assert command[7] == str(self.dense_dir)
+        match = _MATCH_IMAGE_UNDISTORTER(" ".join(command))
+        assert match is not None
+        assert match["image_path"] == str(self.image_dir)
+        assert match["input_path"] == str(self.colmap_wrapper.sparse_model_dir)
+        assert match["output_path"] == str(self.dense_dir)
         
         # Check that the result is success
         assert result is True
@@ -276,9 +769,9 @@ class TestColmapWrapper(unittest.TestCase):
         command, desc = args
         
         # Check command format
-        assert command[0] == "mock_colmap"
-        assert command[1] == "patch_match_stereo"
-        assert command[3] == str(self.dense_dir)
+        match = _MATCH_PATCH_MATCH_STEREO(" ".join(command))
+        assert match is not None
+        assert match["workspace_path"] == str(self.dense_dir)
         
         # Check that the result is success
         assert result is True
@@ -298,32 +791,69 @@ class TestColmapWrapper(unittest.TestCase):
         command, desc = args
         
         # Check command format
-        assert command[0] == "mock_colmap"
-        assert command[1] == "stereo_fusion"
-        assert command[3] == str(self.dense_dir)
-        assert command[9] == str(self.dense_dir / "fused.ply")
+        match = _MATCH_STEREO_FUSION(" ".join(command))
+        assert match is not None
+        assert match["workspace_path"] == str(self.dense_dir)
+        assert match["output_path"] == str(self.dense_dir / "fused.ply")
         
         # Check that the result is success
         assert result is True
     
-    @patch('src.photogrammetry.ColmapWrapper.feature_extraction')
-    @patch('src.photogrammetry.ColmapWrapper.feature_matching')
-    @patch('src.photogrammetry.ColmapWrapper.sparse_reconstruction')
-    @patch('src.photogrammetry.ColmapWrapper.image_undistortion')
-    @patch('src.photogrammetry.ColmapWrapper.stereo_matching')
-    @patch('src.photogrammetry.ColmapWrapper.stereo_fusion')
-    def test_run_pipeline(
-        self, mock_fusion, mock_matching, mock_undistortion,
-        mock_reconstruction, mock_feature_matching, mock_feature_extraction
-    ):
+    @patch('src.photogrammetry.HAS_PYCOLMAP', True)
+    @patch('src.photogrammetry.pycolmap', create=True)
+    @patch('src.photogrammetry.ColmapWrapper.run_command')
+    def test_pycolmap_pipeline_steps(self, mock_run_command, mock_pycolmap):
+        """Test that steps run in-process through pycolmap when enabled"""
+        mock_pycolmap.has_cuda = False
+        mock_pycolmap.__version__ = "0.0"
+        
+        with patch('subprocess.run') as mock_run:
+            mock_run.return_value = MagicMock(returncode=0)
+            colmap_wrapper = ColmapWrapper(
+                image_dir=str(self.image_dir),
+                output_dir=str(self.output_dir),
+                colmap_path="mock_colmap",
+                use_pycolmap=True
+            )
+        
+        # Check that the COLMAP executable is not probed
+        mock_run.assert_not_called()
+        
+        # Run the sparse steps in-process
+        assert colmap_wrapper.feature_extraction() is True
+        assert colmap_wrapper.feature_matching() is True
+        assert colmap_wrapper.sparse_reconstruction() is True
+        
+        mock_pycolmap.extract_features.assert_called_once()
+        assert mock_pycolmap.extract_features.call_args[1]['database_path'] == self.database_path
+        mock_pycolmap.match_exhaustive.assert_called_once()
+        mock_pycolmap.incremental_mapping.assert_called_once()
+        assert mock_pycolmap.incremental_mapping.call_args[1]['output_path'] == self.sparse_dir
+        mock_run_command.assert_not_called()
+        
+        # Without CUDA, dense stereo falls back to the COLMAP executable
+        mock_run_command.return_value = True
+        assert colmap_wrapper.stereo_matching() is True
+        mock_pycolmap.patch_match_stereo.assert_not_called()
+        mock_run_command.assert_called_once()
+        
+        # Check that pycolmap failures are reported as step failures
+        mock_pycolmap.stereo_fusion.side_effect = RuntimeError("fusion failed")
+        assert colmap_wrapper.stereo_fusion() is False
+    
+    @pytest.fixture
+    def pipeline_mocks(self, request):
+        """Patch every pipeline step on ColmapWrapper with one patch.multiple"""
+        steps = SimpleNamespace(**{name: MagicMock(return_value=True) for name in PIPELINE_STEPS})
+        patch.multiple('src.photogrammetry.ColmapWrapper', **vars(steps)).start()
+        request.addfinalizer(patch.stopall)
+        return steps
+    
+    @pytest.mark.parametrize("stereo_matching_result", [True, False])
+    def test_run_pipeline(self, pipeline_mocks, stereo_matching_result):
         """Test running the complete COLMAP pipeline"""
-        # Configure all mocks to succeed
-        mock_feature_extraction.return_value = True
-        mock_feature_matching.return_value = True
-        mock_reconstruction.return_value = True
-        mock_undistortion.return_value = True
-        mock_matching.return_value = True
-        mock_fusion.return_value = True
+        steps = pipeline_mocks
+        steps.stereo_matching.return_value = stereo_matching_result
         
         # Create a mock output file
         output_ply = self.dense_dir / "fused.ply"
@@ -334,72 +864,35 @@ class TestColmapWrapper(unittest.TestCase):
         # Run the pipeline
         result = self.colmap_wrapper.run_pipeline()
         
-        # Check that all steps were called in the right order
-        mock_feature_extraction.assert_called_once()
-        mock_feature_matching.assert_called_once()
-        mock_reconstruction.assert_called_once()
-        mock_undistortion.assert_called_once()
-        mock_matching.assert_called_once()
-        mock_fusion.assert_called_once()
-        
-        # Check that the result is success
-        assert result is True
-        
-        # Now test with a step failing
-        mock_feature_extraction.reset_mock()
-        mock_feature_matching.reset_mock()
-        mock_reconstruction.reset_mock()
-        mock_undistortion.reset_mock()
-        mock_matching.reset_mock()
-        mock_fusion.reset_mock()
-        
-        # Make one step fail
-        mock_matching.return_value = False
-        
-        # Run the pipeline
-        result = self.colmap_wrapper.run_pipeline()
-        
-        # Check that steps were called up to the failing step
-        mock_feature_extraction.assert_called_once()
-        mock_feature_matching.assert_called_once()
-        mock_reconstruction.assert_called_once()
-        mock_undistortion.assert_called_once()
-        mock_matching.assert_called_once()
+        # Check that steps were called up to and including stereo matching
+        for name in PIPELINE_STEPS[:-1]:
+            getattr(steps, name).assert_called_once()
         
-        # Check that later steps were not called
-        mock_fusion.assert_not_called()
+        # Check that fusion only runs after successful stereo matching
+        assert steps.stereo_fusion.call_count == int(stereo_matching_result)
         
-        # Check that the result is failure
-        assert result is False
+        # Check that the result reflects the stereo matching outcome
+        assert result is stereo_matching_result
     
+    @pytest.mark.usefixtures("pipeline_mocks")
     def test_run_pipeline_output_verification(self):
         """Test verification of output files in run_pipeline"""
-        # Mock all the steps to succeed
-        with patch.multiple(
-            'src.photogrammetry.ColmapWrapper',
-            feature_extraction=MagicMock(return_value=True),
-            feature_matching=MagicMock(return_value=True),
-            sparse_reconstruction=MagicMock(return_value=True),
-            image_undistortion=MagicMock(return_value=True),
-            stereo_matching=MagicMock(return_value=True),
-            stereo_fusion=MagicMock(return_value=True)
-        ):
-            # Run the pipeline without creating the output file
-            result = self.colmap_wrapper.run_pipeline()
-            
-            # Check that the result is failure due to missing output
-            assert result is False
-            
-            # Now create the output file and try again
-            output_ply = self.dense_dir / "fused.ply"
-            with open(output_ply, 'w') as f:
-                f.write("mock ply data")
-                
-            # Run the pipeline again
-            result = self.colmap_wrapper.run_pipeline()
+        # Run the pipeline without creating the output file
+        result = self.colmap_wrapper.run_pipeline()
+        
+        # Check that the result is failure due to missing output
+        assert result is False
+        
+        # Now create the output file and try again
+        output_ply = self.dense_dir / "fused.ply"
+        with open(output_ply, 'w') as f:
+            f.write("mock ply data")
             
-            # Check that the result is success now
-            assert result is True
+        # Run the pipeline again
+        result = self.colmap_wrapper.run_pipeline()
+        
+        # Check that the result is success now
+        assert result is True
 
 
 if __name__ == '__main__':
@@ -4,86 +4,24 @@ Unit tests for the USD builder module
 """
 
 import os
-import sys
-import shutil
-import tempfile
-import unittest
 import subprocess
 import pytest
-import numpy as np
 from pathlib import Path
-from unittest.mock import patch, MagicMock, Mock
+from types import SimpleNamespace
+from unittest.mock import patch, DEFAULT, MagicMock, Mock
 
-# Add src directory to path for imports
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-
-# Mock the pxr import since it might not be available in the test environment
-sys.modules['pxr'] = MagicMock()
-sys.modules['pxr.Usd'] = MagicMock()
-sys.modules['pxr.UsdGeom'] = MagicMock()
-sys.modules['pxr.UsdShade'] = MagicMock()
-sys.modules['pxr.Sdf'] = MagicMock()
-sys.modules['pxr.Gf'] = MagicMock()
-sys.modules['pxr.Vt'] = MagicMock()
-
-# After mocking the modules, import the module under test
+# conftest.py puts the repository root on the path and mocks the pxr modules
+# before the modules under test are imported
+from src import main
 from src.usd_builder import UsdSceneBuilder
 
+# Test frames are only listed and referenced by path, never decoded,
+# so a fixed byte pattern stands in for JPEG data
+_NUM_TEST_IMAGES = 5
+_JPEG_BYTES = b'\x00' * 100
 
-class TestUsdBuilder(unittest.TestCase):
-    """Test cases for the USD builder module"""
-    
-    def setUp(self):
-        """Set up test environment before each test"""
-        # Create temporary directories for testing
-        self.test_dir = Path(tempfile.mkdtemp())
-        self.image_dir = self.test_dir / "images"
-        self.output_dir = self.test_dir / "output"
-        
-        # Create the directories
-        self.image_dir.mkdir(parents=True, exist_ok=True)
-        self.output_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Create a test image in the image directory
-        self.test_image_path = self.image_dir / "test_image.jpg"
-        self.create_test_image(self.test_image_path)
-        
-        # Create a dummy point cloud file
-        self.test_pointcloud_path = self.test_dir / "test_pointcloud.ply"
-        self.create_test_pointcloud(self.test_pointcloud_path)
-        
-        # Path for output USD file
-        self.usd_output_path = self.output_dir / "test_scene.usda"
-        
-        # Create the USD builder instance
-        self.usd_builder = UsdSceneBuilder(
-            image_dir=str(self.image_dir),
-            output_file=str(self.usd_output_path),
-            point_cloud=str(self.test_pointcloud_path)
-        )
-    
-    def tearDown(self):
-        """Clean up after each test"""
-        # Remove temporary directory
-        shutil.rmtree(self.test_dir, ignore_errors=True)
-    
-    def create_test_image(self, path):
-        """Create a test image file for testing"""
-        # Create a simple test image (black 10x10 image)
-        try:
-            import cv2
-            img = np.zeros((10, 10, 3), dtype=np.uint8)
-            cv2.imwrite(str(path), img)
-        except ImportError:
-            # If cv2 is not available, create an empty file
-            with open(path, 'wb') as f:
-                f.write(b'\x00' * 100)  # Just some dummy content
-    
-    def create_test_pointcloud(self, path):
-        """Create a test PLY file for testing"""
-        # Create a minimal valid PLY file
-        with open(path, 'w') as f:
-            f.write("""ply
+# Minimal valid ASCII PLY point cloud with three vertices
+_PLY_TEXT = """ply
 format ascii 1.0
 element vertex 3
 property float x
@@ -93,399 +31,609 @@ end_header
 0.0 0.0 0.0
 1.0 0.0 0.0
 0.0 1.0 0.0
-""")
-    
-    def test_initialization(self):
-        """Test that the USD builder initializes correctly"""
-        # Check that the directories and paths are set correctly
-        assert self.usd_builder.image_dir == self.image_dir
-        assert self.usd_builder.output_file == self.usd_output_path
-        assert self.usd_builder.point_cloud == self.test_pointcloud_path
-    
-    def test_find_latest_image(self):
-        """Test finding the latest image in the images directory"""
-        # Create a few images with different timestamps
-        image1 = self.image_dir / "image1.jpg"
-        image2 = self.image_dir / "image2.jpg"
-        image3 = self.image_dir / "image3.jpg"
-        
-        # First remove any existing test image that might be there
-        if self.test_image_path.exists():
-            self.test_image_path.unlink()
-        
-        # Create the images with increasing timestamps
-        self.create_test_image(image1)
-        self.create_test_image(image2)
-        self.create_test_image(image3)
-        
-        # Set modification times to different values
-        # Use different timestamps to ensure proper ordering
-        os.utime(image1, (1000000, 1000000))
-        os.utime(image2, (2000000, 2000000))
-        os.utime(image3, (3000000, 3000000))
-        
-        # Find the latest image
-        latest_image = self.usd_builder.find_latest_image()
-        
-        # Check that the latest image is image3
-        assert latest_image == image3
-    
-    def test_create_stage(self):
-        """Test creating a USD stage"""
-        # Mock the Stage.CreateNew method
-        pxr_mock = sys.modules['pxr']
-        usd_mock = pxr_mock.Usd
-        usd_geom_mock = pxr_mock.UsdGeom
-        
-        # Create mocks for the stage and related objects
-        mock_stage = MagicMock()
-        usd_mock.Stage.CreateNew = MagicMock(return_value=mock_stage)
-        
-        mock_xform = MagicMock()
-        usd_geom_mock.Xform.Define = MagicMock(return_value=mock_xform)
-        
-        mock_prim = MagicMock()
-        mock_xform.GetPrim.return_value = mock_prim
-        
-        # Create the stage
-        stage = self.usd_builder.create_stage()
-        
-        # Check that the stage was created with the right file path
-        usd_mock.Stage.CreateNew.assert_called_once_with(str(self.usd_output_path))
-        
-        # Check that stage setup was done
-        usd_geom_mock.SetStageUpAxis.assert_called_once()
-        mock_stage.SetStartTimeCode.assert_called_once()
-        mock_stage.SetEndTimeCode.assert_called_once()
-        mock_stage.SetTimeCodesPerSecond.assert_called_once()
-        
-        # Check that the default prim was set
-        mock_stage.SetDefaultPrim.assert_called_once_with(mock_prim)
-    
-    def test_add_plane(self):
-        """Test adding a plane geometry to the USD stage"""
-        # Mock the stage and related USD objects
-        mock_stage = MagicMock()
-        pxr_mock = sys.modules['pxr']
-        
-        # Set up the UsdGeom.Mesh.Define mock
-        mock_mesh = MagicMock()
-        pxr_mock.UsdGeom.Mesh.Define = MagicMock(return_value=mock_mesh)
-        
-        # Mock Vt arrays
-        pxr_mock.Vt.Vec3fArray = MagicMock(return_value="MockVec3fArray")
-        pxr_mock.Vt.Vec2fArray = MagicMock(return_value="MockVec2fArray")
-        pxr_mock.Vt.IntArray = MagicMock(return_value="MockIntArray")
-        
-        # Mock UsdGeom.PrimvarsAPI
-        mock_primvars_api = MagicMock()
-        pxr_mock.UsdGeom.PrimvarsAPI = MagicMock(return_value=mock_primvars_api)
-        mock_texcoords_attr = MagicMock()
-        mock_primvars_api.CreatePrimvar.return_value = mock_texcoords_attr
-        
-        # Add the plane
-        plane = self.usd_builder.add_plane(mock_stage)
-        
-        # Check that the mesh was created with the right path
-        pxr_mock.UsdGeom.Mesh.Define.assert_called_once_with(mock_stage, '/World/plane')
-        
-        # Check that points, indices, and UVs were set
-        mock_mesh.CreatePointsAttr.assert_called_once()
-        mock_mesh.CreateFaceVertexCountsAttr.assert_called_once()
-        mock_mesh.CreateFaceVertexIndicesAttr.assert_called_once()
-        mock_mesh.CreateNormalsAttr.assert_called_once()
-        
-        # Check that primvar for UVs was created
-        pxr_mock.UsdGeom.PrimvarsAPI.assert_called_once_with(mock_mesh)
-        mock_primvars_api.CreatePrimvar.assert_called_once()
-        mock_texcoords_attr.Set.assert_called_once()
-    
-    def test_create_material(self):
-        """Test creating a USD Preview Surface material"""
-        # Mock the stage and USD objects
-        mock_stage = MagicMock()
-        pxr_mock = sys.modules['pxr']
-        
-        # Mock material
-        mock_material = MagicMock()
-        pxr_mock.UsdShade.Material.Define = MagicMock(return_value=mock_material)
-        
-        # Mock shaders
-        mock_shader = MagicMock()
-        mock_texture_sampler = MagicMock()
-        pxr_mock.UsdShade.Shader.Define = MagicMock(side_effect=[mock_shader, mock_texture_sampler])
-        
-        # Mock material outputs and shader outputs
-        mock_surface_output = MagicMock()
-        mock_material.CreateSurfaceOutput.return_value = mock_surface_output
-        mock_texture_output = MagicMock()
-        mock_texture_sampler.CreateOutput.return_value = mock_texture_output
-        
-        # Create the material
-        material = self.usd_builder.create_material(mock_stage, "test_texture.jpg")
-        
-        # Check that the material was created with the right path
-        pxr_mock.UsdShade.Material.Define.assert_called_once_with(mock_stage, '/World/Materials/TexturedMaterial')
-        
-        # Check that shaders were created
-        assert pxr_mock.UsdShade.Shader.Define.call_count == 2
-        
-        # Check that shader inputs were set
-        assert mock_shader.CreateInput.call_count >= 2  # roughness and metallic
-        assert mock_texture_sampler.CreateInput.call_count >= 3  # file, wrapS, wrapT
-        
-        # Check that outputs were created and connected
-        mock_texture_sampler.CreateOutput.assert_called_once()
-        mock_material.CreateSurfaceOutput.assert_called_once()
-        mock_surface_output.ConnectToSource.assert_called_once()
-    
-    def test_add_point_cloud(self):
-        """Test adding a point cloud to the USD stage"""
-        # Mock the stage and USD objects
-        mock_stage = MagicMock()
-        pxr_mock = sys.modules['pxr']
-        
-        # Mock points
-        mock_points = MagicMock()
-        pxr_mock.UsdGeom.Points.Define = MagicMock(return_value=mock_points)
-        
-        # Mock the prim and references
-        mock_prim = MagicMock()
-        mock_points.GetPrim.return_value = mock_prim
-        mock_references = MagicMock()
-        mock_prim.GetReferences.return_value = mock_references
-        
-        # Add the point cloud
-        points = self.usd_builder.add_point_cloud(mock_stage, str(self.test_pointcloud_path))
-        
-        # Check that the points were created with the right path
-        pxr_mock.UsdGeom.Points.Define.assert_called_once_with(mock_stage, '/World/PointCloud')
-        
-        # Check that the reference was added
-        mock_prim.GetReferences.assert_called_once()
-        mock_references.AddReference.assert_called_once_with(str(self.test_pointcloud_path))
-    
-    def test_apply_material_to_mesh(self):
-        """Test applying a material to a mesh"""
-        # Mock the material, mesh, and binding API
-        mock_material = MagicMock()
-        mock_mesh = MagicMock()
-        mock_binding_api = MagicMock()
-        
-        # Mock the MaterialBindingAPI constructor
-        pxr_mock = sys.modules['pxr']
-        pxr_mock.UsdShade.MaterialBindingAPI = MagicMock(return_value=mock_binding_api)
-        
-        # Apply the material
-        self.usd_builder.apply_material_to_mesh(mock_material, mock_mesh)
-        
-        # Check that the binding API was created and used
-        pxr_mock.UsdShade.MaterialBindingAPI.assert_called_once_with(mock_mesh)
-        mock_binding_api.Bind.assert_called_once_with(mock_material)
-    
-    @patch('src.usd_builder.UsdSceneBuilder.find_latest_image')
-    @patch('src.usd_builder.UsdSceneBuilder.create_stage')
-    @patch('src.usd_builder.UsdSceneBuilder.add_point_cloud')
-    @patch('src.usd_builder.UsdSceneBuilder.add_plane')
-    @patch('src.usd_builder.UsdSceneBuilder.create_material')
-    @patch('src.usd_builder.UsdSceneBuilder.apply_material_to_mesh')
-    def test_build_scene_with_point_cloud(
-        self, mock_apply_material, mock_create_material, mock_add_plane,
-        mock_add_point_cloud, mock_create_stage, mock_find_latest_image
-    ):
-        """Test building a scene with a point cloud"""
-        # Mock dependencies
-        mock_stage = MagicMock()
-        mock_create_stage.return_value = mock_stage
-        mock_latest_image = self.image_dir / "latest.jpg"
-        mock_find_latest_image.return_value = mock_latest_image
-        mock_point_cloud = MagicMock()
-        mock_add_point_cloud.return_value = mock_point_cloud
-        
-        # Build the scene
-        result = self.usd_builder.build_scene()
-        
-        # Check the result
-        assert result is True
-        
-        # Check that the methods were called in the right order
-        mock_find_latest_image.assert_called_once()
-        mock_create_stage.assert_called_once()
-        mock_add_point_cloud.assert_called_once_with(mock_stage, str(self.test_pointcloud_path))
+"""
+
+# Directories shared by the integration tests, created once per session
+_INTEGRATION_LAYOUT = ('config', 'images', 'colmap', 'output')
+
+# UsdSceneBuilder steps mocked out when testing build_scene
+_BUILD_STEPS = (
+    'find_latest_image', 'create_stage', 'add_point_cloud',
+    'add_plane', 'create_material', 'apply_material_to_mesh'
+)
+
+
+def create_test_image(path):
+    """Create a test image file for testing"""
+    Path(path).write_bytes(_JPEG_BYTES)
+
+
+def fake_dir_entry(root, name, mtime_ns, is_dir=False):
+    """Build a stand-in for an os.DirEntry with a fixed modification time"""
+    return SimpleNamespace(
+        name=name,
+        path=os.path.join(root, name),
+        is_dir=lambda follow_symlinks=True: is_dir,
+        is_file=lambda follow_symlinks=True: not is_dir,
+        stat=lambda follow_symlinks=True: SimpleNamespace(st_mtime_ns=mtime_ns)
+    )
+
+
+def create_test_pointcloud(path):
+    """Create a test PLY file for testing"""
+    Path(path).write_text(_PLY_TEXT)
+
+
+@pytest.fixture(scope="session")
+def usd_test_root(tmp_path_factory):
+    """Create the directory holding the files shared by the whole session"""
+    return tmp_path_factory.mktemp("usdbuilder", numbered=False)
+
+
+@pytest.fixture(scope="session")
+def shared_test_image(usd_test_root):
+    """Write the test image once per session"""
+    image_path = usd_test_root / "test_image.jpg"
+    create_test_image(image_path)
+    return image_path
+
+
+@pytest.fixture(scope="session")
+def pointcloud_path(usd_test_root):
+    """Write the test point cloud once per session, only for tests that use it"""
+    path = usd_test_root / "test_pointcloud.ply"
+    create_test_pointcloud(path)
+    return path
+
+
+@pytest.fixture(scope="session")
+def shared_builder(usd_test_root):
+    """Create one USD builder for the tests that only drive the pxr calls"""
+    return UsdSceneBuilder(
+        image_dir=str(usd_test_root),
+        output_file=str(usd_test_root / "test_scene.usda")
+    )
+
+
+@pytest.fixture
+def image_dir(tmp_path, shared_test_image):
+    """Create a per-test image directory holding a link to the session test image"""
+    # Most file tests add or remove images, so each gets its own directory;
+    # hardlink the session test image instead of writing a new one
+    path = tmp_path / "images"
+    path.mkdir()
+    os.link(shared_test_image, path / "test_image.jpg")
+    return path
+
+
+@pytest.fixture
+def usd_output_path(tmp_path):
+    """Return the per-test USD output path; the builder creates its directory"""
+    return tmp_path / "output" / "test_scene.usda"
+
+
+@pytest.fixture
+def usd_builder(image_dir, usd_output_path):
+    """Create a USD builder without a point cloud"""
+    return UsdSceneBuilder(image_dir=str(image_dir), output_file=str(usd_output_path))
+
+
+@pytest.fixture
+def pointcloud_builder(image_dir, usd_output_path, pointcloud_path):
+    """Create a USD builder that references the shared point cloud"""
+    return UsdSceneBuilder(
+        image_dir=str(image_dir),
+        output_file=str(usd_output_path),
+        point_cloud=str(pointcloud_path)
+    )
+
+
+class PxrScaffold:
+    """Mocked pxr constructors wired to fixed results, built once and reset per test"""
+    
+    def __init__(self, pxr):
+        """
+        Wire the constructors UsdSceneBuilder calls on the mocked pxr package
+        
+        Args:
+            pxr: The mocked pxr package
+        """
+        self.pxr = pxr
+        
+        # Stage and the World root prim
+        self.stage = Mock()
+        self.world_prim = Mock()
+        pxr.Usd.Stage.CreateNew = Mock(return_value=self.stage)
+        pxr.UsdGeom.Xform.Define = Mock(return_value=Mock(**{'GetPrim.return_value': self.world_prim}))
+        
+        # Plane mesh, its UV primvar and the Vt arrays for its attributes
+        self.mesh = Mock()
+        self.texcoords_attr = Mock()
+        self.primvars_api = Mock(**{'CreatePrimvar.return_value': self.texcoords_attr})
+        pxr.UsdGeom.Mesh.Define = Mock(return_value=self.mesh)
+        pxr.UsdGeom.PrimvarsAPI = Mock(return_value=self.primvars_api)
+        pxr.Vt.Vec3fArray = Mock(return_value="MockVec3fArray")
+        pxr.Vt.Vec2fArray = Mock(return_value="MockVec2fArray")
+        pxr.Vt.IntArray = Mock(return_value="MockIntArray")
+        
+        # Material with its surface shader and texture sampler
+        self.surface_output = Mock()
+        self.material = Mock(**{'CreateSurfaceOutput.return_value': self.surface_output})
+        self.shader = Mock()
+        self.texture_sampler = Mock(**{'CreateOutput.return_value': Mock()})
+        pxr.UsdShade.Material.Define = Mock(return_value=self.material)
+        pxr.UsdShade.Shader.Define = Mock()
+        
+        # Point cloud prim and its references
+        self.references = Mock()
+        self.points_prim = Mock(**{'GetReferences.return_value': self.references})
+        pxr.UsdGeom.Points.Define = Mock(return_value=Mock(**{'GetPrim.return_value': self.points_prim}))
+        
+        # Material binding
+        self.binding_api = Mock()
+        pxr.UsdShade.MaterialBindingAPI = Mock(return_value=self.binding_api)
+    
+    def reset_all(self):
+        """Clear the recorded calls while keeping the wiring"""
+        self.pxr.reset_mock()
+        for mock in (self.stage, self.mesh, self.material, self.shader, self.texture_sampler):
+            mock.reset_mock()
+        
+        # Shader.Define hands out the surface shader, then the texture sampler
+        self.pxr.UsdShade.Shader.Define.side_effect = [self.shader, self.texture_sampler]
+
+
+@pytest.fixture(scope="module")
+def _pxr_scaffold_once(pxr_mock):
+    """Build the pxr mock scaffold once per test module"""
+    return PxrScaffold(pxr_mock)
+
+
+@pytest.fixture
+def pxr_scaffold(_pxr_scaffold_once):
+    """Hand out the module-wide pxr mock scaffold with fresh call records"""
+    _pxr_scaffold_once.reset_all()
+    return _pxr_scaffold_once
+
+
+def test_initialization(usd_builder, pointcloud_builder, image_dir, usd_output_path, pointcloud_path):
+    """Test that the USD builder initializes correctly"""
+    # Check that the directories and paths are set correctly
+    assert pointcloud_builder.image_dir == image_dir
+    assert pointcloud_builder.output_file == usd_output_path
+    assert pointcloud_builder.point_cloud == pointcloud_path
+    assert usd_builder.point_cloud is None
+
+
+def test_find_latest_image(usd_builder, image_dir):
+    """Test finding the latest image in the images directory"""
+    # Create a few images with different timestamps
+    image1 = image_dir / "image1.jpg"
+    image2 = image_dir / "image2.jpg"
+    image3 = image_dir / "image3.jpg"
+    
+    # Reuse the linked test image as the first image; hardlinks share one
+    # mtime, so the later images need files of their own
+    (image_dir / "test_image.jpg").rename(image1)
+    create_test_image(image2)
+    create_test_image(image3)
+    
+    # Set modification times to different values
+    # Use different timestamps to ensure proper ordering
+    os.utime(image1, (1000000, 1000000))
+    os.utime(image2, (2000000, 2000000))
+    os.utime(image3, (3000000, 3000000))
+    
+    # Find the latest image
+    latest_image = usd_builder.find_latest_image()
+    
+    # Check that the latest image is image3
+    assert latest_image == image3
+
+
+def test_find_latest_image_from_scan_entries(usd_output_path):
+    """Test picking the newest image from the directory scan without touching the filesystem"""
+    image_dir = "/nonexistent/images"
+    entries = [
+        fake_dir_entry(image_dir, "image1.jpg", 1000),
+        fake_dir_entry(image_dir, "image3.JPG", 3000),
+        fake_dir_entry(image_dir, "image2.jpeg", 2000),
+        fake_dir_entry(image_dir, "notes.txt", 4000),
+        fake_dir_entry(image_dir, "cam1", 5000, is_dir=True)
+    ]
+    builder = UsdSceneBuilder(image_dir=image_dir, output_file=str(usd_output_path))
+    
+    with patch('src.usd_builder.os.scandir') as mock_scandir:
+        mock_scandir.return_value.__enter__.return_value = entries
+        assert builder.find_latest_image() == Path(image_dir, "image3.JPG")
+    
+    # Top-level images were found, so only the image directory was listed
+    mock_scandir.assert_called_once_with(image_dir)
+
+
+def test_find_latest_image_in_subdirectories(usd_builder, image_dir):
+    """Test falling back to nested images when the top level has none"""
+    # Move the only top-level image out of the way
+    (image_dir / "test_image.jpg").unlink()
+
+    # Create nested images with different timestamps
+    older = image_dir / "cam1" / "older.jpg"
+    newer = image_dir / "cam2" / "deep" / "newer.jpg"
+    for path in (older, newer):
+        path.parent.mkdir(parents=True)
+        create_test_image(path)
+    os.utime(older, (1000000, 1000000))
+    os.utime(newer, (2000000, 2000000))
+
+    # Non-jpg files are ignored
+    (image_dir / "cam1" / "notes.txt").write_text("not an image")
+
+    assert usd_builder.find_latest_image() == newer
+
+
+def test_find_latest_image_jpeg_spellings(usd_builder, image_dir):
+    """Test that .jpeg and upper-case extensions are picked up as frames"""
+    upper = image_dir / "upper.JPG"
+    long_ext = image_dir / "long.jpeg"
+    create_test_image(upper)
+    create_test_image(long_ext)
+    os.utime(image_dir / "test_image.jpg", (1000000, 1000000))
+    os.utime(upper, (2000000, 2000000))
+    os.utime(long_ext, (3000000, 3000000))
+    (image_dir / "notes.jpg.txt").write_text("not an image")
+    
+    assert usd_builder.find_latest_image() == long_ext
+    assert len(usd_builder._list_jpgs()) == 3
+
+
+def test_create_stage(shared_builder, pxr_scaffold):
+    """Test creating a USD stage"""
+    pxr = pxr_scaffold.pxr
+    
+    # Create the stage
+    stage = shared_builder.create_stage()
+    
+    # Check that the stage was created with the right file path
+    pxr.Usd.Stage.CreateNew.assert_called_once_with(str(shared_builder.output_file))
+    assert stage is pxr_scaffold.stage
+    
+    # Check that stage setup was done
+    pxr.UsdGeom.SetStageUpAxis.assert_called_once()
+    pxr_scaffold.stage.SetStartTimeCode.assert_called_once()
+    pxr_scaffold.stage.SetEndTimeCode.assert_called_once()
+    pxr_scaffold.stage.SetTimeCodesPerSecond.assert_called_once()
+    
+    # Check that the default prim was set
+    pxr_scaffold.stage.SetDefaultPrim.assert_called_once_with(pxr_scaffold.world_prim)
+
+
+def test_add_plane(shared_builder, pxr_scaffold):
+    """Test adding a plane geometry to the USD stage"""
+    pxr = pxr_scaffold.pxr
+    mock_mesh = pxr_scaffold.mesh
+    
+    # Add the plane
+    plane = shared_builder.add_plane(pxr_scaffold.stage)
+    
+    # Check that the mesh was created with the right path
+    pxr.UsdGeom.Mesh.Define.assert_called_once_with(pxr_scaffold.stage, '/World/plane')
+    
+    # Check that points, indices, and UVs were set
+    mock_mesh.CreatePointsAttr.assert_called_once()
+    mock_mesh.CreateFaceVertexCountsAttr.assert_called_once()
+    mock_mesh.CreateFaceVertexIndicesAttr.assert_called_once()
+    mock_mesh.CreateNormalsAttr.assert_called_once()
+    
+    # Check that primvar for UVs was created
+    pxr.UsdGeom.PrimvarsAPI.assert_called_once_with(mock_mesh)
+    pxr_scaffold.primvars_api.CreatePrimvar.assert_called_once()
+    pxr_scaffold.texcoords_attr.Set.assert_called_once()
+
+
+def test_create_material(shared_builder, pxr_scaffold):
+    """Test creating a USD Preview Surface material"""
+    pxr = pxr_scaffold.pxr
+    
+    # Create the material
+    material = shared_builder.create_material(pxr_scaffold.stage, "test_texture.jpg")
+    
+    # Check that the material was created with the right path
+    pxr.UsdShade.Material.Define.assert_called_once_with(pxr_scaffold.stage, '/World/Materials/TexturedMaterial')
+    
+    # Check that shaders were created
+    assert pxr.UsdShade.Shader.Define.call_count == 2
+    
+    # Check that shader inputs were set
+    assert pxr_scaffold.shader.CreateInput.call_count >= 2  # roughness and metallic
+    assert pxr_scaffold.texture_sampler.CreateInput.call_count >= 3  # file, wrapS, wrapT
+    
+    # Check that outputs were created and connected
+    pxr_scaffold.texture_sampler.CreateOutput.assert_called_once()
+    pxr_scaffold.material.CreateSurfaceOutput.assert_called_once()
+    pxr_scaffold.surface_output.ConnectToSource.assert_called_once()
+
+
+def test_add_point_cloud(shared_builder, pxr_scaffold, pointcloud_path):
+    """Test adding a point cloud to the USD stage"""
+    pxr = pxr_scaffold.pxr
+    
+    # Add the point cloud
+    points = shared_builder.add_point_cloud(pxr_scaffold.stage, str(pointcloud_path))
+    
+    # Check that the points were created with the right path
+    pxr.UsdGeom.Points.Define.assert_called_once_with(pxr_scaffold.stage, '/World/PointCloud')
+    
+    # Check that the reference was added
+    pxr_scaffold.points_prim.GetReferences.assert_called_once()
+    pxr_scaffold.references.AddReference.assert_called_once_with(str(pointcloud_path))
+
+
+def test_apply_material_to_mesh(shared_builder, pxr_scaffold):
+    """Test applying a material to a mesh"""
+    pxr = pxr_scaffold.pxr
+    
+    # Apply the material
+    shared_builder.apply_material_to_mesh(pxr_scaffold.material, pxr_scaffold.mesh)
+    
+    # Check that the binding API was created and used
+    pxr.UsdShade.MaterialBindingAPI.assert_called_once_with(pxr_scaffold.mesh)
+    pxr_scaffold.binding_api.Bind.assert_called_once_with(pxr_scaffold.material)
+
+
+@pytest.fixture
+def mock_builder_methods(image_dir):
+    """Patch every scene-building step of UsdSceneBuilder, returning the mocks by name"""
+    # One patcher covers all the steps instead of one per method
+    with patch.multiple(UsdSceneBuilder, **dict.fromkeys(_BUILD_STEPS, DEFAULT)) as patched:
+        mocks = SimpleNamespace(**patched)
+        
+        # Mock dependencies shared by every build
+        mocks.stage = Mock()
+        mocks.create_stage.return_value = mocks.stage
+        mocks.latest_image = image_dir / "latest.jpg"
+        mocks.find_latest_image.return_value = mocks.latest_image
+        yield mocks
+
+
+@pytest.mark.parametrize("use_point_cloud", [True, False])
+def test_build_scene(mock_builder_methods, use_point_cloud, request):
+    """Test building a scene with a point cloud, or a plane when there is none"""
+    mocks = mock_builder_methods
+    
+    if use_point_cloud:
+        builder = request.getfixturevalue("pointcloud_builder")
+        pointcloud_path = request.getfixturevalue("pointcloud_path")
+    else:
+        # The default builder has no point cloud
+        builder = request.getfixturevalue("usd_builder")
+        assert builder.point_cloud is None
+    
+    # Build the scene
+    result = builder.build_scene()
+    
+    # Check the result
+    assert result is True
+    
+    # Check that the methods were called in the right order
+    mocks.find_latest_image.assert_called_once()
+    mocks.create_stage.assert_called_once()
+    
+    if use_point_cloud:
+        mocks.add_point_cloud.assert_called_once_with(mocks.stage, str(pointcloud_path))
         
         # When using a point cloud, we don't expect to create a plane or material
-        mock_add_plane.assert_not_called()
-        mock_create_material.assert_not_called()
-        mock_apply_material.assert_not_called()
-        
-        # Check that the stage was saved
-        mock_stage.Save.assert_called_once()
-    
-    @patch('src.usd_builder.UsdSceneBuilder.find_latest_image')
-    @patch('src.usd_builder.UsdSceneBuilder.create_stage')
-    @patch('src.usd_builder.UsdSceneBuilder.add_point_cloud')
-    @patch('src.usd_builder.UsdSceneBuilder.add_plane')
-    @patch('src.usd_builder.UsdSceneBuilder.create_material')
-    @patch('src.usd_builder.UsdSceneBuilder.apply_material_to_mesh')
-    def test_build_scene_with_plane_fallback(
-        self, mock_apply_material, mock_create_material, mock_add_plane,
-        mock_add_point_cloud, mock_create_stage, mock_find_latest_image
-    ):
-        """Test building a scene with a plane (no point cloud)"""
-        # Mock dependencies
-        mock_stage = MagicMock()
-        mock_create_stage.return_value = mock_stage
-        mock_latest_image = self.image_dir / "latest.jpg"
-        mock_find_latest_image.return_value = mock_latest_image
-        
-        # Set up point cloud to be None
-        self.usd_builder.point_cloud = None
-        
-        # Mock plane and material
-        mock_plane = MagicMock()
-        mock_add_plane.return_value = mock_plane
-        mock_material = MagicMock()
-        mock_create_material.return_value = mock_material
-        
-        # Build the scene
-        result = self.usd_builder.build_scene()
-        
-        # Check the result
-        assert result is True
-        
-        # Check that the methods were called in the right order
-        mock_find_latest_image.assert_called_once()
-        mock_create_stage.assert_called_once()
-        mock_add_plane.assert_called_once_with(mock_stage)
-        mock_create_material.assert_called_once_with(mock_stage, str(mock_latest_image))
-        mock_apply_material.assert_called_once_with(mock_material, mock_plane)
+        mocks.add_plane.assert_not_called()
+        mocks.create_material.assert_not_called()
+        mocks.apply_material_to_mesh.assert_not_called()
+    else:
+        mocks.add_plane.assert_called_once_with(mocks.stage)
+        mocks.create_material.assert_called_once_with(mocks.stage, str(mocks.latest_image))
+        mocks.apply_material_to_mesh.assert_called_once_with(
+            mocks.create_material.return_value, mocks.add_plane.return_value
+        )
         
         # When not using a point cloud, we don't expect to add one
-        mock_add_point_cloud.assert_not_called()
-        
-        # Check that the stage was saved
-        mock_stage.Save.assert_called_once()
+        mocks.add_point_cloud.assert_not_called()
+    
+    # Check that the stage was saved
+    mocks.stage.Save.assert_called_once()
+
+
+@patch('src.usd_builder.HAS_USD', False)
+def test_build_scene_placeholder(usd_builder, image_dir, usd_output_path, shared_test_image):
+    """Test writing the placeholder USD file when pxr is not available"""
+    # Add a second frame next to the one linked by the image_dir fixture
+    os.link(shared_test_image, image_dir / "test_image2.jpg")
+
+    # Build the scene
+    assert usd_builder.build_scene() is True
+
+    # Check that every frame got a binding and a textured material
+    content = usd_output_path.read_text()
+    assert content.startswith("#usda 1.0\n")
+    assert "endTimeCode = 1\n" in content
+    assert "                1: </World/Materials/FrameMaterial_1>,\n" in content
+    assert 'def Material "FrameMaterial_0"' in content
+    assert 'def Material "FrameMaterial_1"' in content
+    assert "@../images/test_image.jpg@" in content
+    assert "@../images/test_image2.jpg@" in content
+    assert "FrameMaterial_2" not in content
+    assert content.endswith("}\n")
+
+
+@patch('src.usd_builder.HAS_USD', False)
+def test_build_scene_placeholder_usdc_output(image_dir, usd_output_path):
+    """Test that a .usdc request without pxr writes the text placeholder as .usda"""
+    usdc_path = usd_output_path.with_suffix('.usdc')
+    builder = UsdSceneBuilder(image_dir=str(image_dir), output_file=str(usdc_path))
+    
+    assert builder.build_scene() is True
+    
+    assert not usdc_path.exists()
+    assert usdc_path.with_suffix('.usda').read_text().startswith("#usda 1.0\n")
+
+
+@patch('src.usd_builder.HAS_USD', False)
+def test_build_scene_scans_images_once(usd_builder):
+    """Test that the placeholder branch reuses the latest-image directory scan"""
+    with patch('src.usd_builder.os.scandir', wraps=os.scandir) as mock_scandir:
+        assert usd_builder.build_scene() is True
+
+    # A single top-level scan found the image, so no recursive fallback ran
+    assert mock_scandir.call_count == 1
+
+
+def test_find_latest_image_scans_each_directory_once(usd_builder, image_dir, shared_test_image):
+    """Test that the nested fallback does not list the top directory again"""
+    (image_dir / "test_image.jpg").unlink()
+    nested = image_dir / "cam1" / "frame.jpg"
+    nested.parent.mkdir()
+    os.link(shared_test_image, nested)
+
+    with patch('src.usd_builder.os.scandir', wraps=os.scandir) as mock_scandir:
+        assert usd_builder.find_latest_image() == nested
+
+    # One scan for the image directory and one for its subdirectory
+    assert mock_scandir.call_count == 2
+
+
+@patch('src.usd_builder.HAS_USD', False)
+def test_build_scene_with_preloaded_entries(image_dir, usd_output_path):
+    """Test that preloaded image entries skip the directory scan entirely"""
+    with os.scandir(image_dir) as it:
+        entries = [entry for entry in it if entry.name.endswith('.jpg')]
+    builder = UsdSceneBuilder(
+        image_dir=str(image_dir),
+        output_file=str(usd_output_path),
+        image_entries=entries
+    )
+
+    with patch('src.usd_builder.os.scandir') as mock_scandir:
+        assert builder.build_scene() is True
+
+    mock_scandir.assert_not_called()
+    assert "@../images/test_image.jpg@" in usd_output_path.read_text()
+
+
+def test_render_frames_matches_format():
+    """Test that both frame emitters produce the same text as str.format"""
+    import src.usd_builder as usd_builder_module
+    
+    rel_paths = [f"../images/frame_{i:03d}.jpg" for i in range(12)]
+    expected = "".join(
+        usd_builder_module._MATERIAL_TEMPLATE.format(i=i, rel_path=p)
+        for i, p in enumerate(rel_paths)
+    ).encode('utf-8')
+    
+    # Literal-splitting path used for short sequences or without numba
+    with patch('src.usd_builder.NUMBA_MIN_FRAMES', len(rel_paths) + 1):
+        result = usd_builder_module._render_frames(
+            usd_builder_module._MATERIAL_TEMPLATE, len(rel_paths), rel_paths
+        )
+    assert result == expected
+    
+    if not usd_builder_module.HAS_NUMBA:
+        pytest.skip("numba not installed")
+    
+    # Numba emitter
+    with patch('src.usd_builder.NUMBA_MIN_FRAMES', 0):
+        result = usd_builder_module._render_frames(
+            usd_builder_module._MATERIAL_TEMPLATE, len(rel_paths), rel_paths
+        )
+    assert result == expected
+
+
+@pytest.fixture(scope="session")
+def integration_config_text():
+    """Serialize the integration test configuration once per session"""
+    # Paths are relative to the test directory; every consumer of the config is mocked
+    config = {
+        'cameras': [
+            {
+                'name': 'TestCamera',
+                'host': '192.168.1.100',
+                'onvif_port': 80,
+                'username': 'admin',
+                'password': 'password',
+                'rtsp_url': 'rtsp://192.168.1.100:554/live/main'
+            }
+        ],
+        'settings': {
+            'capture': {
+                'frame_interval': 1,
+                'total_frames': 5,
+                'output_dir': 'images'
+            },
+            'photogrammetry': {
+                'enabled': True,
+                'colmap_path': '/usr/bin/colmap',
+                'output_dir': 'colmap'
+            },
+            'usd': {
+                'scene_name': 'test_scene',
+                'output_path': 'output/test_scene.usda'
+            }
+        }
+    }
+    
+    # Use libyaml's C emitter when PyYAML was built with it
+    import yaml
+    return yaml.dump(config, Dumper=getattr(yaml, 'CSafeDumper', yaml.SafeDumper))
+
+
+def create_integration_images(image_dir):
+    """Create test images for photogrammetry"""
+    for i in range(_NUM_TEST_IMAGES):
+        (image_dir / f"image_{i:06d}.jpg").write_bytes(_JPEG_BYTES)
+
+
+def create_colmap_output(colmap_dir):
+    """Create a dummy COLMAP output structure"""
+    # Create dense directory
+    dense_dir = colmap_dir / "dense"
+    dense_dir.mkdir(parents=True, exist_ok=True)
+    
+    # Create a dummy point cloud
+    (dense_dir / "fused.ply").write_text(_PLY_TEXT)
+
+
+@pytest.fixture(scope="session")
+def integration_root(tmp_path_factory, integration_config_text):
+    """Lay out the integration test directories and inputs once per session"""
+    root = tmp_path_factory.mktemp("integration", numbered=False)
+    for name in _INTEGRATION_LAYOUT:
+        (root / name).mkdir()
+    
+    # The pipeline components are mocked, so these inputs are only ever read
+    (root / "config" / "test_config.yaml").write_text(integration_config_text)
+    create_integration_images(root / "images")
+    create_colmap_output(root / "colmap")
+    return root
 
 
 # Create a test for the integration points between modules
-class TestIntegration(unittest.TestCase):
+class TestIntegration:
     """Test the integration points between the different modules"""
     
-    def setUp(self):
+    @pytest.fixture(autouse=True)
+    def _setup(self, integration_root, request):
         """Set up test environment before each test"""
-        # Create temporary directories for testing
-        self.test_dir = Path(tempfile.mkdtemp())
+        # Shared read-only inputs from the session layout
+        self.test_dir = integration_root
         self.config_dir = self.test_dir / "config"
         self.image_dir = self.test_dir / "images"
-        self.colmap_dir = self.test_dir / "colmap_out"
-        self.output_dir = self.test_dir / "output"
-        
-        # Create the directories
-        self.config_dir.mkdir(parents=True, exist_ok=True)
-        self.image_dir.mkdir(parents=True, exist_ok=True)
-        self.colmap_dir.mkdir(parents=True, exist_ok=True)
-        self.output_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Path for output USD file
-        self.usd_output_path = self.output_dir / "test_scene.usda"
-        
-        # Create a test config file
+        self.colmap_dir = self.test_dir / "colmap"
         self.config_file = self.config_dir / "test_config.yaml"
-        self.create_test_config(self.config_file)
-        
-        # Create test images
-        self.create_test_images()
-        
-        # Create a dummy colmap output
-        self.create_colmap_output()
-    
-    def tearDown(self):
-        """Clean up after each test"""
-        # Remove temporary directory
-        shutil.rmtree(self.test_dir, ignore_errors=True)
-    
-    def create_test_config(self, path):
-        """Create a test configuration file"""
-        config = {
-            'cameras': [
-                {
-                    'name': 'TestCamera',
-                    'host': '192.168.1.100',
-                    'onvif_port': 80,
-                    'username': 'admin',
-                    'password': 'password',
-                    'rtsp_url': 'rtsp://192.168.1.100:554/live/main'
-                }
-            ],
-            'settings': {
-                'capture': {
-                    'frame_interval': 1,
-                    'total_frames': 5,
-                    'output_dir': str(self.image_dir)
-                },
-                'photogrammetry': {
-                    'enabled': True,
-                    'colmap_path': '/usr/bin/colmap',
-                    'output_dir': str(self.colmap_dir)
-                },
-                'usd': {
-                    'scene_name': 'test_scene',
-                    'output_path': str(self.output_dir / "test_scene.usda")
-                }
-            }
-        }
         
-        import yaml
-        with open(path, 'w') as f:
-            yaml.dump(config, f)
-    
-    def create_test_images(self):
-        """Create test images for photogrammetry"""
-        for i in range(5):
-            image_path = self.image_dir / f"image_{i:06d}.jpg"
-            try:
-                import cv2
-                img = np.zeros((100, 100, 3), dtype=np.uint8)
-                # Add some variation to the images
-                cv2.putText(
-                    img, f"Frame {i}", (10, 50), 
-                    cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2
-                )
-                cv2.imwrite(str(image_path), img)
-            except ImportError:
-                # If cv2 is not available, create empty files
-                with open(image_path, 'wb') as f:
-                    f.write(b'\x00' * 100)
-    
-    def create_colmap_output(self):
-        """Create a dummy COLMAP output structure"""
-        # Create dense directory
-        dense_dir = self.colmap_dir / "dense"
-        dense_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Create a dummy point cloud
-        ply_path = dense_dir / "fused.ply"
-        with open(ply_path, 'w') as f:
-            f.write("""ply
-format ascii 1.0
-element vertex 3
-property float x
-property float y
-property float z
-end_header
-0.0 0.0 0.0
-1.0 0.0 0.0
-0.0 1.0 0.0
-""")
+        # Anything a test writes goes under its own output subdirectory
+        self.output_dir = self.test_dir / "output" / request.node.name
+        self.usd_output_path = self.output_dir / "test_scene.usda"
     
-    @patch('src.capture.CameraCapture')
-    @patch('src.photogrammetry.ColmapWrapper')
-    @patch('src.usd_builder.UsdSceneBuilder')
+    @patch('src.main.CameraCapture')
+    @patch('src.main.ColmapWrapper')
+    @patch('src.main.UsdSceneBuilder')
     def test_full_pipeline_integration(self, mock_usd_builder_class, mock_colmap_class, mock_capture_class):
         """Test the full pipeline integration with mocked components"""
-        # Import the main module here to avoid circular imports during testing
-        from src import main
-        
         # Mock the command line arguments
         test_args = [
             'main.py',
@@ -527,6 +675,3 @@ end_header
             # In main.py, UsdSceneBuilder is called with (args.image_dir, args.output)
             mock_usd_builder_class.assert_called_once_with(str(self.image_dir), str(self.usd_output_path))
             mock_usd_builder.build_scene.assert_called_once()
-
-if __name__ == '__main__':
-    pytest.main(['-xvs', __file__])
\ No newline at end of file